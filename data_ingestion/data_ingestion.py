@@ -1,87 +1,297 @@
 import os
+import json
+import time
+import shutil
+import hashlib
 import logging
-from datasets import load_dataset
-from huggingface_hub import login
-from dotenv import load_dotenv
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
 
-# Load environment variables
-load_dotenv()
+from embedding.arrow_dataset import dataset_files, iter_record_batches
+from embedding.manifest import replace_directory
 
-# Disable symlinks warning
-os.environ['HF_HUB_DISABLE_SYMLINKS_WARNING'] = '1'
-
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def download_datasets():
+# Written next to the Arrow files of every prepared dataset
+PREPARED_FILE = "prepared.json"
+PREPARED_VERSION = 1
+
+# Default cap on preparation threads and processes
+MAX_PREPARE_WORKERS = 4
+
+# `datasets` builders for local files, by extension
+LOCAL_BUILDERS = {
+    ".txt": "text",
+    ".csv": "csv",
+    ".json": "json",
+    ".jsonl": "json",
+    ".parquet": "parquet",
+    ".arrow": "arrow",
+}
+
+
+@dataclass
+class DatasetSource:
+    """Where a dataset comes from: a Hugging Face Hub dataset, or a local file or directory.
+
+    A `path` that exists on disk is local. That is either a directory saved
+    with `save_to_disk`, copied as is, or data files (one file, or every
+    file with a supported extension in a directory) read with the matching
+    packaged builder. Plain text files become one row per file. `split` may
+    slice (e.g. "train[:1000]"). `revision` pins a Hub dataset to a commit.
+    """
+    path: str
+    split: str = "train"
+    name: Optional[str] = None
+    revision: Optional[str] = None
+    options: dict = field(default_factory=dict)
+
+    @property
+    def is_local(self) -> bool:
+        return os.path.exists(self.path)
+
+
+DATASETS = {
+    # A small subset of SQuAD
+    "question_answer": DatasetSource("squad", split="train[:1000]"),
+    "text_corpus": DatasetSource("tiny_shakespeare", split="train", options={"trust_remote_code": True}),
+}
+
+
+def default_data_dir() -> str:
+    return os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
+
+
+def load_sources(value: Optional[str] = None) -> Dict[str, DatasetSource]:
+    """`DATASETS` with local overrides such as `{"text_corpus": "/data/input.txt"}` (default: DATASET_SOURCES)"""
+    value = value if value is not None else os.getenv('DATASET_SOURCES', '')
+    overrides = json.loads(value) if value.strip() else {}
+    if not isinstance(overrides, dict) or not all(isinstance(path, str) for path in overrides.values()):
+        raise ValueError("DATASET_SOURCES must map dataset names to local paths")
+    return {**DATASETS, **{name: local_source(name, path) for name, path in overrides.items()}}
+
+
+def local_source(name: str, path: str) -> DatasetSource:
+    """A local file or directory standing in for dataset `name`, keeping its split"""
+    return DatasetSource(os.path.abspath(path), split=DATASETS[name].split if name in DATASETS else "train")
+
+
+def _local_files(path: str) -> List[str]:
+    """The files behind a local source, in a stable order"""
+    if os.path.isfile(path):
+        return [path]
+    return sorted(
+        os.path.join(root, filename)
+        for root, _, filenames in os.walk(path)
+        for filename in filenames
+        if filename != PREPARED_FILE
+    )
+
+
+def source_fingerprint(source: DatasetSource) -> str:
+    """A hash of the source's settings and, for a local source, the size and mtime of its files.
+
+    Hub sources are fingerprinted by their settings only, so checking one
+    needs no network; pin `revision` to pick up a new version of it.
+    """
+    state = {"version": PREPARED_VERSION, "source": asdict(source)}
+    if source.is_local:
+        state["files"] = []
+        for path in _local_files(source.path):
+            stat = os.stat(path)
+            state["files"].append([os.path.relpath(path, source.path), stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(state, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def verify_dataset(dataset_path: str) -> dict:
+    """Check a saved dataset from its Arrow metadata, without reading any rows.
+
+    Counts rows from the record batch headers of its memory-mapped Arrow files
+    and compares them and the columns with what preparation recorded.
+    Raises FileNotFoundError if it is missing and ValueError if it does not
+    match. Returns {"rows", "columns", "bytes"}.
+    """
+    rows, columns = 0, None
+    for batch in iter_record_batches(dataset_path):
+        rows += batch.num_rows
+        columns = columns or batch.schema.names
+    if columns is None:
+        # An empty dataset has no data files; its columns are in dataset_info.json
+        with open(os.path.join(dataset_path, "dataset_info.json"), encoding='utf-8') as f:
+            columns = list(json.load(f).get("features", {}))
+    info = {"rows": rows, "columns": list(columns), "bytes": sum(os.path.getsize(path) for path in dataset_files(dataset_path))}
+    prepared_path = os.path.join(dataset_path, PREPARED_FILE)
+    if os.path.exists(prepared_path):
+        with open(prepared_path, encoding='utf-8') as f:
+            prepared = json.load(f)
+        if (prepared["rows"], prepared["columns"]) != (info["rows"], info["columns"]):
+            raise ValueError(
+                f"Dataset at {dataset_path} has {info['rows']} rows and columns {info['columns']}, "
+                f"but {prepared['rows']} rows and columns {prepared['columns']} were prepared"
+            )
+    return info
+
+
+def current_dataset(dataset_path: str, fingerprint: str) -> Optional[dict]:
+    """`verify_dataset` of the dataset at `dataset_path` if it was prepared from a source with `fingerprint`, else None"""
     try:
-        # Login to Hugging Face using environment variable
-        huggingface_token = os.getenv('HuggingAccessToken')
-        if not huggingface_token:
-            raise ValueError("HuggingAccessToken not found in environment variables")
-        
+        with open(os.path.join(dataset_path, PREPARED_FILE), encoding='utf-8') as f:
+            if json.load(f).get("fingerprint") != fingerprint:
+                return None
+        return verify_dataset(dataset_path)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Preparing {dataset_path} again: {e}")
+        return None
+
+
+def _is_saved_dataset(path: str) -> bool:
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, "state.json"))
+
+
+def load_source(source: DatasetSource):
+    """Load a Hub dataset or local data files as a `datasets.Dataset`"""
+    from datasets import load_dataset
+
+    if not source.is_local:
+        return load_dataset(source.path, source.name, split=source.split, revision=source.revision, **source.options)
+    files = _local_files(source.path)
+    builders = {LOCAL_BUILDERS.get(os.path.splitext(path)[1].lower()) for path in files}
+    if len(builders) != 1 or None in builders:
+        raise ValueError(f"{source.path} must hold files of one supported type {sorted(LOCAL_BUILDERS)}")
+    builder = builders.pop()
+    options = {"sample_by": "document", **source.options} if builder == "text" else source.options
+    return load_dataset(builder, data_files=files, split=source.split, **options)
+
+
+def prepare_dataset(name: str, source: DatasetSource, data_dir: str, fingerprint: str) -> dict:
+    """Load a source and save it to `<data_dir>/<name>`, replacing the previous version only once complete"""
+    started = time.perf_counter()
+    dataset_path = os.path.join(data_dir, name)
+    tmp_path = os.path.join(data_dir, f".{name}.tmp")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    logger.info(f"Preparing {name} from {source.path}...")
+    if source.is_local and _is_saved_dataset(source.path):
+        # Already in the target format: copy the files rather than decode and rewrite them
+        shutil.copytree(source.path, tmp_path, ignore=shutil.ignore_patterns(PREPARED_FILE))
+    else:
+        load_source(source).save_to_disk(tmp_path)
+    info = verify_dataset(tmp_path)
+    with open(os.path.join(tmp_path, PREPARED_FILE), "w", encoding='utf-8') as f:
+        json.dump({
+            "fingerprint": fingerprint,
+            "source": asdict(source),
+            "rows": info["rows"],
+            "columns": info["columns"],
+            "prepared_at": int(time.time()),
+        }, f, indent=2)
+    replace_directory(tmp_path, dataset_path)
+    return {**info, "prepared": True, "seconds": round(time.perf_counter() - started, 3)}
+
+
+def prepare_datasets(
+    data_dir: Optional[str] = None,
+    sources: Optional[Dict[str, DatasetSource]] = None,
+    force: bool = False,
+    workers: Optional[int] = None,
+) -> Dict[str, dict]:
+    """Bring every dataset in `data_dir` up to date with its source.
+
+    A dataset whose stored fingerprint matches its source and whose Arrow
+    files pass `verify_dataset` is skipped unless `force` is set. The others
+    are prepared. Fingerprinting and verification run concurrently on
+    `workers` threads (default PREPARE_WORKERS, or one per dataset up to
+    `MAX_PREPARE_WORKERS`). Stale datasets are prepared concurrently by up to
+    `workers` spawned processes, since `datasets` keeps global progress-bar
+    and cache-lock state that is not safe to share between threads.
+    `data_dir` defaults to data/ragData and
+    `sources` to `load_sources()`. Returns a report per dataset: its rows,
+    columns and bytes, whether it was prepared, and how long that took.
+    """
+    data_dir = data_dir or default_data_dir()
+    sources = sources if sources is not None else load_sources()
+    os.makedirs(data_dir, exist_ok=True)
+    workers = workers or int(os.getenv('PREPARE_WORKERS', '0')) or min(len(sources), MAX_PREPARE_WORKERS) or 1
+
+    def check(name: str) -> Tuple[str, Optional[dict]]:
+        fingerprint = source_fingerprint(sources[name])
+        return fingerprint, None if force else current_dataset(os.path.join(data_dir, name), fingerprint)
+
+    reports, stale = {}, []
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prepare") as executor:
+        checks = dict(zip(sources, executor.map(check, sources)))
+    for name, (_, info) in checks.items():
+        if info is None:
+            stale.append(name)
+        else:
+            reports[name] = {**info, "prepared": False, "seconds": 0.0}
+            logger.info(f"{name} is up to date ({info['rows']} rows), skipping")
+    if not stale:
+        return reports
+
+    huggingface_token = os.getenv('HuggingAccessToken')
+    if huggingface_token and any(not sources[name].is_local for name in stale):
+        from huggingface_hub import login
+
+        # Stores the token where the worker processes read it
         login(token=huggingface_token)
         logger.info("Successfully logged in to Hugging Face")
-        
-        # Create data directory
-        data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
-        os.makedirs(data_dir, exist_ok=True)
-        
-        logger.info(f"Downloading datasets to: {data_dir}")
-        
-        # Load and save question-answer dataset (smaller subset of SQuAD)
-        logger.info("Downloading question-answer dataset...")
-        question_answer_dataset = load_dataset("squad", split="train[:1000]")  # Only 1000 examples
-        
-        # Load and save text corpus dataset (smaller dataset)
-        logger.info("Downloading text corpus dataset...")
-        text_corpus_dataset = load_dataset(
-            "tiny_shakespeare",  
-            split="train",
-            trust_remote_code=True  # Added this parameter
-        )
-        
-        # Save datasets
-        logger.info("Saving question-answer dataset...")
-        question_answer_dataset.save_to_disk(os.path.join(data_dir, 'question_answer'))
-        
-        logger.info("Saving text corpus dataset...")
-        text_corpus_dataset.save_to_disk(os.path.join(data_dir, 'text_corpus'))
-        
-        # Verify the saves
-        logger.info("Verifying saved datasets...")
-        verify_datasets(data_dir)
-        
-        logger.info("Dataset download and save completed successfully!")
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(stale)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {name: pool.submit(prepare_dataset, name, sources[name], data_dir, checks[name][0]) for name in stale}
+        for name, future in futures.items():
+            reports[name] = future.result()
+            logger.info(f"Prepared {name}: {reports[name]['rows']} rows in {reports[name]['seconds']}s")
+    return {name: reports[name] for name in sources}
+
+
+def download_datasets() -> bool:
+    """Prepare the datasets in data/ragData; False (with the error logged) if that fails"""
+    try:
+        prepare_datasets()
+        logger.info("Dataset preparation completed successfully!")
         return True
-        
     except Exception as e:
-        logger.error(f"Error downloading datasets: {str(e)}")
+        logger.error(f"Error preparing datasets: {str(e)}")
         return False
 
-def verify_datasets(data_dir):
-    """Verify that datasets were saved correctly"""
-    from datasets import load_from_disk
-    
-    # Verify question-answer dataset
-    qa_path = os.path.join(data_dir, 'question_answer')
-    qa_dataset = load_from_disk(qa_path)
-    logger.info(f"Question-Answer dataset loaded successfully.")
-    logger.info(f"Number of examples: {len(qa_dataset)}")
-    
-    # Show sample data
-    logger.info("\nSample from question-answer dataset:")
-    logger.info(qa_dataset[0])
-    
-    # Verify text corpus dataset
-    text_path = os.path.join(data_dir, 'text_corpus')
-    text_dataset = load_from_disk(text_path)
-    logger.info(f"Text corpus dataset loaded successfully.")
-    logger.info(f"Number of documents: {len(text_dataset)}")
-    
-    logger.info("\nSample from text corpus dataset:")
-    logger.info(text_dataset[0])
+
+def verify_datasets(data_dir: str, names: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Verify saved datasets (default: all of `DATASETS`) from their Arrow metadata and log their sizes"""
+    reports = {}
+    for name in names or list(DATASETS):
+        reports[name] = verify_dataset(os.path.join(data_dir, name))
+        logger.info(f"{name}: {reports[name]['rows']} rows, columns {reports[name]['columns']}")
+    return reports
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    os.environ.setdefault('HF_HUB_DISABLE_SYMLINKS_WARNING', '1')
+
+    parser = argparse.ArgumentParser(description="Download or load the datasets into data/ragData, skipping unchanged ones")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--source", action="append", default=[], metavar="NAME=PATH", help="prepare NAME from a local file or directory")
+    parser.add_argument("--force", action="store_true", help="prepare every dataset even if it is up to date")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sources = load_sources()
+    for override in args.source:
+        name, _, path = override.partition("=")
+        if not path:
+            parser.error(f"--source expects NAME=PATH, got '{override}'")
+        sources[name] = local_source(name, path)
+    reports = prepare_datasets(args.data_dir, sources, force=args.force, workers=args.workers)
+    print(json.dumps(reports, indent=2))
+
 
 if __name__ == "__main__":
-    download_datasets()
\ No newline at end of file
+    main()
@@ -0,0 +1,53 @@
+import os
+import glob
+import json
+import logging
+from typing import Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+
+def dataset_files(dataset_path: str) -> List[str]:
+    """The Arrow files of a dataset written by `save_to_disk`, in order (none for an empty dataset)"""
+    state_path = os.path.join(dataset_path, "state.json")
+    if os.path.exists(state_path):
+        with open(state_path, encoding='utf-8') as f:
+            names = [entry["filename"] for entry in json.load(f)["_data_files"]]
+        return [os.path.join(dataset_path, name) for name in names]
+    files = sorted(glob.glob(os.path.join(dataset_path, "data-*.arrow")))
+    if not files:
+        raise FileNotFoundError(f"No saved dataset at {dataset_path}")
+    return files
+
+
+def iter_record_batches(dataset_path: str, columns: Optional[Sequence[str]] = None) -> Iterator["pa.RecordBatch"]:
+    """Record batches of a saved dataset, read straight from its memory-mapped Arrow files.
+
+    Batches reference the mapped pages, so reading costs no copies or Python
+    objects until a column is converted. Only `columns` are kept when given.
+    """
+    import pyarrow as pa
+
+    for path in dataset_files(dataset_path):
+        reader = pa.ipc.open_stream(pa.memory_map(path))
+        for batch in reader:
+            yield batch.select(columns) if columns is not None else batch
+
+
+def read_table(dataset_path: str, columns: Optional[Sequence[str]] = None) -> "pa.Table":
+    """All of a saved dataset as one zero-copy table over its memory-mapped files"""
+    import pyarrow as pa
+
+    batches = list(iter_record_batches(dataset_path, columns))
+    if batches:
+        return pa.Table.from_batches(batches)
+    # An empty dataset is saved without data files; its column types are not needed to read no rows
+    return pa.table({column: pa.array([]) for column in columns or []})
+
+
+def first_occurrences(table: "pa.Table", column: str) -> "pa.Table":
+    """The rows of `table` holding the first occurrence of each non-null value of `column`, in table order"""
+    import pyarrow.compute as pc
+
+    values = table.column(column)
+    return table.take(pc.index_in(pc.drop_null(pc.unique(values)), value_set=values))
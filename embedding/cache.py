@@ -0,0 +1,288 @@
+import os
+import re
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding.embedders import Embedder, create_embedder
+from observability.metrics import REGISTRY, Counter
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Canonical form used for cache keys; whitespace differences never change the model's tokens"""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+
+def cache_key(model_name: str, text: str) -> bytes:
+    return hashlib.blake2b(f"{model_name}\0{normalize_text(text)}".encode('utf-8'), digest_size=16).digest()
+
+
+class EmbeddingCache:
+    """Content-addressed embedding store with an in-memory LRU tier and a memory-mapped disk tier.
+
+    The disk tier is a fixed-capacity matrix of `dtype` rows in `<name>.vectors`,
+    with a small SQLite index mapping keys to rows and tracking recency. When
+    it is full, the least recently used rows are overwritten.
+
+    Several processes may share a cache directory. Every disk-tier read or
+    write runs inside one `BEGIN IMMEDIATE` SQLite transaction, so slot
+    allocation, the row write and the index update happen under the
+    database's write lock and no two writers can claim the same row.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        name: str,
+        dimension: int,
+        max_memory_items: int = 10000,
+        max_disk_items: int = 200000,
+        dtype: str = "float16",
+    ):
+        if dtype not in ("float16", "float32"):
+            raise ValueError(f"dtype must be float16 or float32, got {dtype}")
+        os.makedirs(cache_dir, exist_ok=True)
+        self.dimension = dimension
+        self.max_memory_items = max_memory_items
+        self.max_disk_items = max_disk_items
+        self.dtype = np.dtype(dtype)
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._metrics = [
+            REGISTRY.register(Counter(
+                "rag_embedding_cache_events_total", "Embedding cache lookups by tier, and evictions",
+                {"event": stat}, fn=lambda stat=stat: self.stats[stat],
+            ))
+            for stat in self.stats
+        ]
+
+        self._lock = threading.Lock()
+        self._memory: "OrderedDict[bytes, np.ndarray]" = OrderedDict()
+
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+        base = os.path.join(cache_dir, f"{slug}_{dimension}_{dtype}")
+        vectors_path = base + ".vectors"
+        expected_size = max_disk_items * dimension * self.dtype.itemsize
+        # Transactions are explicit (see `_transaction`), so autocommit mode
+        self._db = sqlite3.connect(base + ".sqlite", timeout=30, isolation_level=None, check_same_thread=False)
+        with self._transaction():
+            # A capacity change invalidates the slot layout, so start over
+            fresh = not os.path.exists(vectors_path) or os.path.getsize(vectors_path) != expected_size
+            self._vectors = np.memmap(vectors_path, dtype=self.dtype, mode="w+" if fresh else "r+", shape=(max_disk_items, dimension))
+            if fresh:
+                self._db.execute("DROP TABLE IF EXISTS entries")
+            self._db.execute("CREATE TABLE IF NOT EXISTS entries (key BLOB PRIMARY KEY, slot INTEGER UNIQUE, last_used INTEGER)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the database write lock, which other processes sharing the cache wait for"""
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        self._db.execute("COMMIT")
+
+    @property
+    def hits(self) -> int:
+        return self.stats["memory_hits"] + self.stats["disk_hits"]
+
+    @property
+    def misses(self) -> int:
+        return self.stats["misses"]
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _lookup_slots(self, keys: List[bytes]) -> Dict[bytes, int]:
+        slots = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            slots.update(self._db.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({','.join('?' * len(part))})", part
+            ).fetchall())
+        return slots
+
+    def _remember(self, key: bytes, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Look up keys, returning float32 vectors for those that are cached"""
+        found = {}
+        with self._lock:
+            missing = []
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+                    self.stats["memory_hits"] += 1
+                else:
+                    missing.append(key)
+
+            if missing:
+                # Rows are read under the write lock, so no other process can reuse a slot meanwhile
+                with self._transaction():
+                    slots = self._lookup_slots(missing)
+                    now = time.time_ns()
+                    for key, slot in slots.items():
+                        vector = np.array(self._vectors[slot], dtype=np.float32)
+                        found[key] = vector
+                        self._remember(key, vector)
+                    if slots:
+                        self._db.executemany("UPDATE entries SET last_used = ? WHERE key = ?", [(now, key) for key in slots])
+                self.stats["disk_hits"] += len(slots)
+                self.stats["misses"] += len(missing) - len(slots)
+        return found
+
+    def put_many(self, keys: List[bytes], vectors: np.ndarray) -> np.ndarray:
+        """Store vectors in both tiers, evicting the least recently used disk rows if needed.
+
+        Both tiers hold the vectors rounded to `dtype`, so a key reads the same
+        from memory, from disk or after an eviction. Returns them as float32.
+        """
+        vectors = np.asarray(vectors).astype(self.dtype).astype(np.float32)
+        if not keys:
+            return vectors
+        with self._lock:
+            for key, vector in zip(keys, vectors):
+                self._remember(key, vector)
+
+            # Allocation, row writes and index update form one transaction under the write lock
+            with self._transaction():
+                existing = self._lookup_slots(list(keys))
+                pending = [(key, vector) for key, vector in dict(zip(keys, vectors)).items() if key not in existing]
+                pending = pending[-self.max_disk_items:]
+                if not pending:
+                    return vectors
+
+                used = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+                free = max(0, self.max_disk_items - used)
+                slots = list(range(used, used + min(free, len(pending))))
+                shortfall = len(pending) - len(slots)
+                if shortfall:
+                    victims = self._db.execute(
+                        "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?", (shortfall,)
+                    ).fetchall()
+                    self._db.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+                    slots.extend(slot for _, slot in victims)
+                    self.stats["evictions"] += len(victims)
+
+                now = time.time_ns()
+                rows = []
+                for (key, vector), slot in zip(pending, slots):
+                    self._vectors[slot] = vector
+                    rows.append((key, slot, now))
+                self._vectors.flush()
+                self._db.executemany("INSERT OR REPLACE INTO entries (key, slot, last_used) VALUES (?, ?, ?)", rows)
+        return vectors
+
+    def close(self):
+        with self._lock:
+            self._vectors.flush()
+            self._db.close()
+        REGISTRY.unregister(*self._metrics)
+
+
+class CachedEmbedder(Embedder):
+    """Wrap any embedder so repeated texts are served from an `EmbeddingCache`"""
+
+    def __init__(self, embedder: Embedder, cache_dir: str, cache: Optional[EmbeddingCache] = None, **cache_options):
+        super().__init__(batch_size=embedder.batch_size)
+        self.embedder = embedder
+        self.cache_dir = cache_dir
+        self.cache_options = cache_options
+        self._cache = cache
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        # Opened on first use: the wrapped model may need loading to learn its dimension
+        if self._cache is None:
+            self._cache = EmbeddingCache(self.cache_dir, self.model_name, self.dimension, **self.cache_options)
+        return self._cache
+
+    @property
+    def model_name(self) -> str:
+        return self.embedder.model_name
+
+    @property
+    def max_seq_length(self) -> int:
+        return self.embedder.max_seq_length
+
+    @property
+    def num_special_tokens(self) -> int:
+        return self.embedder.num_special_tokens
+
+    @property
+    def dimension(self) -> int:
+        return self.embedder.dimension
+
+    @property
+    def tokenizer(self):
+        return self.embedder.tokenizer
+
+    def token_spans(self, text: str):
+        return self.embedder.token_spans(text)
+
+    def warmup(self):
+        # Bypass the cache so the wrapped model is loaded even when "warmup" is cached
+        self.embedder.warmup()
+        self.cache
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        keys = [cache_key(self.model_name, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+        if missing:
+            # Return what the cache will serve next time, not the unrounded vectors
+            vectors = self.cache.put_many(list(missing), self.embedder.embed(list(missing.values())))
+            found.update(zip(missing, vectors))
+
+        return np.vstack([found[key] for key in keys]).astype(np.float32, copy=False)
+
+
+def build_embedder(embedding_dir: str, backend: Optional[str] = None, use_cache: Optional[bool] = None, **embedder_options) -> Embedder:
+    """Create the configured embedder, wrapped in a `CachedEmbedder` unless caching is disabled.
+
+    `use_cache` defaults to the EMBEDDING_CACHE environment variable (on unless
+    set to 0/false). The cache lives in EMBEDDING_CACHE_DIR, or
+    <embedding_dir>/embedding_cache.
+    """
+    embedder = create_embedder(backend, **embedder_options)
+    if use_cache is None:
+        use_cache = os.getenv('EMBEDDING_CACHE', '1').strip().lower() not in ('0', 'false', 'no', 'off')
+    if not use_cache:
+        return embedder
+    cache_dir = os.getenv('EMBEDDING_CACHE_DIR') or os.path.join(embedding_dir, 'embedding_cache')
+    return CachedEmbedder(embedder, cache_dir)
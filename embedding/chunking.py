@@ -0,0 +1,171 @@
+import re
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from embedding.arrow_dataset import iter_record_batches
+from embedding.embedders import Embedder
+
+logger = logging.getLogger(__name__)
+
+# A block is a paragraph: in tiny_shakespeare every speaker turn is one block
+_BLOCK_RE = re.compile(r"\S.*?(?=\n[ \t]*\n|\Z)", re.DOTALL)
+_SENTENCE_RE = re.compile(r"\S.*?(?:[.!?]+(?=\s|\Z)|\Z)", re.DOTALL)
+
+
+@dataclass
+class Chunk:
+    """A window of a source row; `start`/`end` are character offsets into that row"""
+    text: str
+    row: int
+    index: int
+    start: int
+    end: int
+    n_tokens: int
+
+    def metadata(self) -> dict:
+        return {
+            "row": self.row,
+            "chunk": self.index,
+            "start": self.start,
+            "end": self.end,
+            "n_tokens": self.n_tokens,
+        }
+
+
+def iter_dataset_texts(dataset_path: str, column: str = "text", batch_rows: int = 64) -> Iterator[Tuple[int, str]]:
+    """Yield (row, text) from a saved dataset, `batch_rows` rows at a time.
+
+    The dataset's Arrow files are memory-mapped (see `iter_record_batches`)
+    and sliced without copying, so only the current slice of the column is
+    materialized as Python strings.
+    """
+    row = 0
+    for record_batch in iter_record_batches(dataset_path, [column]):
+        for offset in range(0, record_batch.num_rows, batch_rows):
+            for text in record_batch.slice(offset, batch_rows).column(0).to_pylist():
+                yield row, text or ""
+                row += 1
+
+
+class TextChunker:
+    """Split text into windows that fit the embedding model without truncation.
+
+    Strategies:
+      - "tokens": fixed windows of `max_tokens` model tokens
+      - "sentences": whole sentences packed up to `max_tokens`
+      - "speakers": whole paragraphs / speaker turns packed up to `max_tokens`
+
+    Consecutive windows share roughly `overlap` tokens. Sentences or turns that
+    are longer than `max_tokens` on their own fall back to token windows.
+    """
+
+    STRATEGIES = ("tokens", "sentences", "speakers")
+
+    def __init__(self, embedder: Embedder, strategy: str = "speakers", max_tokens: Optional[int] = None, overlap: int = 32):
+        if strategy not in self.STRATEGIES:
+            raise ValueError(f"Unknown chunking strategy '{strategy}', expected one of {self.STRATEGIES}")
+        limit = embedder.max_content_tokens
+        max_tokens = max_tokens or limit
+        if max_tokens > limit:
+            raise ValueError(f"max_tokens={max_tokens} exceeds the model limit of {limit} tokens")
+        if not 0 <= overlap < max_tokens:
+            raise ValueError(f"overlap must be in [0, max_tokens), got {overlap}")
+
+        self.embedder = embedder
+        self.strategy = strategy
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    def chunk_rows(self, rows: Iterable[Tuple[int, str]]) -> Iterator[Chunk]:
+        """Chunk a stream of (row, text) pairs"""
+        for row, text in rows:
+            yield from self.chunk_text(text, row=row)
+
+    def chunk_text(self, text: str, row: int = 0) -> Iterator[Chunk]:
+        """Chunk a single text lazily, block by block"""
+        if self.strategy == "tokens":
+            spans = self._iter_token_spans(text, 0, len(text))
+            windows = self._token_windows(text, spans)
+        else:
+            windows = self._packed_windows(text)
+
+        for index, (start, end, n_tokens) in enumerate(windows):
+            yield Chunk(text=text[start:end], row=row, index=index, start=start, end=end, n_tokens=n_tokens)
+
+    def _iter_token_spans(self, text: str, start: int, end: int) -> Iterator[Tuple[int, int, bool]]:
+        """Yield (start, end, is_word_start) token spans for text[start:end], one block at a time"""
+        for block in _BLOCK_RE.finditer(text, start, end):
+            offset = block.start()
+            for token_start, token_end in self.embedder.token_spans(block.group()):
+                token_start += offset
+                token_end += offset
+                # A window may only start or stop where re-tokenizing the slice gives the same tokens
+                is_word_start = token_start == 0 or not (text[token_start - 1].isalnum() and text[token_start].isalnum())
+                yield token_start, token_end, is_word_start
+
+    def _token_windows(self, text: str, spans: Iterable[Tuple[int, int, bool]]) -> Iterator[Tuple[int, int, int]]:
+        """Slide a window over a token stream, yielding (start, end, n_tokens)"""
+        window = deque()
+        emitted = 0  # tokens at the front of the window already covered by a yielded chunk
+        for span in spans:
+            window.append(span)
+            if len(window) <= self.max_tokens:
+                continue
+
+            cut = next((i for i in range(self.max_tokens, 0, -1) if window[i][2]), self.max_tokens)
+            yield window[0][0], window[cut - 1][1], cut
+
+            step = next((i for i in range(max(1, cut - self.overlap), cut) if window[i][2]), cut)
+            for _ in range(step):
+                window.popleft()
+            emitted = cut - step
+
+        if len(window) > emitted:
+            yield window[0][0], window[-1][1], len(window)
+
+    def _iter_units(self, text: str) -> Iterator[Tuple[int, int]]:
+        for block in _BLOCK_RE.finditer(text):
+            if self.strategy == "speakers":
+                yield block.span()
+            else:
+                yield from (sentence.span() for sentence in _SENTENCE_RE.finditer(text, *block.span()))
+
+    def _packed_windows(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Greedily pack whole units into windows, yielding (start, end, n_tokens)"""
+        pack: List[Tuple[int, int, int]] = []
+        pack_tokens = 0
+        fresh = False  # whether the pack holds a unit not yet covered by a yielded window
+
+        for unit_start, unit_end in self._iter_units(text):
+            n_tokens = len(self.embedder.token_spans(text[unit_start:unit_end]))
+            if n_tokens == 0:
+                continue
+
+            if n_tokens > self.max_tokens:
+                if fresh:
+                    yield pack[0][0], pack[-1][1], pack_tokens
+                spans = self._iter_token_spans(text, unit_start, unit_end)
+                yield from self._token_windows(text, spans)
+                pack, pack_tokens, fresh = [], 0, False
+                continue
+
+            if pack_tokens + n_tokens > self.max_tokens:
+                if fresh:
+                    yield pack[0][0], pack[-1][1], pack_tokens
+                # Carry trailing units forward as overlap
+                carried, carried_tokens = [], 0
+                for unit in reversed(pack):
+                    if carried_tokens + unit[2] > self.overlap or carried_tokens + unit[2] + n_tokens > self.max_tokens:
+                        break
+                    carried.insert(0, unit)
+                    carried_tokens += unit[2]
+                pack, pack_tokens = carried, carried_tokens
+
+            pack.append((unit_start, unit_end, n_tokens))
+            pack_tokens += n_tokens
+            fresh = True
+
+        if fresh:
+            yield pack[0][0], pack[-1][1], pack_tokens
@@ -1,29 +1,108 @@
 import os
+import time
+import shutil
 import logging
-from datasets import load_from_disk
-from chromadb import Client, Settings
-from chromadb.utils import embedding_functions
+from collections import Counter
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence, Tuple
 import chromadb
-from dotenv import load_dotenv
-from tqdm import tqdm
+import numpy as np
 
-# Load environment variables
-load_dotenv()
+from embedding.arrow_dataset import first_occurrences, read_table
+from embedding.cache import build_embedder
+from embedding.chunking import TextChunker, iter_dataset_texts
+from embedding.dedup import DEDUP_METHODS, DuplicateFilter
+from embedding.embedders import Embedder
+from embedding.exact_index import EXACT_DTYPES, ExactIndex, exact_index_path
+from embedding.filter_index import FilterIndex, FilterIndexBuilder, filter_index_path
+from embedding.lexical_index import LexicalIndex, LexicalIndexBuilder, lexical_index_path
+from embedding.manifest import IngestionManifest, IngestionSummary, content_hash
+from embedding.pipeline import IngestionPipeline
+from embedding.quantized_index import QUANTIZATION_METHODS, QuantizedIndex, quantized_index_path
+from embedding.sharding import shard_path, split_snapshot
+from embedding.snapshot import Snapshot
+from observability.tracing import StageClock
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+
+def qa_context_records(
+    titles: Sequence[str],
+    contexts: Sequence[str],
+    chunker: Optional[TextChunker] = None,
+) -> Iterator[Tuple[str, dict]]:
+    """(document, metadata) records for the distinct contexts of SQuAD-style QA columns.
+
+    Many questions share a context, so each context is yielded once, tagged
+    with its title and a `context_id` (the first 16 hex digits of its content
+    hash). With a `chunker` contexts are split into windows.
+    """
+    seen = set()
+    for title, context in zip(titles, contexts):
+        context_id = content_hash(context)[:16]
+        if context_id in seen:
+            continue
+        seen.add(context_id)
+        metadata = {"source": "squad", "dataset": "squad", "title": title, "context_id": context_id}
+        if chunker is None:
+            yield context, metadata
+        else:
+            for chunk in chunker.chunk_text(context):
+                yield chunk.text, {**metadata, **chunk.metadata()}
+
+
 class DataEmbedding:
-    def __init__(self):
+    # Seconds between manifest checkpoints while an ingestion run is in progress
+    checkpoint_interval = 5.0
+
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        embedder: Optional[Embedder] = None,
+        data_dir: Optional[str] = None,
+        embedding_dir: Optional[str] = None,
+        use_cache: Optional[bool] = None,
+        lexical_index: Optional[bool] = None,
+        vector_index: Optional[str] = None,
+        filter_index: Optional[bool] = None,
+        exact_index: Optional[str] = None,
+        dedup: Optional[str] = None,
+        **embedder_options
+    ):
+        """Set up storage and the embedding backend.
+
+        `backend` selects one of the registered embedders ("local", "huggingface_api",
+        "hash"); it defaults to the EMBEDDING_BACKEND environment variable. An
+        already constructed `embedder` can be passed instead. `data_dir` and
+        `embedding_dir` default to data/ragData and data/embedding.
+
+        Unless caching is disabled, the embedder is wrapped in a persistent
+        embedding cache (see `build_embedder`).
+
+        Ingestion also maintains a BM25 `LexicalIndex` per collection for hybrid
+        retrieval unless `lexical_index` (default: LEXICAL_INDEX, or on) is off.
+        `vector_index` (default: VECTOR_INDEX, or "chroma") set to "int8" or "pq"
+        also maintains a compressed `QuantizedIndex` that the retriever searches
+        instead of Chroma's float32 HNSW index. A `FilterIndex` over chunk metadata
+        serves filtered queries unless `filter_index` (default: FILTER_INDEX, or on)
+        is off. Collections of at most EXACT_SEARCH_MAX chunks also get an
+        `ExactIndex` for brute-force search, stored as `exact_index` (default:
+        EXACT_INDEX, or "float32"), "float16", or "off".
+
+        `dedup` (default: DEDUP, or "off") drops chunks that repeat an earlier
+        chunk of the same run before they are embedded: "exact" (ignoring case,
+        punctuation and spacing) or "minhash", which also drops near-duplicates
+        whose estimated word-shingle Jaccard similarity reaches DEDUP_THRESHOLD
+        (default 0.9).
+        """
+        from dotenv import load_dotenv
+
+        load_dotenv()
         self.huggingface_token = os.getenv('HuggingAccessToken')
-        if not self.huggingface_token:
-            raise ValueError("HuggingAccessToken not found in environment variables")
         
         # Initialize paths
         self.root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        self.data_dir = os.path.join(self.root_dir, 'data', 'ragData')
-        self.embedding_dir = os.path.join(self.root_dir, 'data', 'embedding')
+        self.data_dir = data_dir or os.path.join(self.root_dir, 'data', 'ragData')
+        self.embedding_dir = embedding_dir or os.path.join(self.root_dir, 'data', 'embedding')
         
         # Create embedding directory if it doesn't exist
         os.makedirs(self.embedding_dir, exist_ok=True)
@@ -31,52 +110,479 @@ class DataEmbedding:
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(path=self.embedding_dir)
         
-        # Initialize HuggingFace embedding function
-        self.embedding_function = embedding_functions.HuggingFaceEmbeddingFunction(
-            api_key=self.huggingface_token,
-            model_name="sentence-transformers/all-mpnet-base-v2"
+        # Initialize embedding backend
+        if embedder is None:
+            embedder = build_embedder(self.embedding_dir, backend, use_cache, **embedder_options)
+        self.embedding_function = embedder
+        
+        if lexical_index is None:
+            lexical_index = os.getenv('LEXICAL_INDEX', '1') != '0'
+        self.lexical_index = lexical_index
+        
+        if filter_index is None:
+            filter_index = os.getenv('FILTER_INDEX', '1') != '0'
+        self.filter_index = filter_index
+        
+        self.exact_index = exact_index or os.getenv('EXACT_INDEX', 'float32')
+        if self.exact_index not in EXACT_DTYPES + ("off",):
+            raise ValueError(f"Unknown exact index '{self.exact_index}', expected float32, float16 or off")
+        self.exact_search_max = int(os.getenv('EXACT_SEARCH_MAX', '20000'))
+        
+        self.dedup = dedup or os.getenv('DEDUP', 'off')
+        if self.dedup not in DEDUP_METHODS:
+            raise ValueError(f"Unknown dedup method '{self.dedup}', expected off, exact or minhash")
+        self.dedup_threshold = float(os.getenv('DEDUP_THRESHOLD', '0.9'))
+        
+        self.vector_index = vector_index or os.getenv('VECTOR_INDEX', 'chroma')
+        if self.vector_index not in ("chroma",) + QUANTIZATION_METHODS:
+            raise ValueError(f"Unknown vector index '{self.vector_index}', expected chroma, int8 or pq")
+
+    def embed_text_corpus(
+        self,
+        strategy: str = "speakers",
+        max_tokens: Optional[int] = None,
+        overlap: int = 32,
+        batch_size: int = 100,
+        workers: Optional[int] = None,
+        collection_name: str = "text_embeddings",
+    ) -> IngestionSummary:
+        """Chunk and embed the text corpus dataset into `collection_name`.
+
+        Rows are streamed from the Arrow table and split into token-bounded
+        windows (see `TextChunker`), so large rows such as tiny_shakespeare's
+        single document are embedded as many retrievable chunks. Each chunk's
+        metadata records its source row and character span.
+
+        Re-running is incremental: only new or changed chunks are embedded.
+        `workers` (default: INGEST_WORKERS, or 0) above 1 embeds in parallel
+        processes.
+        """
+        chunker = TextChunker(self.embedding_function, strategy=strategy, max_tokens=max_tokens, overlap=overlap)
+        clock = StageClock()
+        rows = clock.iterate(iter_dataset_texts(os.path.join(self.data_dir, 'text_corpus')), "read")
+        records = (
+            (chunk.text, {"source": "shakespeare", "dataset": "tiny_shakespeare", **chunk.metadata()})
+            for chunk in clock.iterate(chunker.chunk_rows(rows), "chunk")
         )
+        
+        logger.info(f"Embedding text corpus ({strategy} chunks, max {chunker.max_tokens} tokens, overlap {overlap})...")
+        if workers is None:
+            workers = int(os.getenv('INGEST_WORKERS', '0'))
+        return self.ingest_records(collection_name, "text", records, batch_size, workers)
+
+    def embed_qa_contexts(
+        self,
+        max_tokens: Optional[int] = None,
+        overlap: int = 32,
+        batch_size: int = 100,
+        workers: Optional[int] = None,
+        collection_name: str = "squad_contexts",
+    ) -> IngestionSummary:
+        """Embed the distinct contexts of the question_answer dataset into `collection_name`.
+
+        Contexts are stored whole unless `max_tokens` is set, in which case
+        they are split into sentence windows. See `qa_context_records`.
+
+        The title and context columns are read from the memory-mapped Arrow
+        files and deduplicated there, so only distinct contexts become Python
+        strings.
+        """
+        chunker = None
+        if max_tokens:
+            chunker = TextChunker(self.embedding_function, strategy="sentences", max_tokens=max_tokens, overlap=overlap)
+        clock = StageClock()
+        with clock.stage("read", items=0):
+            table = first_occurrences(read_table(os.path.join(self.data_dir, 'question_answer'), ["title", "context"]), "context")
+            titles, contexts = table.column("title").to_pylist(), table.column("context").to_pylist()
+        records = clock.iterate(qa_context_records(titles, contexts, chunker), "chunk")
 
-    def embed_text_corpus(self):
-        """Embed the text corpus dataset"""
-        logger.info("Loading text corpus dataset...")
-        text_dataset = load_from_disk(os.path.join(self.data_dir, 'text_corpus'))
+        logger.info(f"Embedding question_answer contexts into {collection_name}...")
+        if workers is None:
+            workers = int(os.getenv('INGEST_WORKERS', '0'))
+        return self.ingest_records(collection_name, "squad", records, batch_size, workers)
+
+    def ingest_records(
+        self,
+        collection_name: str,
+        id_prefix: str,
+        records: Iterable[Tuple[str, dict]],
+        batch_size: int = 100,
+        workers: int = 0,
+    ) -> IngestionSummary:
+        """Bring a collection in line with a stream of (document, metadata) records.
+
+        Ids are built from the content hash of each document, and the ingestion
+        manifest remembers what was stored last time. Unchanged documents are
+        skipped, moved documents only get their metadata refreshed, new ones
+        are embedded, and ids no longer produced are deleted. With `workers`
+        above 1, embedding runs in an `IngestionPipeline` process pool.
+        
+        Every stored chunk's metadata also gets an `ingest_time` (Unix seconds),
+        kept from the run that first stored it.
+        
+        The lexical and filter indexes see every record, changed or not, and are
+        rewritten whenever the collection changed or either has no index yet.
         
-        # Create or get collection for text corpus
-        text_collection = self.client.get_or_create_collection(
-            name="text_embeddings",
+        With deduplication on (see `dedup`), records duplicating an earlier one
+        are dropped as if the stream never produced them; `summary.duplicates`
+        counts them.
+        """
+        collection = self.client.get_or_create_collection(
+            name=collection_name,
             embedding_function=self.embedding_function
         )
+        model_name = self.embedding_function.model_name
+        manifest = IngestionManifest(self.embedding_dir)
         
-        logger.info("Embedding text corpus...")
-        batch_size = 100
-        for i in range(0, len(text_dataset), batch_size):
-            batch = text_dataset[i:i + batch_size]
-            
-            documents = []
-            metadatas = []
-            ids = []
-            
-            for j, item in enumerate(batch):
-                # The item is the text directly, no need to access a 'text' field
-                documents.append(str(item))  # Convert to string to ensure compatibility
-                metadatas.append({"source": "shakespeare"})
-                ids.append(f"text_{i+j}")
-            
-            # Add batch to collection
-            text_collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+        previous_model = manifest.model_name(collection_name)
+        if previous_model is not None and previous_model != model_name:
+            logger.info(f"Embedding model changed from {previous_model} to {model_name}, re-embedding {collection_name}")
+            self.client.delete_collection(collection_name)
+            collection = self.client.create_collection(
+                name=collection_name,
+                embedding_function=self.embedding_function
             )
-            
-            logger.info(f"Embedded {i + len(batch)}/{len(text_dataset)} text documents")
+        previous = manifest.entries(collection_name, model_name)
+        
+        if collection.count() != len(previous):
+            # The store and manifest disagree (e.g. a crash mid-run): trust the ids
+            # actually stored, since an id pins the content it was embedded from
+            logger.warning(f"Manifest out of sync with {collection_name}, reconciling with stored ids")
+            stored_ids = collection.get(include=[])['ids']
+            previous = {chunk_id: previous.get(chunk_id) for chunk_id in stored_ids}
+        
+        summary = IngestionSummary()
+        clock = StageClock()
+        current = {}
+        occurrences = Counter()
+        moved_metadatas, moved_ids = [], []
+        lexical = LexicalIndexBuilder() if self.lexical_index else None
+        filters = FilterIndexBuilder() if self.filter_index else None
+        duplicates = DuplicateFilter(self.dedup, self.dedup_threshold) if self.dedup != "off" else None
+        ingest_time = int(time.time())
+        
+        # Progress is checkpointed into the manifest so an interrupted run resumes
+        # where it stopped instead of re-embedding what was already written
+        progress = dict(previous)
+        last_checkpoint = [time.monotonic()]
         
-        logger.info(f"Completed embedding {len(text_dataset)} text documents")
+        def checkpoint(written):
+            for chunk_id, document, metadata in written:
+                progress[chunk_id] = current[chunk_id]
+            if time.monotonic() - last_checkpoint[0] >= self.checkpoint_interval:
+                manifest.set_entries(collection_name, model_name, progress)
+                manifest.save()
+                last_checkpoint[0] = time.monotonic()
+        
+        def flush_moved():
+            if moved_ids:
+                collection.update(metadatas=moved_metadatas, ids=moved_ids)
+                moved_metadatas.clear()
+                moved_ids.clear()
+        
+        def new_records():
+            """Diff the stream against the manifest, yielding only chunks that need embedding"""
+            for document, metadata in records:
+                digest = content_hash(document)
+                if duplicates is not None:
+                    with clock.stage("dedup"):
+                        if duplicates.duplicate_of(digest, document) is not None:
+                            continue
+                occurrences[digest] += 1
+                chunk_id = f"{id_prefix}_{digest[:16]}"
+                if occurrences[digest] > 1:
+                    chunk_id += f"_{occurrences[digest]}"
+                
+                known = previous.get(chunk_id)
+                metadata = {**metadata, "ingest_time": known.get("ingest_time", ingest_time) if known else ingest_time}
+                entry = {"hash": digest, **metadata}
+                current[chunk_id] = entry
+                if lexical is not None:
+                    lexical.add(chunk_id, document)
+                if filters is not None:
+                    filters.add(chunk_id, metadata)
+                if chunk_id not in previous:
+                    summary.added += 1
+                    yield chunk_id, document, metadata
+                elif previous[chunk_id] != entry:
+                    moved_metadatas.append(metadata)
+                    moved_ids.append(chunk_id)
+                    summary.updated += 1
+                    if len(moved_ids) >= batch_size:
+                        flush_moved()
+                else:
+                    summary.skipped += 1
+        
+        if workers > 1:
+            pipeline = IngestionPipeline(
+                collection,
+                self.embedding_function,
+                workers=workers,
+                write_batch_size=max(batch_size, 1000),
+                checkpoint=checkpoint,
+            )
+            summary.stages = pipeline.run(new_records())
+        else:
+            batch = []
+            for record in new_records():
+                batch.append(record)
+                if len(batch) >= batch_size:
+                    self._write_batch(collection, batch)
+                    checkpoint(batch)
+                    batch = []
+            if batch:
+                self._write_batch(collection, batch)
+                checkpoint(batch)
+        flush_moved()
+        
+        vanished = [chunk_id for chunk_id in previous if chunk_id not in current]
+        for i in range(0, len(vanished), batch_size):
+            collection.delete(ids=vanished[i:i + batch_size])
+        summary.deleted = len(vanished)
+        
+        if duplicates is not None:
+            summary.duplicates = duplicates.removed
+            logger.info(f"Dropped {duplicates.exact} exact and {duplicates.near} near-duplicate chunks from {collection_name}")
+        changed = bool(summary.added or summary.updated or summary.deleted)
+        self._write_side_indexes(collection_name, lexical, filters, changed, len(current), summary, clock, batch_size)
+        
+        manifest.set_entries(collection_name, model_name, current)
+        if changed:
+            manifest.bump_generation(collection_name)
+        manifest.save()
+        
+        logger.info(f"Completed ingesting {collection_name}: {summary}")
+        return summary
+
+    def export_snapshot(self, collection_name: str, path: str, dtype: str = "float32", batch_size: int = 1000) -> Snapshot:
+        """Write a collection's ids, documents, metadata and vectors to a `Snapshot` at `path`.
+
+        `dtype` "float16" halves the vector blob; vectors are widened again on import.
+        """
+        collection = self.client.get_collection(collection_name)
+        model_name = IngestionManifest(self.embedding_dir).model_name(collection_name) or self.embedding_function.model_name
+        
+        def pages():
+            offset = 0
+            while True:
+                page = collection.get(include=["documents", "metadatas", "embeddings"], limit=batch_size, offset=offset)
+                if not page['ids']:
+                    return
+                yield page['ids'], page['documents'], page['metadatas'], np.asarray(page['embeddings'], dtype=np.float32)
+                offset += len(page['ids'])
+        
+        return Snapshot.write(path, collection_name, model_name, pages(), dtype=dtype)
+
+    def import_snapshot(
+        self,
+        path: str,
+        collection_name: Optional[str] = None,
+        batch_size: int = 5000,
+        verify: bool = True,
+    ) -> IngestionSummary:
+        """Rebuild a collection from a `Snapshot` with large batched inserts and no embedding calls.
+
+        The snapshot must have been embedded with this embedder's model. Any
+        existing collection named `collection_name` (default: the snapshot's) is
+        replaced. The ingestion manifest is rewritten from the snapshot's records,
+        so later ingestion runs stay incremental, and the side indexes are rebuilt.
+        With `verify`, the vector blob is checked against its export checksum first.
+        """
+        snapshot = Snapshot(path)
+        model_name = self.embedding_function.model_name
+        if snapshot.model_name != model_name:
+            raise ValueError(f"Snapshot {path} was embedded with {snapshot.model_name}, this embedder uses {model_name}")
+        if verify:
+            snapshot.verify()
+        collection_name = collection_name or snapshot.collection_name
+        batch_size = min(batch_size, self.client.get_max_batch_size())
+        
+        if collection_name in [collection.name for collection in self.client.list_collections()]:
+            self.client.delete_collection(collection_name)
+        collection = self.client.create_collection(name=collection_name, embedding_function=self.embedding_function)
+        
+        summary = IngestionSummary()
+        clock = StageClock()
+        entries = {}
+        lexical = LexicalIndexBuilder() if self.lexical_index else None
+        filters = FilterIndexBuilder() if self.filter_index else None
+        for ids, documents, metadatas, vectors in clock.iterate(snapshot.iter_batches(batch_size), "read"):
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                entries[chunk_id] = {"hash": content_hash(document), **metadata}
+                if lexical is not None:
+                    lexical.add(chunk_id, document)
+                if filters is not None:
+                    filters.add(chunk_id, metadata)
+            with clock.stage("write", len(ids)):
+                collection.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=vectors)
+            summary.added += len(ids)
+            logger.info(f"Loaded {summary.added}/{len(snapshot)} chunks into {collection_name}")
+        
+        def exact_vectors():
+            return ((ids, vectors) for ids, _, _, vectors in snapshot.iter_batches(batch_size))
+        
+        self._write_side_indexes(collection_name, lexical, filters, True, len(entries), summary, clock, batch_size, exact_vectors)
+        
+        manifest = IngestionManifest(self.embedding_dir)
+        manifest.set_entries(collection_name, model_name, entries)
+        manifest.bump_generation(collection_name)
+        manifest.save()
+        logger.info(f"Imported snapshot {path} into {collection_name}: {summary.added} chunks")
+        return summary
+
+    def shard_collection(self, collection_name: str, shards: int, batch_size: int = 5000) -> List[str]:
+        """Partition a collection by id hash into `shards` stores, one per shard worker process.
+
+        Each shard store (see `shard_path`) is a complete embedding directory
+        holding the shard's part of `collection_name`, with its own manifest and
+        side indexes, built from a snapshot without embedding calls. Re-running
+        replaces the collection in every shard. Returns the shard directories.
+        """
+        work_dir = os.path.join(self.embedding_dir, "shards", f".split-{collection_name}")
+        shutil.rmtree(work_dir, ignore_errors=True)
+        try:
+            snapshot = self.export_snapshot(collection_name, os.path.join(work_dir, "all"), batch_size=min(batch_size, 1000))
+            parts = split_snapshot(snapshot, shards, work_dir, batch_size)
+            paths = []
+            for shard, part in enumerate(parts):
+                path = shard_path(self.embedding_dir, shard, shards)
+                store = DataEmbedding(
+                    embedder=self.embedding_function,
+                    data_dir=self.data_dir,
+                    embedding_dir=path,
+                    lexical_index=self.lexical_index,
+                    vector_index=self.vector_index,
+                    filter_index=self.filter_index,
+                    exact_index=self.exact_index,
+                )
+                store.exact_search_max = self.exact_search_max
+                store.import_snapshot(part.path, batch_size=batch_size, verify=False)
+                paths.append(path)
+                logger.info(f"Shard {shard + 1}/{shards} of {collection_name}: {len(part)} chunks in {path}")
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        return paths
+
+    def _write_side_indexes(
+        self,
+        collection_name: str,
+        lexical: Optional[LexicalIndexBuilder],
+        filters: Optional[FilterIndexBuilder],
+        changed: bool,
+        count: int,
+        summary: IngestionSummary,
+        clock: StageClock,
+        batch_size: int,
+        vectors: Optional[Callable[[], Iterable[Tuple[List[str], np.ndarray]]]] = None,
+    ):
+        """Bring the lexical, filter, quantized and exact indexes of a collection up to date.
+
+        `vectors` yields (ids, vectors) batches for the exact index; by default they are
+        paged out of Chroma.
+        """
+        lexical_path = lexical_index_path(self.embedding_dir, collection_name)
+        filter_path = filter_index_path(self.embedding_dir, collection_name)
+        # Both are written together so their document numbering stays aligned
+        stale = changed or (lexical is not None and not LexicalIndex.exists(lexical_path)) or (
+            filters is not None and not FilterIndex.exists(filter_path)
+        )
+        if lexical is not None and stale:
+            with clock.stage("lexical_index", items=0):
+                lexical.write(lexical_path)
+        if filters is not None and stale:
+            with clock.stage("filter_index", items=0):
+                filters.write(filter_path)
+        
+        quantized_path = quantized_index_path(self.embedding_dir, collection_name)
+        if self.vector_index != "chroma":
+            if changed or not QuantizedIndex.exists(quantized_path):
+                with clock.stage("vector_index", items=0):
+                    summary.vector_index = self.build_quantized_index(collection_name, batch_size=max(batch_size, 1000))
+        elif changed and os.path.exists(quantized_path):
+            # Chroma is the chosen index again; a stale quantized copy must not be served
+            shutil.rmtree(quantized_path)
+        
+        exact_path = exact_index_path(self.embedding_dir, collection_name)
+        if self.exact_index != "off" and 0 < count <= self.exact_search_max:
+            if changed or not ExactIndex.exists(exact_path):
+                with clock.stage("exact_index", items=0):
+                    if vectors is None:
+                        self.build_exact_index(collection_name, batch_size=max(batch_size, 1000))
+                    else:
+                        ExactIndex.build(exact_path, vectors(), dtype=self.exact_index, model_name=self.embedding_function.model_name)
+        elif os.path.exists(exact_path):
+            # Too large for brute force (or turned off): a stale copy must not be served
+            shutil.rmtree(exact_path)
+
+    def build_quantized_index(self, collection_name: str, method: Optional[str] = None, batch_size: int = 1000) -> dict:
+        """(Re)build the quantized index of a collection from its stored vectors.
+
+        Returns the index's recall report: recall@10 of code-only and re-scored
+        search against exact search, and the size of codes versus float vectors.
+        """
+        method = method or self.vector_index
+        collection = self.client.get_collection(collection_name)
+        path = quantized_index_path(self.embedding_dir, collection_name)
+        if collection.count() == 0:
+            shutil.rmtree(path, ignore_errors=True)
+            return {}
+        
+        index = QuantizedIndex.build(
+            path, self._stored_vectors(collection, batch_size), method=method, model_name=self.embedding_function.model_name
+        )
+        report = index.recall_report()
+        logger.info(f"Quantized index for {collection_name}: {report}")
+        return report
+
+    def build_exact_index(self, collection_name: str, dtype: Optional[str] = None, batch_size: int = 1000) -> Optional[ExactIndex]:
+        """(Re)build the memory-mapped vector matrix that exact search scans, of any collection size.
+
+        Returns None, and removes any previous matrix, when the collection is empty.
+        """
+        dtype = dtype if dtype is not None else (self.exact_index if self.exact_index != "off" else "float32")
+        collection = self.client.get_collection(collection_name)
+        path = exact_index_path(self.embedding_dir, collection_name)
+        if collection.count() == 0:
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+        return ExactIndex.build(
+            path, self._stored_vectors(collection, batch_size), dtype=dtype, model_name=self.embedding_function.model_name
+        )
+
+    @staticmethod
+    def _stored_vectors(collection, batch_size: int) -> Iterator[Tuple[List[str], np.ndarray]]:
+        """(ids, vectors) pages of everything stored in a collection"""
+        offset = 0
+        while True:
+            page = collection.get(include=["embeddings"], limit=batch_size, offset=offset)
+            if not page['ids']:
+                return
+            yield page['ids'], np.asarray(page['embeddings'], dtype=np.float32)
+            offset += len(page['ids'])
+
+    def _write_batch(self, collection, batch: List[Tuple[str, str, dict]]):
+        """Embed and store one batch of (id, document, metadata) records in this process"""
+        clock = StageClock()
+        documents = [document for _, document, _ in batch]
+        with clock.stage("embed", len(batch)):
+            vectors = self.embedding_function.embed(documents)
+        with clock.stage("write", len(batch)):
+            collection.upsert(
+                ids=[chunk_id for chunk_id, _, _ in batch],
+                documents=documents,
+                metadatas=[metadata for _, _, metadata in batch],
+                embeddings=vectors,
+            )
+        logger.info(f"Embedded {len(batch)} chunks into {collection.name}")
 
 def main():
+    logging.basicConfig(level=logging.INFO)
     embedder = DataEmbedding()
     embedder.embed_text_corpus()
+    if os.path.exists(os.path.join(embedder.data_dir, 'question_answer')):
+        embedder.embed_qa_contexts()
+    else:
+        logger.warning(f"No question_answer dataset in {embedder.data_dir}, skipping squad_contexts")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,109 @@
+import re
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from embedding.manifest import content_hash
+
+logger = logging.getLogger(__name__)
+
+DEDUP_METHODS = ("off", "exact", "minhash")
+
+_TOKEN = re.compile(r"\w+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercased words separated by single spaces, so case, punctuation and spacing do not matter"""
+    return " ".join(_TOKEN.findall(text.lower()))
+
+
+def shingles(text: str, size: int = 3) -> List[str]:
+    """Distinct word n-grams of a text; texts shorter than `size` words are one shingle"""
+    words = normalize_text(text).split()
+    if len(words) <= size:
+        return [" ".join(words)]
+    return list(dict.fromkeys(" ".join(words[i:i + size]) for i in range(len(words) - size + 1)))
+
+
+class MinHasher:
+    """MinHash signatures of word-shingle sets, whose agreement estimates Jaccard similarity.
+
+    Shingles are hashed to stable 64-bit values, then `num_perm` multiply-shift
+    hash functions are applied to all of them at once with NumPy; the
+    signature keeps each function's minimum. Seeds are fixed, so signatures
+    are comparable across processes and runs.
+    """
+
+    def __init__(self, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, 2 ** 63, size=(num_perm, 1), dtype=np.uint64) | np.uint64(1)
+        self._b = rng.integers(0, 2 ** 63, size=(num_perm, 1), dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashed = np.array(
+            [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little') for shingle in shingles(text, self.shingle_size)],
+            dtype=np.uint64,
+        )
+        with np.errstate(over='ignore'):
+            return ((self._a * hashed[None, :] + self._b) >> np.uint64(32)).min(axis=1)
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        """Estimated Jaccard similarity of the shingle sets behind two signatures"""
+        return float(np.mean(first == second))
+
+
+class DuplicateFilter:
+    """Recognizes documents that repeat, or nearly repeat, one seen earlier in a stream.
+
+    "exact" compares content hashes of the normalized text (case, punctuation
+    and whitespace ignored). "minhash" also catches near-duplicates: MinHash
+    signatures are split into `bands` bands for locality-sensitive hashing,
+    so only documents sharing a band are compared, and a candidate counts
+    when its estimated Jaccard similarity reaches `threshold`.
+    """
+
+    def __init__(self, method: str = "minhash", threshold: float = 0.9, num_perm: int = 128, bands: int = 32):
+        if method not in DEDUP_METHODS[1:]:
+            raise ValueError(f"Unknown dedup method '{method}', expected one of {DEDUP_METHODS[1:]}")
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.method = method
+        self.threshold = threshold
+        self.bands = bands
+        self.hasher = MinHasher(num_perm) if method == "minhash" else None
+        self._digests: Dict[str, str] = {}
+        self._signatures: List[np.ndarray] = []
+        self._keys: List[str] = []
+        self._buckets: Dict[tuple, List[int]] = {}
+        self.exact = 0
+        self.near = 0
+
+    @property
+    def removed(self) -> int:
+        return self.exact + self.near
+
+    def duplicate_of(self, key: str, text: str) -> Optional[str]:
+        """The key of an earlier document that `text` duplicates, or None after remembering it as `key`"""
+        digest = content_hash(normalize_text(text))
+        if digest in self._digests:
+            self.exact += 1
+            return self._digests[digest]
+        if self.hasher is not None:
+            signature = self.hasher.signature(text)
+            bands = [(band, part.tobytes()) for band, part in enumerate(np.split(signature, self.bands))]
+            candidates = dict.fromkeys(number for band in bands for number in self._buckets.get(band, ()))
+            for number in candidates:
+                if MinHasher.similarity(signature, self._signatures[number]) >= self.threshold:
+                    self.near += 1
+                    return self._keys[number]
+            for band in bands:
+                self._buckets.setdefault(band, []).append(len(self._signatures))
+            self._signatures.append(signature)
+            self._keys.append(key)
+        self._digests[digest] = key
+        return None
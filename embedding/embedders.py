@@ -0,0 +1,278 @@
+import os
+import re
+import hashlib
+import logging
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+DEFAULT_BACKEND = "local"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+class Embedder(EmbeddingFunction[Documents]):
+    """Base class for embedding backends.
+
+    Subclasses implement `_embed_batch`; `embed` takes care of batching and
+    length-sorted bucketing so texts of similar length share a batch and
+    padding waste stays low. Instances can be passed to Chroma directly as
+    an embedding function.
+    """
+
+    model_name: str = ""
+    max_seq_length: int = 384
+    num_special_tokens: int = 2
+
+    def __init__(self, batch_size: int = 32):
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+        self.batch_size = batch_size
+
+    @property
+    def dimension(self) -> int:
+        raise NotImplementedError
+
+    @property
+    def tokenizer(self):
+        """HuggingFace tokenizer matching the model, or None to fall back to word tokens"""
+        return None
+
+    @property
+    def max_content_tokens(self) -> int:
+        """Largest number of text tokens that fit in one input without truncation"""
+        return self.max_seq_length - self.num_special_tokens
+
+    def token_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Character (start, end) offsets of each model token in `text`, special tokens excluded"""
+        tokenizer = self.tokenizer
+        if tokenizer is None:
+            return [match.span() for match in _WORD_RE.finditer(text)]
+        encoding = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        return [tuple(span) for span in encoding['offset_mapping']]
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed texts into a (len(texts), dimension) float32 matrix, preserving order"""
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = None
+        for start in range(0, len(order), self.batch_size):
+            bucket = order[start:start + self.batch_size]
+            batch_vectors = np.asarray(self._embed_batch([texts[i] for i in bucket]), dtype=np.float32)
+            if vectors is None:
+                vectors = np.empty((len(texts), batch_vectors.shape[1]), dtype=np.float32)
+            vectors[bucket] = batch_vectors
+        return vectors
+
+    def warmup(self):
+        """Load the model and run one forward pass so the first request does not pay for it"""
+        self.embed(["warmup"])
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return list(self.embed(input))
+
+
+class SentenceTransformerEmbedder(Embedder):
+    """In-process sentence-transformers backend, optionally running ONNX / int8-quantized"""
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL_NAME,
+        batch_size: int = 32,
+        num_threads: Optional[int] = None,
+        use_onnx: bool = False,
+        quantize: bool = False,
+        onnx_file_name: Optional[str] = None,
+        device: str = "cpu",
+    ):
+        super().__init__(batch_size=batch_size)
+        self.model_name = model_name
+        self.num_threads = num_threads
+        self.use_onnx = use_onnx or quantize
+        self.quantize = quantize
+        self.onnx_file_name = onnx_file_name
+        self.device = device
+        self._model = None
+
+    def __getstate__(self):
+        # Worker processes reload the model themselves rather than unpickling it
+        state = self.__dict__.copy()
+        state['_model'] = None
+        return state
+
+    @property
+    def model(self):
+        """Load the model on first use so constructing the embedder stays cheap"""
+        if self._model is None:
+            self._model = self._load_model()
+        return self._model
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {"device": self.device}
+        if self.use_onnx:
+            model_kwargs = {"provider": "CPUExecutionProvider"}
+            file_name = self.onnx_file_name
+            if file_name is None and self.quantize:
+                file_name = "onnx/model_quint8_avx2.onnx"
+            if file_name:
+                model_kwargs["file_name"] = file_name
+            if self.num_threads:
+                import onnxruntime
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = self.num_threads
+                model_kwargs["session_options"] = session_options
+            kwargs["backend"] = "onnx"
+            kwargs["model_kwargs"] = model_kwargs
+
+        if self.num_threads:
+            import torch
+            torch.set_num_threads(self.num_threads)
+
+        logger.info(f"Loading embedding model {self.model_name} (onnx={self.use_onnx}, quantize={self.quantize})")
+        model = SentenceTransformer(self.model_name, **kwargs)
+        self.max_seq_length = model.max_seq_length
+        return model
+
+    @property
+    def dimension(self) -> int:
+        return self.model.get_sentence_embedding_dimension()
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        return self.model.encode(
+            texts,
+            batch_size=len(texts),
+            convert_to_numpy=True,
+            normalize_embeddings=True,
+            show_progress_bar=False,
+        )
+
+
+class HuggingFaceAPIEmbedder(Embedder):
+    """Remote backend calling the HuggingFace Inference API through Chroma's helper"""
+
+    def __init__(self, api_key: Optional[str] = None, model_name: str = DEFAULT_MODEL_NAME, batch_size: int = 32):
+        super().__init__(batch_size=batch_size)
+        api_key = api_key or os.getenv('HuggingAccessToken')
+        if not api_key:
+            raise ValueError("HuggingAccessToken not found in environment variables")
+
+        from chromadb.utils import embedding_functions
+        self.model_name = model_name
+        self._function = embedding_functions.HuggingFaceEmbeddingFunction(
+            api_key=api_key,
+            model_name=model_name
+        )
+        self._dimension = None
+        self._tokenizer = None
+
+    @property
+    def tokenizer(self):
+        if self._tokenizer is None:
+            from transformers import AutoTokenizer
+            self._tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tokenizer
+
+    @property
+    def dimension(self) -> int:
+        if self._dimension is None:
+            self._dimension = self._embed_batch(["dimension probe"]).shape[1]
+        return self._dimension
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.asarray(self._function(texts), dtype=np.float32)
+        self._dimension = vectors.shape[1]
+        return vectors
+
+
+class HashEmbedder(Embedder):
+    """Deterministic feature-hashing embedder for offline tests and benchmarks.
+
+    Each word is hashed to a signed bucket, so texts sharing words end up
+    close together. No model download or network access is needed.
+    Tokens are plain words, so there are no special tokens to budget for.
+    """
+
+    num_special_tokens = 0
+
+    def __init__(self, dimension: int = 768, model_name: str = "hash-embedder", batch_size: int = 256):
+        super().__init__(batch_size=batch_size)
+        self.model_name = model_name
+        self._dimension = dimension
+
+    @property
+    def dimension(self) -> int:
+        return self._dimension
+
+    @staticmethod
+    @lru_cache(maxsize=65536)
+    def _hash_token(token: str, dimension: int):
+        digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+        return digest % dimension, 1.0 if digest >> 63 else -1.0
+
+    def _embed_batch(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self._dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in _WORD_RE.findall(text.lower()):
+                index, sign = self._hash_token(token, self._dimension)
+                vectors[row, index] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+EMBEDDER_BACKENDS = {
+    "local": SentenceTransformerEmbedder,
+    "huggingface_api": HuggingFaceAPIEmbedder,
+    "hash": HashEmbedder,
+}
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def embedder_options_from_env(backend: str) -> dict:
+    """Collect backend options from EMBEDDING_* environment variables"""
+    options = {}
+    if os.getenv('EMBEDDING_BATCH_SIZE'):
+        options['batch_size'] = int(os.getenv('EMBEDDING_BATCH_SIZE'))
+    if backend in ("local", "huggingface_api") and os.getenv('EMBEDDING_MODEL'):
+        options['model_name'] = os.getenv('EMBEDDING_MODEL')
+    if backend == "local":
+        if os.getenv('EMBEDDING_NUM_THREADS'):
+            options['num_threads'] = int(os.getenv('EMBEDDING_NUM_THREADS'))
+        if _env_flag('EMBEDDING_ONNX'):
+            options['use_onnx'] = True
+        if _env_flag('EMBEDDING_QUANTIZE'):
+            options['quantize'] = True
+    return options
+
+
+def create_embedder(backend: Optional[str] = None, **options) -> Embedder:
+    """Create an embedder for `backend` (defaults to EMBEDDING_BACKEND or "local").
+
+    Explicit keyword options take precedence over EMBEDDING_* environment variables.
+    """
+    backend = backend or os.getenv('EMBEDDING_BACKEND', DEFAULT_BACKEND)
+    if backend not in EMBEDDER_BACKENDS:
+        raise ValueError(f"Unknown embedding backend '{backend}', expected one of {sorted(EMBEDDER_BACKENDS)}")
+    merged = embedder_options_from_env(backend)
+    merged.update(options)
+    return EMBEDDER_BACKENDS[backend](**merged)
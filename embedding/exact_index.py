@@ -0,0 +1,192 @@
+import os
+import json
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.manifest import replace_directory
+
+logger = logging.getLogger(__name__)
+
+EXACT_DTYPES = ("float32", "float16")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _search_pool() -> ThreadPoolExecutor:
+    """Threads shared by every exact index in the process, sized by EXACT_SEARCH_WORKERS (default: all cores)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            workers = int(os.getenv('EXACT_SEARCH_WORKERS', '0')) or os.cpu_count() or 1
+            _pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="exact-search")
+        return _pool
+
+
+def exact_index_path(embedding_dir: str, collection_name: str) -> str:
+    """Where the exact-search vector matrix of a collection lives inside the store"""
+    return os.path.join(embedding_dir, "exact", collection_name)
+
+
+def top_k(distances: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Column indices and values of the k smallest distances per row, in ascending order"""
+    k = min(k, distances.shape[1])
+    if k < distances.shape[1]:
+        columns = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        columns = np.broadcast_to(np.arange(distances.shape[1]), distances.shape)
+    values = np.take_along_axis(distances, columns, axis=1)
+    order = np.argsort(values, axis=1, kind='stable')
+    return np.take_along_axis(columns, order, axis=1), np.take_along_axis(values, order, axis=1)
+
+
+class IdRows:
+    """Row numbers of string ids in a memory-mapped id array, through a lazily built sorted lookup"""
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = ids
+        self._order = None
+
+    def __call__(self, ids: List[str]) -> np.ndarray:
+        """Row numbers of `ids`, -1 for ids not in the array"""
+        if self._order is None:
+            order = np.argsort(self.ids)
+            self._order = order, np.asarray(self.ids[order])
+        order, sorted_ids = self._order
+        if not len(sorted_ids):
+            return np.full(len(ids), -1, dtype=np.int64)
+        wanted = np.array(ids, dtype=str) if len(ids) else np.empty(0, dtype=sorted_ids.dtype)
+        found = np.minimum(np.searchsorted(sorted_ids, wanted), len(sorted_ids) - 1)
+        return np.where(sorted_ids[found] == wanted, order[found], -1)
+
+
+class ExactIndex:
+    """Exact top-k search over a memory-mapped matrix of a collection's vectors.
+
+    Vectors are stored contiguously as float32, or float16 at half the size,
+    next to their squared norms. A batch of queries is scored against blocks
+    of `block_size` rows with one matrix multiplication each, every block
+    keeps its best k with `argpartition`, and the survivors are merged.
+    Blocks run on a process-wide thread pool (NumPy releases the GIL while
+    it computes), so a large scan uses every core while only a block per
+    thread is resident at once; `parallel=False` keeps a scan on the calling
+    thread.
+    """
+
+    def __init__(self, path: str, block_size: int = 16384, parallel: bool = True):
+        self.path = path
+        self.block_size = block_size
+        self.parallel = parallel
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.model_name = self.meta.get("model")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+        self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode='r')
+        self.rows = IdRows(self.ids)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        batches: Iterable[Tuple[List[str], np.ndarray]],
+        dtype: str = "float32",
+        model_name: Optional[str] = None,
+    ) -> "ExactIndex":
+        """Write the matrix from (ids, float vectors) batches, replacing any previous version at `path`"""
+        if dtype not in EXACT_DTYPES:
+            raise ValueError(f"Unknown exact index dtype '{dtype}', expected one of {EXACT_DTYPES}")
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        # Spill rows as they arrive, then wrap them in an .npy header without holding the corpus in memory
+        ids, raw_file = [], os.path.join(tmp_path, "vectors.raw")
+        with open(raw_file, 'wb') as f:
+            for batch_ids, batch_vectors in batches:
+                ids.extend(batch_ids)
+                f.write(np.ascontiguousarray(batch_vectors, dtype=dtype).tobytes())
+        if not ids:
+            raise ValueError("Cannot build an exact index without vectors")
+        dimension = os.path.getsize(raw_file) // (np.dtype(dtype).itemsize * len(ids))
+        raw = np.memmap(raw_file, dtype=dtype, mode='r', shape=(len(ids), dimension))
+        vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode='w+', dtype=dtype, shape=raw.shape)
+        norms = np.lib.format.open_memmap(os.path.join(tmp_path, "norms.npy"), mode='w+', dtype=np.float32, shape=(len(ids),))
+        for start in range(0, len(ids), 65536):
+            block = np.asarray(raw[start:start + 65536])
+            vectors[start:start + len(block)] = block
+            # Norms of the stored (possibly float16-rounded) values, so distances stay consistent
+            wide = block.astype(np.float32)
+            norms[start:start + len(block)] = (wide * wide).sum(axis=1)
+        vectors.flush()
+        norms.flush()
+        del raw, vectors, norms
+        os.remove(raw_file)
+        np.save(os.path.join(tmp_path, "ids.npy"), np.array(ids, dtype=str))
+
+        with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"dtype": dtype, "model": model_name, "count": len(ids), "dimension": dimension}, f)
+        replace_directory(tmp_path, path)
+        logger.info(f"Wrote {dtype} exact index with {len(ids)} vectors to {path}")
+        return cls(path)
+
+    def _block(self, queries: np.ndarray, query_norms: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Best k (row, distance) per query among `rows`, a sorted slice or array of row numbers"""
+        if isinstance(rows, slice):
+            vectors, norms = self.vectors[rows], self.norms[rows]
+            numbers = np.arange(rows.start, rows.stop)
+        else:
+            vectors, norms, numbers = self.vectors[rows], self.norms[rows], rows
+        distances = query_norms[:, None] - 2.0 * (queries @ np.asarray(vectors, dtype=np.float32).T) + norms[None, :]
+        columns, values = top_k(np.maximum(distances, 0.0), k)
+        return numbers[columns], values
+
+    def _map(self, fn, blocks):
+        if not self.parallel or len(blocks) <= 1:
+            return [fn(block) for block in blocks]
+        return list(_search_pool().map(fn, blocks))
+
+    def search_rows(self, queries: np.ndarray, k: int = 10, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k row numbers and squared L2 distances per query, as (queries, k) arrays.
+
+        With `rows`, only those rows are searched (e.g. the chunks a filter selected).
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        query_norms = (queries * queries).sum(axis=1)
+        if rows is None:
+            blocks = [slice(start, min(start + self.block_size, len(self))) for start in range(0, len(self), self.block_size)]
+        else:
+            rows = np.sort(np.asarray(rows, dtype=np.int64))  # sequential reads from the mapped file
+            blocks = [rows[start:start + self.block_size] for start in range(0, len(rows), self.block_size)]
+        if not blocks or k < 1:
+            return np.empty((len(queries), 0), dtype=np.int64), np.empty((len(queries), 0), dtype=np.float32)
+        parts = self._map(lambda block: self._block(queries, query_norms, block, k), blocks)
+        if len(parts) == 1:
+            return parts[0]
+        numbers = np.concatenate([part[0] for part in parts], axis=1)
+        columns, values = top_k(np.concatenate([part[1] for part in parts], axis=1), k)
+        return np.take_along_axis(numbers, columns, axis=1), values
+
+    def search(self, queries: np.ndarray, k: int = 10, rows: Optional[np.ndarray] = None) -> Tuple[List[List[str]], List[List[float]]]:
+        """Top-k ids and squared L2 distances per query; see `search_rows`"""
+        numbers, values = self.search_rows(queries, k, rows)
+        return (
+            [[str(self.ids[row]) for row in query_rows] for query_rows in numbers],
+            [[float(value) for value in query_values] for query_values in values],
+        )
@@ -0,0 +1,167 @@
+import os
+import json
+import shutil
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.manifest import replace_directory
+
+logger = logging.getLogger(__name__)
+
+
+def filter_index_path(embedding_dir: str, collection_name: str) -> str:
+    """Where the metadata filter index of a collection lives inside the store"""
+    return os.path.join(embedding_dir, "filters", collection_name)
+
+
+def _is_number(value: Any) -> bool:
+    return isinstance(value, (int, float))
+
+
+class FilterIndexBuilder:
+    """Collects chunk metadata in ingestion order and writes a `FilterIndex`.
+
+    Positions are assigned in the order chunks are added, which is the same
+    order `LexicalIndexBuilder` numbers documents in when both see the same
+    stream, so a filter can be applied to BM25 scores as a bitmap.
+    """
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.columns: Dict[str, Tuple[List[int], List[Any]]] = {}
+
+    def add(self, doc_id: str, metadata: dict):
+        position = len(self.ids)
+        self.ids.append(doc_id)
+        for field, value in metadata.items():
+            positions, values = self.columns.setdefault(field, ([], []))
+            positions.append(position)
+            values.append(value)
+
+    def write(self, path: str):
+        """Write the index to `path` atomically, replacing any previous version"""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        fields = {}
+        for number, (field, (positions, values)) in enumerate(sorted(self.columns.items())):
+            if all(_is_number(value) for value in values):
+                kind, keys = "number", np.array(values, dtype=np.float64)
+            elif all(isinstance(value, str) for value in values):
+                kind, vocabulary = "string", np.array(sorted(set(values)))
+                keys = np.searchsorted(vocabulary, values).astype(np.int32)
+                np.save(os.path.join(tmp_path, f"{number}.vocabulary.npy"), vocabulary)
+            else:
+                # Mixed types cannot be ordered; such fields are filtered by Chroma instead
+                fields[field] = {"kind": "mixed"}
+                continue
+            order = np.argsort(keys, kind='stable')
+            np.save(os.path.join(tmp_path, f"{number}.keys.npy"), keys[order])
+            np.save(os.path.join(tmp_path, f"{number}.positions.npy"), np.asarray(positions, dtype=np.int32)[order])
+            fields[field] = {"kind": kind, "file": number}
+
+        np.save(os.path.join(tmp_path, "ids.npy"), np.array(self.ids))
+        with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"documents": len(self.ids), "fields": fields}, f)
+
+        replace_directory(tmp_path, path)
+        logger.info(f"Wrote filter index over {len(fields)} metadata fields of {len(self.ids)} chunks to {path}")
+
+
+class FilterIndex:
+    """Memory-mapped per-field indexes over chunk metadata.
+
+    Each field stores its values sorted, next to the positions of the chunks
+    holding them; strings are dictionary-encoded. A condition is answered with
+    binary searches that return a slice of positions (an id-set), and
+    conditions on several fields are intersected. Selecting a narrow subset
+    therefore costs time proportional to its size, not to the collection's.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding='utf-8') as f:
+            meta = json.load(f)
+        self.fields: Dict[str, dict] = meta["fields"]
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        self._columns: Dict[str, tuple] = {}
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _column(self, field: str) -> tuple:
+        column = self._columns.get(field)
+        if column is None:
+            number = self.fields[field]["file"]
+            keys = np.load(os.path.join(self.path, f"{number}.keys.npy"), mmap_mode='r')
+            positions = np.load(os.path.join(self.path, f"{number}.positions.npy"), mmap_mode='r')
+            vocabulary = None
+            if self.fields[field]["kind"] == "string":
+                vocabulary = np.load(os.path.join(self.path, f"{number}.vocabulary.npy"), mmap_mode='r')
+            column = self._columns[field] = (keys, positions, vocabulary)
+        return column
+
+    def _key(self, field: str, value: Any) -> Optional[float]:
+        """The stored key for a value, or None when no chunk can hold it"""
+        _, _, vocabulary = self._column(field)
+        if vocabulary is None:
+            return float(value) if _is_number(value) else None
+        if not isinstance(value, str):
+            return None
+        code = int(np.searchsorted(vocabulary, value))
+        return code if code < len(vocabulary) and vocabulary[code] == value else None
+
+    def _equal(self, field: str, values: List[Any]) -> np.ndarray:
+        keys, positions, _ = self._column(field)
+        parts = []
+        for key in {self._key(field, value) for value in values} - {None}:
+            parts.append(positions[np.searchsorted(keys, key, 'left'):np.searchsorted(keys, key, 'right')])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+
+    def _match(self, field: str, operator: str, value: Any) -> np.ndarray:
+        keys, positions, vocabulary = self._column(field)
+        if operator in ("$eq", "$in"):
+            return self._equal(field, value if operator == "$in" else [value])
+        if operator in ("$ne", "$nin"):
+            return np.setdiff1d(positions, self._equal(field, value if operator == "$nin" else [value]))
+        if vocabulary is not None:
+            return np.empty(0, dtype=np.int32)  # range operators only match numbers
+        if operator in ("$gt", "$gte"):
+            return positions[np.searchsorted(keys, value, 'right' if operator == "$gt" else 'left'):]
+        return positions[:np.searchsorted(keys, value, 'left' if operator == "$lt" else 'right')]
+
+    def select(self, conditions: List[Tuple[str, str, Any]]) -> Optional[np.ndarray]:
+        """Sorted positions of the chunks matching every condition.
+
+        Returns None when a condition is on a field this index cannot answer
+        (one with values of mixed types); the caller then filters in Chroma.
+        """
+        result = None
+        for field, operator, value in conditions:
+            info = self.fields.get(field)
+            if info is None:
+                # No chunk has the field, so no chunk satisfies a condition on it
+                return np.empty(0, dtype=np.int32)
+            if info["kind"] == "mixed":
+                return None
+            matched = np.unique(self._match(field, operator, value))
+            result = matched if result is None else np.intersect1d(result, matched, assume_unique=True)
+            if not len(result):
+                break
+        return result if result is not None else np.arange(len(self), dtype=np.int32)
+
+    def mask(self, positions: np.ndarray) -> np.ndarray:
+        """Boolean bitmap over all positions, True for `positions`"""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[positions] = True
+        return mask
+
+    def ids_at(self, positions: np.ndarray) -> List[str]:
+        return [str(doc_id) for doc_id in self.ids[positions]]
@@ -0,0 +1,205 @@
+import os
+import re
+import json
+import math
+import shutil
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.manifest import replace_directory
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def term_hash(term: str) -> int:
+    return int.from_bytes(hashlib.blake2b(term.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def encode_varints(values: np.ndarray) -> bytes:
+    """LEB128-encode non-negative integers, 7 bits per byte with a continuation bit"""
+    values = np.asarray(values, dtype=np.uint64)
+    if values.size == 0:
+        return b""
+    lengths = np.ones(values.shape, dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        lengths += rest > 0
+        rest >>= np.uint64(7)
+    positions = np.cumsum(lengths) - lengths
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    for j in range(int(lengths.max())):
+        mask = lengths > j
+        byte = (values[mask] >> np.uint64(7 * j)) & np.uint64(0x7F)
+        more = (lengths[mask] > j + 1).astype(np.uint64) << np.uint64(7)
+        out[positions[mask] + j] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def decode_varints(data: np.ndarray) -> np.ndarray:
+    """Decode a uint8 array of LEB128 varints, vectorized over all values"""
+    data = np.asarray(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.empty_like(ends)
+    starts[0:1] = 0
+    starts[1:] = ends[:-1] + 1
+    lengths = ends - starts + 1
+    values = np.zeros(len(ends), dtype=np.uint64)
+    for j in range(int(lengths.max()) if len(lengths) else 0):
+        mask = lengths > j
+        values[mask] |= (data[starts[mask] + j].astype(np.uint64) & np.uint64(0x7F)) << np.uint64(7 * j)
+    return values
+
+
+class LexicalIndexBuilder:
+    """Accumulates documents in memory and writes a compact BM25 inverted index"""
+
+    def __init__(self):
+        self.doc_ids: List[str] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+    def add(self, doc_id: str, text: str):
+        doc_num = len(self.doc_ids)
+        tokens = tokenize(text)
+        self.doc_ids.append(doc_id)
+        self.doc_lengths.append(len(tokens))
+        counts = defaultdict(int)
+        for token in tokens:
+            counts[token] += 1
+        for term, tf in counts.items():
+            self.postings[term].append((doc_num, tf))
+
+    def write(self, path: str):
+        """Write the index to `path` atomically, replacing any previous version"""
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        terms = sorted(self.postings, key=term_hash)
+        hashes = np.array([term_hash(term) for term in terms], dtype=np.uint64)
+        offsets = np.zeros(len(terms) + 1, dtype=np.uint64)
+        doc_freqs = np.zeros(len(terms), dtype=np.uint32)
+        with open(os.path.join(tmp_path, "postings.bin"), 'wb') as f:
+            position = 0
+            for i, term in enumerate(terms):
+                postings = np.array(self.postings[term], dtype=np.uint64)
+                # Doc numbers are appended in increasing order, so store gaps
+                postings[1:, 0] -= postings[:-1, 0].copy()
+                encoded = encode_varints(postings.ravel())
+                f.write(encoded)
+                position += len(encoded)
+                offsets[i + 1] = position
+                doc_freqs[i] = len(postings)
+
+        np.save(os.path.join(tmp_path, "term_hashes.npy"), hashes)
+        np.save(os.path.join(tmp_path, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp_path, "doc_freqs.npy"), doc_freqs)
+        np.save(os.path.join(tmp_path, "doc_lengths.npy"), np.array(self.doc_lengths, dtype=np.uint32))
+        id_bytes = [doc_id.encode('utf-8') for doc_id in self.doc_ids]
+        id_offsets = np.zeros(len(id_bytes) + 1, dtype=np.uint64)
+        id_offsets[1:] = np.cumsum([len(b) for b in id_bytes])
+        with open(os.path.join(tmp_path, "doc_ids.bin"), 'wb') as f:
+            f.write(b"".join(id_bytes))
+        np.save(os.path.join(tmp_path, "doc_id_offsets.npy"), id_offsets)
+        total = int(sum(self.doc_lengths))
+        with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump({"documents": len(self.doc_ids), "terms": len(terms), "total_tokens": total}, f)
+
+        replace_directory(tmp_path, path)
+        logger.info(f"Wrote lexical index with {len(self.doc_ids)} documents and {len(terms)} terms to {path}")
+
+
+class LexicalIndex:
+    """Memory-mapped BM25 index written by `LexicalIndexBuilder`.
+
+    Terms are looked up by 64-bit hash with a binary search over a sorted
+    array, and postings are delta + varint compressed, so opening an index
+    maps files without parsing them.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.num_documents = meta["documents"]
+        self.avg_length = meta["total_tokens"] / self.num_documents if self.num_documents else 0.0
+        self.term_hashes = np.load(os.path.join(path, "term_hashes.npy"), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, "offsets.npy"), mmap_mode='r')
+        self.doc_freqs = np.load(os.path.join(path, "doc_freqs.npy"), mmap_mode='r')
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode='r')
+        self.doc_id_offsets = np.load(os.path.join(path, "doc_id_offsets.npy"), mmap_mode='r')
+        self.postings = self._map(os.path.join(path, "postings.bin"))
+        self.doc_id_blob = self._map(os.path.join(path, "doc_ids.bin"))
+
+    @staticmethod
+    def _map(file_path: str) -> np.ndarray:
+        if os.path.getsize(file_path) == 0:
+            return np.zeros(0, dtype=np.uint8)
+        return np.memmap(file_path, dtype=np.uint8, mode='r')
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def __len__(self) -> int:
+        return self.num_documents
+
+    def doc_id(self, doc_num: int) -> str:
+        start, end = int(self.doc_id_offsets[doc_num]), int(self.doc_id_offsets[doc_num + 1])
+        return bytes(self.doc_id_blob[start:end]).decode('utf-8')
+
+    def _postings(self, term: str):
+        target = np.uint64(term_hash(term))
+        i = int(np.searchsorted(self.term_hashes, target))
+        if i >= len(self.term_hashes) or self.term_hashes[i] != target:
+            return None
+        values = decode_varints(self.postings[int(self.offsets[i]):int(self.offsets[i + 1])]).reshape(-1, 2)
+        return np.cumsum(values[:, 0]).astype(np.int64), values[:, 1].astype(np.float32), int(self.doc_freqs[i])
+
+    def search(self, query: str, k: int = 10, mask: Optional[np.ndarray] = None) -> List[Tuple[str, float]]:
+        """Top-k (doc_id, BM25 score) pairs for the query.
+
+        `mask` is a boolean bitmap over doc numbers (e.g. from `FilterIndex.mask`);
+        only documents where it is True can be returned.
+        """
+        if not self.num_documents:
+            return []
+        scores = np.zeros(self.num_documents, dtype=np.float32)
+        lengths = None
+        for term in set(tokenize(query)):
+            postings = self._postings(term)
+            if postings is None:
+                continue
+            docs, tfs, df = postings
+            if lengths is None:
+                lengths = np.asarray(self.doc_lengths, dtype=np.float32) / (self.avg_length or 1.0)
+            idf = math.log(1.0 + (self.num_documents - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * lengths[docs])
+            scores[docs] += idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+
+        if mask is not None:
+            scores *= mask
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind='stable')]
+        return [(self.doc_id(int(doc_num)), float(scores[doc_num])) for doc_num in matched]
+
+
+def lexical_index_path(embedding_dir: str, collection_name: str) -> str:
+    """Where the lexical index of a collection lives inside the store"""
+    return os.path.join(embedding_dir, "lexical", collection_name)
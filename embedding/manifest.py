@@ -0,0 +1,137 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(text: str) -> str:
+    """Stable hash of a chunk's text"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def replace_directory(tmp_path: str, path: str):
+    """Move a fully written `tmp_path` into place at `path`, dropping any previous version"""
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+@dataclass
+class IngestionSummary:
+    """What an ingestion run did to a collection"""
+    added: int = 0
+    updated: int = 0
+    skipped: int = 0
+    deleted: int = 0
+    duplicates: int = 0  # records dropped as (near-)duplicates of earlier ones before embedding
+    stages: dict = field(default_factory=dict)  # per-stage throughput of a parallel run
+    vector_index: dict = field(default_factory=dict)  # recall and size report of a rebuilt quantized index
+
+    @property
+    def embedded(self) -> int:
+        return self.added
+
+    def __str__(self):
+        text = (f"{self.added} embedded, {self.skipped} unchanged, "
+                f"{self.updated} metadata-only updates, {self.deleted} deleted")
+        if self.duplicates:
+            text += f", {self.duplicates} duplicates dropped"
+        return text
+
+
+class IngestionManifest:
+    """Record of what is stored in each collection, kept next to chroma.sqlite3.
+
+    For every collection the manifest stores the embedding model and one entry
+    per chunk id. Chunk ids are derived from the content hash of the chunk text,
+    so an id that is still produced by the chunker with the same model can keep
+    its vector; only the entry metadata (source span) may need refreshing.
+
+    Each collection has its own file, `manifests/<collection>.json`, read on
+    first use and rewritten by `save` only if it changed. A checkpoint
+    therefore costs the size of one collection, and processes ingesting
+    different collections never overwrite each other's entries.
+    """
+
+    DIR_NAME = "manifests"
+    VERSION = 1
+
+    def __init__(self, embedding_dir: str):
+        self.embedding_dir = embedding_dir
+        self._records: Dict[str, dict] = {}
+        self._dirty = set()
+
+    @classmethod
+    def path_for(cls, embedding_dir: str, collection: str) -> str:
+        return os.path.join(embedding_dir, cls.DIR_NAME, f"{collection}.json")
+
+    def path(self, collection: str) -> str:
+        """The file holding `collection`'s record"""
+        return self.path_for(self.embedding_dir, collection)
+
+    def _record(self, collection: str) -> Optional[dict]:
+        if collection not in self._records:
+            record = None
+            path = self.path(collection)
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get("version") == self.VERSION:
+                    record = data
+                else:
+                    logger.warning(f"Ignoring manifest {path} with unsupported version {data.get('version')}")
+            self._records[collection] = record
+        return self._records[collection]
+
+    def generation(self, collection: str) -> int:
+        """Counter bumped every time an ingestion run changes `collection`"""
+        record = self._record(collection)
+        return record["generation"] if record else 0
+
+    def entries(self, collection: str, model_name: Optional[str] = None) -> Dict[str, dict]:
+        """Chunk entries of `collection`, or {} when they were embedded with a different model"""
+        record = self._record(collection)
+        if record is None:
+            return {}
+        if model_name is not None and record.get("model") != model_name:
+            return {}
+        return record["chunks"]
+
+    def model_name(self, collection: str) -> Optional[str]:
+        record = self._record(collection)
+        return record.get("model") if record else None
+
+    def set_entries(self, collection: str, model_name: str, chunks: Dict[str, dict]):
+        self._records[collection] = {
+            "version": self.VERSION,
+            "generation": self.generation(collection),
+            "model": model_name,
+            "chunks": chunks,
+        }
+        self._dirty.add(collection)
+
+    def bump_generation(self, collection: str):
+        if self._record(collection) is None:
+            raise KeyError(f"No manifest record for {collection}")
+        self._records[collection]["generation"] += 1
+        self._dirty.add(collection)
+
+    def save(self):
+        """Write each changed collection's file atomically so a crash never leaves a truncated file"""
+        for collection in sorted(self._dirty):
+            path = self.path(collection)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Unique per process, so concurrent writers never share a temporary file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._records[collection], f)
+            os.replace(tmp_path, path)
+        self._dirty.clear()
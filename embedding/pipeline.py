@@ -0,0 +1,225 @@
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.cache import CachedEmbedder, cache_key
+from embedding.embedders import Embedder
+from observability.metrics import REGISTRY, Gauge
+from observability.tracing import StageClock
+
+logger = logging.getLogger(__name__)
+
+_worker_embedder = None
+
+
+def _init_worker(embedder: Embedder):
+    global _worker_embedder
+    _worker_embedder = embedder
+
+
+def _embed_in_worker(texts: List[str]) -> Tuple[np.ndarray, float]:
+    start = time.perf_counter()
+    vectors = _worker_embedder.embed(texts)
+    return vectors, time.perf_counter() - start
+
+
+@dataclass
+class StageStats:
+    """Items processed by a stage and the time it spent busy"""
+    items: int = 0
+    seconds: float = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "seconds": round(self.seconds, 4),
+            "items_per_second": round(self.items / self.seconds, 2) if self.seconds else None,
+        }
+
+
+class IngestionPipeline:
+    """Staged ingestion: chunk reader -> process pool of embedders -> single batched writer.
+
+    The calling thread reads (id, document, metadata) records and submits
+    `embed_batch_size` documents at a time to `workers` processes. Finished
+    batches go through a bounded queue to one writer thread that upserts
+    `write_batch_size` vectors per `collection.upsert` call. At most
+    `max_pending` embed batches are in flight and at most `max_pending`
+    batches wait for the writer, so a slow stage throttles the reader
+    instead of buffering the corpus in memory.
+
+    After every write the `checkpoint` callback receives the written records,
+    letting the caller persist progress so a crashed run can resume.
+    """
+
+    def __init__(
+        self,
+        collection,
+        embedder: Embedder,
+        workers: int = 2,
+        embed_batch_size: int = 64,
+        write_batch_size: int = 1000,
+        max_pending: Optional[int] = None,
+        checkpoint: Optional[Callable[[List[Tuple[str, str, dict]]], None]] = None,
+    ):
+        if workers < 1:
+            raise ValueError(f"workers must be positive, got {workers}")
+        self.collection = collection
+        # Workers get the bare model; the cache stays in this process so it has a single writer
+        self.cache = embedder.cache if isinstance(embedder, CachedEmbedder) else None
+        self.model_name = embedder.model_name
+        self.worker_embedder = embedder.embedder if isinstance(embedder, CachedEmbedder) else embedder
+        self.workers = workers
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.max_pending = max_pending or 2 * workers
+        self.checkpoint = checkpoint
+        self.stats = {"read": StageStats(), "embed": StageStats(), "write": StageStats()}
+        self.clock = StageClock()
+        self._writer_error = None
+        self._in_flight = deque()
+
+    def _read_batches(self, records: Iterable[Tuple[str, str, dict]]) -> Iterator[List[Tuple[str, str, dict]]]:
+        iterator = iter(records)
+        while True:
+            start = time.perf_counter()
+            batch = []
+            for record in iterator:
+                batch.append(record)
+                if len(batch) == self.embed_batch_size:
+                    break
+            self.stats["read"].seconds += time.perf_counter() - start
+            self.stats["read"].items += len(batch)
+            if not batch:
+                return
+            yield batch
+
+    def _submit(self, pool, batch):
+        documents = [document for _, document, _ in batch]
+        vectors, missing = None, list(range(len(batch)))
+        if self.cache is not None:
+            keys = [cache_key(self.model_name, document) for document in documents]
+            found = self.cache.get_many(keys)
+            if found:
+                vectors = np.zeros((len(batch), next(iter(found.values())).shape[0]), dtype=np.float32)
+                for i, key in enumerate(keys):
+                    if key in found:
+                        vectors[i] = found[key]
+                missing = [i for i, key in enumerate(keys) if key not in found]
+        future = pool.submit(_embed_in_worker, [documents[i] for i in missing]) if missing else None
+        return batch, vectors, missing, future
+
+    def _collect(self, pending, write_queue):
+        batch, vectors, missing, future = pending
+        if future is not None:
+            computed, seconds = future.result()
+            self.stats["embed"].items += len(missing)
+            self.stats["embed"].seconds += seconds
+            self.clock.observe("embed", seconds, len(missing))
+            if vectors is None:
+                vectors = computed
+            else:
+                vectors[missing] = computed
+            if self.cache is not None:
+                self.cache.put_many([cache_key(self.model_name, batch[i][1]) for i in missing], computed)
+        while True:
+            if self._writer_error is not None:
+                raise self._writer_error
+            try:
+                write_queue.put((batch, vectors), timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    def _write(self, records, vectors):
+        start = time.perf_counter()
+        self.collection.upsert(
+            ids=[chunk_id for chunk_id, _, _ in records],
+            documents=[document for _, document, _ in records],
+            metadatas=[metadata for _, _, metadata in records],
+            embeddings=vectors,
+        )
+        elapsed = time.perf_counter() - start
+        self.stats["write"].items += len(records)
+        self.stats["write"].seconds += elapsed
+        self.clock.observe("write", elapsed, len(records))
+        if self.checkpoint is not None:
+            self.checkpoint(records)
+        logger.info(f"Wrote {self.stats['write'].items} chunks")
+
+    def _write_loop(self, write_queue):
+        records, vectors = [], []
+        while True:
+            item = write_queue.get()
+            if self._writer_error is not None:
+                if item is None:
+                    return
+                continue  # keep draining so the reader never blocks on a dead writer
+            try:
+                if item is not None:
+                    records.extend(item[0])
+                    vectors.append(item[1])
+                if records and (item is None or len(records) >= self.write_batch_size):
+                    self._write(records, np.vstack(vectors))
+                    records, vectors = [], []
+            except Exception as e:
+                logger.error(f"Writer failed: {str(e)}")
+                self._writer_error = e
+            if item is None:
+                return
+
+    def run(self, records: Iterable[Tuple[str, str, dict]]) -> dict:
+        """Embed and write all records, returning per-stage throughput"""
+        start = time.perf_counter()
+        write_queue = queue.Queue(maxsize=self.max_pending)
+        # Spawned rather than forked: this process may hold a loaded model, sqlite connections and
+        # library locks that a forked worker would inherit mid-use. The writer thread starts after the pool.
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.worker_embedder,),
+        ) as pool:
+            # Queue depths are exposed only while this run is in progress
+            gauges = [
+                REGISTRY.register(Gauge(
+                    "rag_ingest_queue_depth", "Batches waiting in each ingestion queue",
+                    {"queue": "embed"}, fn=lambda: len(self._in_flight),
+                )),
+                REGISTRY.register(Gauge(
+                    "rag_ingest_queue_depth", "Batches waiting in each ingestion queue",
+                    {"queue": "write"}, fn=lambda: write_queue.qsize(),
+                )),
+            ]
+            writer = threading.Thread(target=self._write_loop, args=(write_queue,), name="ingest-writer", daemon=True)
+            writer.start()
+            try:
+                in_flight = self._in_flight
+                for batch in self._read_batches(records):
+                    in_flight.append(self._submit(pool, batch))
+                    while len(in_flight) >= self.max_pending:
+                        self._collect(in_flight.popleft(), write_queue)
+                while in_flight:
+                    self._collect(in_flight.popleft(), write_queue)
+            finally:
+                write_queue.put(None)
+                writer.join()
+                REGISTRY.unregister(*gauges)
+        if self._writer_error is not None:
+            raise self._writer_error
+
+        wall = time.perf_counter() - start
+        report = {name: stage.as_dict() for name, stage in self.stats.items()}
+        report["embed"]["workers"] = self.workers
+        report["wall_seconds"] = round(wall, 4)
+        report["items_per_second"] = round(self.stats["write"].items / wall, 2) if wall else None
+        logger.info(f"Ingestion pipeline throughput: {report}")
+        return report
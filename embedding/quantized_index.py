@@ -0,0 +1,292 @@
+import os
+import json
+import shutil
+import logging
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.exact_index import IdRows
+from embedding.manifest import replace_directory
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_METHODS = ("int8", "pq")
+
+
+def quantized_index_path(embedding_dir: str, collection_name: str) -> str:
+    """Where the quantized vector index of a collection lives inside the store"""
+    return os.path.join(embedding_dir, "quantized", collection_name)
+
+
+def squared_l2(queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    """Squared L2 distances between every query and every vector, the metric Chroma reports"""
+    return (
+        (queries * queries).sum(axis=1)[:, None]
+        - 2.0 * queries @ vectors.T
+        + (vectors * vectors).sum(axis=1)[None, :]
+    )
+
+
+def _train_codebooks(training: np.ndarray, clusters: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """k-means in every subspace at once: (n, subspaces, sub_dim) -> (subspaces, clusters, sub_dim)"""
+    points = np.ascontiguousarray(training.transpose(1, 0, 2))
+    subspaces, n, _ = points.shape
+    centroids = np.stack([points[j, rng.choice(n, clusters, replace=False)] for j in range(subspaces)])
+    offsets = (np.arange(subspaces) * clusters)[:, None]
+    for _ in range(iterations):
+        distances = (centroids * centroids).sum(axis=2)[:, None, :] - 2.0 * points @ centroids.transpose(0, 2, 1)
+        # Flatten (subspace, cluster) so one bincount per dimension updates every subspace
+        assignment = (np.argmin(distances, axis=2) + offsets).ravel()
+        counts = np.bincount(assignment, minlength=subspaces * clusters).reshape(subspaces, clusters)
+        sums = np.stack([
+            np.bincount(assignment, weights=points[:, :, d].ravel(), minlength=subspaces * clusters)
+            for d in range(points.shape[2])
+        ], axis=1).reshape(subspaces, clusters, -1)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled][:, None]
+    return centroids
+
+
+class QuantizedIndex:
+    """Compressed vector index in memory-mapped files, searched approximately then re-scored exactly.
+
+    "int8" stores every dimension as a byte, scaled between its min and max
+    (4x smaller than float32). "pq" splits vectors into `subspaces` chunks and
+    stores each as the byte id of its nearest of 256 k-means centroids
+    (16x smaller with the default 4 dimensions per chunk).
+
+    Search ranks all codes (or those of the rows a filter selected) by
+    approximate squared L2 distance, then re-scores the best
+    `k * rescore_factor` candidates against the float32 vectors, which stay
+    on disk and are only paged in for those rows. The float file is a second
+    copy of what Chroma stores, so the index costs disk space; what it saves
+    is resident memory, because a retriever serving from it never loads
+    Chroma's HNSW segment.
+    """
+
+    def __init__(self, path: str, rescore_factor: int = 4, block_size: int = 65536):
+        self.path = path
+        self.rescore_factor = rescore_factor
+        self.block_size = block_size
+        with open(os.path.join(path, "meta.json"), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.method = self.meta["method"]
+        self.model_name = self.meta.get("model")
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode='r')
+        self.codes = np.load(os.path.join(path, "codes.npy"), mmap_mode='r')
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode='r')
+        if self.method == "int8":
+            self.scale = np.load(os.path.join(path, "scale.npy"))
+            self.offset = np.load(os.path.join(path, "offset.npy"))
+            self.norms = np.load(os.path.join(path, "norms.npy"), mmap_mode='r')
+        else:
+            self.codebooks = np.load(os.path.join(path, "codebooks.npy"))
+        self.rows = IdRows(self.ids)
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, "meta.json"))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    @classmethod
+    def build(
+        cls,
+        path: str,
+        batches: Iterable[Tuple[List[str], np.ndarray]],
+        method: str = "int8",
+        model_name: Optional[str] = None,
+        subspaces: Optional[int] = None,
+        train_size: int = 10000,
+        iterations: int = 10,
+        seed: int = 0,
+    ) -> "QuantizedIndex":
+        """Write an index from (ids, float vectors) batches, replacing any previous version at `path`"""
+        if method not in QUANTIZATION_METHODS:
+            raise ValueError(f"Unknown quantization method '{method}', expected one of {QUANTIZATION_METHODS}")
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        # First pass: spill float vectors to disk so the corpus never has to fit in memory
+        ids, vector_file = [], os.path.join(tmp_path, "vectors.f32")
+        with open(vector_file, 'wb') as f:
+            for batch_ids, batch_vectors in batches:
+                ids.extend(batch_ids)
+                f.write(np.ascontiguousarray(batch_vectors, dtype=np.float32).tobytes())
+        if not ids:
+            raise ValueError("Cannot build a quantized index without vectors")
+        dimension = os.path.getsize(vector_file) // (4 * len(ids))
+        raw = np.memmap(vector_file, dtype=np.float32, mode='r', shape=(len(ids), dimension))
+        vectors = np.lib.format.open_memmap(
+            os.path.join(tmp_path, "vectors.npy"), mode='w+', dtype=np.float32, shape=raw.shape
+        )
+        vectors[:] = raw
+        vectors.flush()
+        del raw
+        os.remove(vector_file)
+        np.save(os.path.join(tmp_path, "ids.npy"), np.array(ids))
+
+        meta = {"method": method, "model": model_name, "count": len(ids), "dimension": dimension}
+        block = 65536
+        if method == "int8":
+            low = np.full(dimension, np.inf, dtype=np.float32)
+            high = np.full(dimension, -np.inf, dtype=np.float32)
+            for start in range(0, len(ids), block):
+                low = np.minimum(low, vectors[start:start + block].min(axis=0))
+                high = np.maximum(high, vectors[start:start + block].max(axis=0))
+            scale = np.maximum(high - low, 1e-12) / 255.0
+            offset = low + 128.0 * scale  # code -128 decodes to `low`, 127 to `high`
+            codes = np.lib.format.open_memmap(
+                os.path.join(tmp_path, "codes.npy"), mode='w+', dtype=np.int8, shape=(len(ids), dimension)
+            )
+            norms = np.lib.format.open_memmap(
+                os.path.join(tmp_path, "norms.npy"), mode='w+', dtype=np.float32, shape=(len(ids),)
+            )
+            for start in range(0, len(ids), block):
+                chunk = np.clip(np.rint((vectors[start:start + block] - offset) / scale), -128, 127)
+                codes[start:start + block] = chunk
+                decoded = chunk.astype(np.float32) * scale + offset
+                norms[start:start + block] = (decoded * decoded).sum(axis=1)
+            codes.flush()
+            norms.flush()
+            np.save(os.path.join(tmp_path, "scale.npy"), scale.astype(np.float32))
+            np.save(os.path.join(tmp_path, "offset.npy"), offset.astype(np.float32))
+        else:
+            subspaces = subspaces or max(1, dimension // 4)
+            if dimension % subspaces:
+                raise ValueError(f"dimension {dimension} is not divisible into {subspaces} subspaces")
+            sub_dim = dimension // subspaces
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(len(ids), min(train_size, len(ids)), replace=False))
+            training = np.asarray(vectors[sample]).reshape(len(sample), subspaces, sub_dim)
+            clusters = min(256, len(sample))
+            codebooks = _train_codebooks(training, clusters, iterations, rng).astype(np.float32)
+            codes = np.lib.format.open_memmap(
+                os.path.join(tmp_path, "codes.npy"), mode='w+', dtype=np.uint8, shape=(len(ids), subspaces)
+            )
+            for start in range(0, len(ids), block):
+                chunk = np.asarray(vectors[start:start + block]).reshape(-1, subspaces, sub_dim)
+                for j in range(subspaces):
+                    codes[start:start + block, j] = np.argmin(squared_l2(chunk[:, j], codebooks[j]), axis=1)
+            codes.flush()
+            np.save(os.path.join(tmp_path, "codebooks.npy"), codebooks)
+            meta["subspaces"] = subspaces
+        del vectors
+
+        with open(os.path.join(tmp_path, "meta.json"), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        replace_directory(tmp_path, path)
+        logger.info(f"Wrote {method} quantized index with {len(ids)} vectors to {path}")
+        return cls(path)
+
+    def approximate_distances(self, queries: np.ndarray, rows) -> np.ndarray:
+        """Approximate squared L2 distances from each query to the codes in `rows` (a slice or row numbers)"""
+        codes = self.codes[rows]
+        if self.method == "int8":
+            dots = (queries * self.scale) @ codes.T.astype(np.float32) + (queries @ self.offset)[:, None]
+            return (queries * queries).sum(axis=1)[:, None] - 2.0 * dots + self.norms[rows][None, :]
+        subspaces, clusters, sub_dim = self.codebooks.shape
+        parts = queries.reshape(len(queries), subspaces, 1, sub_dim)
+        # Per query and subspace, the distance to every centroid; a code's distance is a sum of lookups
+        tables = ((parts - self.codebooks[None]) ** 2).sum(axis=3)
+        columns = np.arange(subspaces)
+        return np.stack([table[columns, codes].sum(axis=1) for table in tables])
+
+    def search(
+        self, queries: np.ndarray, k: int = 10, rescore: bool = True, rows: Optional[np.ndarray] = None,
+    ) -> Tuple[List[List[str]], List[List[float]]]:
+        """Top-k ids and squared L2 distances per query.
+
+        With `rows`, only those rows are searched (e.g. the chunks a filter selected).
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if rows is not None:
+            rows = np.sort(np.asarray(rows, dtype=np.int64))  # sequential reads from the mapped files
+        count = len(self) if rows is None else len(rows)
+        k = min(k, count)
+        if k < 1:
+            return [[] for _ in queries], [[] for _ in queries]
+        depth = min(count, k * self.rescore_factor) if rescore else k
+        best = np.zeros((len(queries), 0), dtype=np.int64)
+        best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, count, self.block_size):
+            if rows is None:
+                block = np.arange(start, min(start + self.block_size, count))
+                distances = self.approximate_distances(queries, slice(start, start + len(block)))
+            else:
+                block = rows[start:start + self.block_size]
+                distances = self.approximate_distances(queries, block)
+            block_rows = np.broadcast_to(block, distances.shape)
+            best = np.concatenate([best, block_rows], axis=1)
+            best_distances = np.concatenate([best_distances, distances], axis=1)
+            if best.shape[1] > depth:
+                keep = np.argpartition(best_distances, depth - 1, axis=1)[:, :depth]
+                best = np.take_along_axis(best, keep, axis=1)
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+
+        all_ids, all_distances = [], []
+        for i, query in enumerate(queries):
+            candidates, distances = best[i], best_distances[i]
+            if rescore:
+                candidates = np.sort(candidates)  # sequential reads from the float file
+                distances = squared_l2(query[None], np.asarray(self.vectors[candidates]))[0]
+            order = np.argsort(distances, kind='stable')[:k]
+            all_ids.append([str(self.ids[row]) for row in candidates[order]])
+            all_distances.append([float(distance) for distance in distances[order]])
+        return all_ids, all_distances
+
+    def exact_search(self, queries: np.ndarray, k: int = 10) -> List[List[str]]:
+        """Brute-force top-k ids over the float vectors, the baseline for recall"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        k = min(k, len(self))
+        best = np.zeros((len(queries), 0), dtype=np.int64)
+        best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+        for start in range(0, len(self), self.block_size):
+            distances = squared_l2(queries, np.asarray(self.vectors[start:start + self.block_size]))
+            rows = np.broadcast_to(np.arange(start, start + distances.shape[1]), distances.shape)
+            best = np.concatenate([best, rows], axis=1)
+            best_distances = np.concatenate([best_distances, distances], axis=1)
+            if best.shape[1] > k:
+                keep = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best = np.take_along_axis(best, keep, axis=1)
+                best_distances = np.take_along_axis(best_distances, keep, axis=1)
+        order = np.argsort(best_distances, axis=1, kind='stable')
+        return [[str(self.ids[row]) for row in rows] for rows in np.take_along_axis(best, order, axis=1)]
+
+    def recall_report(self, queries: Optional[np.ndarray] = None, k: int = 10, sample: int = 200, seed: int = 0) -> dict:
+        """Recall@k of code-only and re-scored search against exact search, plus memory use.
+
+        Without `queries`, a sample of the stored vectors is used as queries.
+        """
+        if queries is None:
+            rng = np.random.default_rng(seed)
+            rows = np.sort(rng.choice(len(self), min(sample, len(self)), replace=False))
+            queries = np.asarray(self.vectors[rows])
+        k = min(k, len(self))
+        exact = self.exact_search(queries, k)
+        approximate, _ = self.search(queries, k, rescore=False)
+        rescored, _ = self.search(queries, k, rescore=True)
+
+        def recall(found):
+            return round(float(np.mean([len(set(a) & set(b)) / k for a, b in zip(found, exact)])), 4)
+
+        float_bytes = self.vectors.nbytes
+        code_bytes = self.codes.nbytes
+        return {
+            "method": self.method,
+            "vectors": len(self),
+            "queries": len(queries),
+            "k": k,
+            "recall": {"codes": recall(approximate), "rescored": recall(rescored)},
+            "rescore_factor": self.rescore_factor,
+            "float_mb": round(float_bytes / 2**20, 3),
+            "code_mb": round(code_bytes / 2**20, 3),
+            "compression": round(float_bytes / code_bytes, 2),
+        }
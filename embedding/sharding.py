@@ -0,0 +1,54 @@
+import os
+import hashlib
+import logging
+import argparse
+from typing import List
+
+import numpy as np
+
+from embedding.snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(chunk_id: str, shards: int) -> int:
+    """The shard a chunk id belongs to: a stable hash of the id, so every process agrees"""
+    return int.from_bytes(hashlib.blake2b(chunk_id.encode('utf-8'), digest_size=8).digest(), 'big') % shards
+
+
+def shard_path(embedding_dir: str, shard: int, shards: int) -> str:
+    """The store of one shard, itself a complete embedding directory (Chroma, manifest, side indexes)"""
+    return os.path.join(embedding_dir, "shards", f"{shard}-of-{shards}")
+
+
+def split_snapshot(snapshot: Snapshot, shards: int, path: str, batch_size: int = 5000) -> List[Snapshot]:
+    """Partition a snapshot by id hash into `shards` snapshots at `<path>/<shard>`"""
+    if shards < 1:
+        raise ValueError(f"shards must be positive, got {shards}")
+
+    def part(shard):
+        for ids, documents, metadatas, vectors in snapshot.iter_batches(batch_size):
+            keep = [i for i, chunk_id in enumerate(ids) if shard_of(chunk_id, shards) == shard]
+            yield [ids[i] for i in keep], [documents[i] for i in keep], [metadatas[i] for i in keep], vectors[np.asarray(keep, dtype=np.int64)]
+
+    return [
+        Snapshot.write(os.path.join(path, str(shard)), snapshot.collection_name, snapshot.model_name, part(shard), dtype=snapshot.dtype)
+        for shard in range(shards)
+    ]
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    from embedding.data_embedding import DataEmbedding
+
+    parser = argparse.ArgumentParser(description="Partition a collection into shard stores by id hash")
+    parser.add_argument("collection")
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--embedding-dir", default=None)
+    args = parser.parse_args()
+    for path in DataEmbedding(embedding_dir=args.embedding_dir).shard_collection(args.collection, args.shards):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.manifest import replace_directory
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_DTYPES = ("float32", "float16")
+
+# (ids, documents, metadatas, vectors) of consecutive stored chunks
+SnapshotBatch = Tuple[List[str], List[str], List[dict], np.ndarray]
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Snapshot:
+    """A collection exported as compact columnar files, loadable without embedding calls.
+
+    A snapshot directory holds:
+
+    - `records.parquet`: `id`, `document` and `metadata` (JSON) columns, zstd-compressed
+    - `vectors.bin`: the vectors as one raw row-major float32 or float16 matrix,
+      in the same row order
+    - `manifest.json`: collection, embedding model, dtype, shape and checksum
+
+    Unlike a copy of `chroma.sqlite3` and the HNSW segment, it does not depend on
+    Chroma's on-disk layout or version, and it carries each vector once rather
+    than in both the SQLite log and the graph.
+    """
+
+    RECORDS = "records.parquet"
+    VECTORS = "vectors.bin"
+    MANIFEST = "manifest.json"
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, self.MANIFEST), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {self.meta.get('version')} in {path}")
+        self.collection_name = self.meta["collection"]
+        self.model_name = self.meta["model"]
+        self.dtype = self.meta["dtype"]
+        self.count = self.meta["count"]
+        self.dimension = self.meta["dimension"]
+        expected = self.count * self.dimension * np.dtype(self.dtype).itemsize
+        if os.path.getsize(os.path.join(path, self.VECTORS)) != expected:
+            raise ValueError(f"Snapshot {path} is truncated: {self.VECTORS} should hold {expected} bytes")
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        return os.path.exists(os.path.join(path, cls.MANIFEST))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """The vector matrix, memory-mapped"""
+        if self.count == 0:
+            return np.empty((0, self.dimension), dtype=self.dtype)
+        return np.memmap(os.path.join(self.path, self.VECTORS), dtype=self.dtype, mode='r', shape=(self.count, self.dimension))
+
+    def verify(self):
+        """Raise ValueError if the vector blob does not match the checksum taken at export"""
+        if _sha256(os.path.join(self.path, self.VECTORS)) != self.meta["vectors_sha256"]:
+            raise ValueError(f"Snapshot {self.path} is corrupt: {self.VECTORS} checksum mismatch")
+
+    def iter_batches(self, batch_size: int = 5000) -> Iterator[SnapshotBatch]:
+        """Stream the snapshot in batches, with vectors widened to float32"""
+        import pyarrow.parquet as pq
+
+        vectors, start = self.vectors, 0
+        for batch in pq.ParquetFile(os.path.join(self.path, self.RECORDS)).iter_batches(batch_size=batch_size):
+            stop = start + batch.num_rows
+            yield (
+                batch.column("id").to_pylist(),
+                batch.column("document").to_pylist(),
+                [json.loads(metadata) for metadata in batch.column("metadata").to_pylist()],
+                np.asarray(vectors[start:stop], dtype=np.float32),
+            )
+            start = stop
+
+    @classmethod
+    def write(
+        cls,
+        path: str,
+        collection_name: str,
+        model_name: Optional[str],
+        batches: Iterable[SnapshotBatch],
+        dtype: str = "float32",
+    ) -> "Snapshot":
+        """Write a snapshot from batches of stored chunks, replacing any previous version at `path`"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if dtype not in SNAPSHOT_DTYPES:
+            raise ValueError(f"Unknown snapshot dtype '{dtype}', expected one of {SNAPSHOT_DTYPES}")
+        tmp_path = path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        schema = pa.schema([("id", pa.string()), ("document", pa.string()), ("metadata", pa.string())])
+        count, dimension = 0, 0
+        with pq.ParquetWriter(os.path.join(tmp_path, cls.RECORDS), schema, compression='zstd') as records, \
+                open(os.path.join(tmp_path, cls.VECTORS), 'wb') as vectors:
+            for ids, documents, metadatas, batch_vectors in batches:
+                if not ids:
+                    continue
+                batch_vectors = np.ascontiguousarray(batch_vectors, dtype=dtype)
+                if dimension and batch_vectors.shape[1] != dimension:
+                    raise ValueError(f"Vector dimension changed from {dimension} to {batch_vectors.shape[1]} mid-snapshot")
+                dimension = batch_vectors.shape[1]
+                records.write_batch(pa.record_batch(
+                    [ids, documents, [json.dumps(metadata or {}) for metadata in metadatas]], schema=schema
+                ))
+                vectors.write(batch_vectors.tobytes())
+                count += len(ids)
+
+        meta = {
+            "version": SNAPSHOT_VERSION,
+            "collection": collection_name,
+            "model": model_name,
+            "dtype": dtype,
+            "count": count,
+            "dimension": dimension,
+            "vectors_sha256": _sha256(os.path.join(tmp_path, cls.VECTORS)),
+        }
+        with open(os.path.join(tmp_path, cls.MANIFEST), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        replace_directory(tmp_path, path)
+        logger.info(f"Wrote {dtype} snapshot of {collection_name} with {count} chunks to {path}")
+        return cls(path)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    from embedding.data_embedding import DataEmbedding
+
+    parser = argparse.ArgumentParser(description="Export a collection to a snapshot, or rebuild one from it")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("path", help="Snapshot directory")
+    parser.add_argument("--collection", default=None, help="Collection to export, or to import into (default: the snapshot's)")
+    parser.add_argument("--embedding-dir", default=None)
+    parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="float32", help="Vector precision of an export")
+    args = parser.parse_args()
+
+    embedder = DataEmbedding(embedding_dir=args.embedding_dir)
+    if args.action == "export":
+        embedder.export_snapshot(args.collection or "text_embeddings", args.path, dtype=args.dtype)
+    else:
+        print(embedder.import_snapshot(args.path, collection_name=args.collection))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,166 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import time
 
-app = FastAPI()
+_IMPORT_START = time.perf_counter()
 
-class Query(BaseModel):
-    text: str
+import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Literal, Optional, Tuple, Union
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, field_validator, model_validator
+
+from observability.metrics import REGISTRY, Gauge
+from observability.profiler import SamplingProfiler
+from observability.startup import StartupProfile
+from observability.tracing import QUERY_STAGES, timed
+from retrieval.diversify import adiversify
+from retrieval.filters import parse_filters
+from retrieval.retriever import Retriever, ids_only
+from retrieval.router import CollectionRouter
+from retrieval.shards import ShardedRouter, ShardError
+from retrieval.streaming import MEDIA_TYPES, dumps, stream_hits
+
+# Only serving dependencies are imported here; ingestion code (datasets, model stacks) loads lazily
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_START
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up(app: FastAPI, profile: StartupProfile):
+    """Open the store, load the model and run dummy queries, then mark the app ready"""
+    from dotenv import load_dotenv
+
+    try:
+        with profile.stage("load_dotenv"):
+            load_dotenv()
+        with profile.stage("open_store"):
+            # With SHARDS set, queries are scattered to shard worker processes instead of a local store
+            if os.getenv('SHARDS'):
+                router = ShardedRouter()
+                app.state.retriever = None
+            else:
+                router = CollectionRouter()
+                app.state.retriever = router.get()
+            app.state.router = router
+        router.warmup(profile)
+        profile.mark_ready()
+    except Exception as e:
+        logger.exception("Warmup failed")
+        profile.error = f"{type(e).__name__}: {e}"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm up once per worker process, off the event loop so /health answers meanwhile;
+    # /ready and the query endpoints return 503 until warmup has finished
+    profile = StartupProfile(started_at=_IMPORT_START)
+    profile.record("imports", _IMPORT_SECONDS)
+    app.state.startup = profile
+    app.state.router = None
+    app.state.retriever = None
+    app.state.profiler = SamplingProfiler.from_env()
+    warmup = asyncio.create_task(asyncio.to_thread(warm_up, app, profile))
+    yield
+    await warmup
+    if app.state.router is not None:
+        await app.state.router.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# Registered once and read from the running app, so restarting the lifespan keeps a single gauge
+REGISTRY.register(Gauge(
+    "rag_ready", "1 once warmup has finished",
+    fn=lambda: int(getattr(app.state, "startup", None) is not None and app.state.startup.ready),
+))
+
+@app.middleware("http")
+async def profile_slow_requests(request: Request, call_next):
+    # With PROFILE_SLOW_MS set, requests slower than it dump sampled stacks (streamed bodies are not covered)
+    profiler = getattr(request.app.state, "profiler", None)
+    if profiler is None:
+        return await call_next(request)
+    with profiler.profile(f"{request.method} {request.url.path}"):
+        return await call_next(request)
+
+@app.exception_handler(ShardError)
+async def shards_unavailable(request: Request, e: ShardError):
+    return JSONResponse({"detail": str(e)}, status_code=503)
+
+def ready_retriever(request: Request) -> Optional[Retriever]:
+    # None when serving from shards
+    if not request.app.state.startup.ready:
+        raise HTTPException(status_code=503, detail="Warming up")
+    return request.app.state.retriever
+
+async def route(request: Request, target: "Routed") -> Tuple[Union[CollectionRouter, ShardedRouter], List[str]]:
+    """The router and the collections a request targets, opening them if needed"""
+    ready_retriever(request)
+    router = request.app.state.router
+
+    def open_collections() -> List[str]:
+        names = router.resolve(target.collection, target.collections, target.tenant)
+        for name in names:
+            router.get(name)
+        return names
+
+    try:
+        # Opening a cold collection (Chroma, side indexes) or asking shards blocks; keep it off the event loop
+        names = await asyncio.to_thread(open_collections)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except PermissionError as e:
+        raise HTTPException(status_code=403, detail=str(e))
+    return router, names
+
+class Routed(BaseModel):
+    # One collection, several to search together, or a tenant's collections (default COLLECTION_NAME)
+    collection: Optional[str] = Field(None, min_length=1)
+    collections: Optional[List[str]] = Field(None, min_length=1)
+    tenant: Optional[str] = Field(None, min_length=1)
+
+    @model_validator(mode="after")
+    def check_collections(self):
+        if self.collection is not None and self.collections is not None:
+            raise ValueError("Set either collection or collections, not both")
+        return self
+
+class DocumentsRequest(Routed):
+    ids: List[str] = Field(..., min_length=1, max_length=1000)
+
+class Query(Routed):
+    text: str = Field(..., min_length=1)
+    k: int = Field(5, ge=1, le=100)
+    # Reciprocal-rank fusion weights; any lexical weight turns on hybrid BM25 + vector search
+    vector_weight: float = Field(1.0, ge=0)
+    lexical_weight: float = Field(0.0, ge=0)
+    # Stream hits as NDJSON lines or Server-Sent Events instead of one JSON body
+    stream: Optional[Literal["ndjson", "sse"]] = None
+    # False returns only ids and scores; documents can be fetched later from /documents
+    include_documents: bool = True
+    # Reorder candidates with the cross-encoder, giving up after the budget (default RERANK_BUDGET_MS)
+    rerank: bool = False
+    rerank_budget_ms: Optional[float] = Field(None, gt=0)
+    # Pick k diverse hits from deeper candidates by maximal marginal relevance (1.0 = relevance only)
+    diversify: bool = False
+    mmr_lambda: float = Field(0.5, ge=0, le=1)
+    # Metadata conditions, e.g. {"title": "Normans", "ingest_time": {"$gte": 1700000000}}
+    filters: Optional[Dict[str, Any]] = None
+
+    @field_validator("filters")
+    @classmethod
+    def check_filters(cls, filters):
+        if filters:
+            parse_filters(filters)
+        return filters or None
+
+    @model_validator(mode="after")
+    def check_weights(self):
+        if self.vector_weight == 0 and self.lexical_weight == 0:
+            raise ValueError("vector_weight and lexical_weight cannot both be 0")
+        return self
 
 def preprocess_query(query_text):
     # Implement preprocessing logic here
@@ -12,7 +168,92 @@ def preprocess_query(query_text):
     return preprocessed_text
 
 @app.post("/query")
-async def handle_query(query: Query):
-    preprocessed_text = preprocess_query(query.text)
-    # Proceed to the retrieval layer with the preprocessed query
-    return {"preprocessed_query": preprocessed_text}
\ No newline at end of file
+async def handle_query(query: Query, request: Request):
+    router, collections = await route(request, query)
+    mode = "hybrid" if query.lexical_weight > 0 else "vector"
+    REGISTRY.counter("rag_query_requests_total", "Queries served by retrieval mode", {"mode": mode}).inc()
+    with timed(QUERY_STAGES, "preprocess"):
+        preprocessed_text = preprocess_query(query.text)
+    # A stream searches ids and scores only, sends every hit, then loads documents page by page;
+    # reranking needs the documents up front and scores a deeper candidate list
+    include_documents = query.rerank or (query.include_documents and query.stream is None)
+    k = max(query.k, router.rerank_depth) if query.rerank else query.k
+    if query.diversify:
+        k = max(k, int(os.getenv('DIVERSIFY_DEPTH', '20')))
+    if query.lexical_weight > 0:
+        results = await router.ahybrid_search(
+            collections,
+            preprocessed_text,
+            k=k,
+            vector_weight=query.vector_weight,
+            lexical_weight=query.lexical_weight,
+            include_documents=include_documents,
+            filters=query.filters,
+        )
+    else:
+        results = await router.asearch(collections, preprocessed_text, k=k, include_documents=include_documents, filters=query.filters)
+
+    header = {"preprocessed_query": preprocessed_text}
+    failed = getattr(results, "failed", None)
+    if failed is not None:
+        # Sharded search: name the shards whose hits are missing
+        header["shards"] = {"total": len(router.addresses), "failed": failed}
+    if query.diversify:
+        # Diversify down to k first; reranking then only orders the chosen hits
+        results, header["diversified"] = await adiversify(
+            router, preprocessed_text, results, query.k, query.mmr_lambda, collections=collections,
+        )
+    if query.rerank:
+        results, header["reranked"] = await router.arerank(preprocessed_text, results, query.rerank_budget_ms)
+        results = results[:query.k]
+        if not query.include_documents:
+            results = ids_only(results)
+
+    if query.stream is not None:
+        async def fetch(ids):
+            by_collection = {}
+            for doc_id in ids:
+                by_collection.setdefault(owners.get(doc_id, collections[0]), []).append(doc_id)
+            return await router.afetch(by_collection)
+
+        owners = {hit["id"]: hit["collection"] for hit in results if "collection" in hit}
+        return StreamingResponse(
+            stream_hits(
+                header,
+                results,
+                query.stream,
+                fetch=fetch if query.include_documents else None,
+                page_size=int(os.getenv('STREAM_PAGE_SIZE', '16')),
+            ),
+            media_type=MEDIA_TYPES[query.stream],
+        )
+    with timed(QUERY_STAGES, "serialize"):
+        body = dumps({**header, "results": results})
+    return Response(body, media_type="application/json")
+
+@app.post("/documents")
+async def handle_documents(body: DocumentsRequest, request: Request):
+    router, collections = await route(request, body)
+    found = await router.afetch({name: body.ids for name in collections})
+    return {"documents": [{"id": doc_id, **found[doc_id]} for doc_id in body.ids if doc_id in found]}
+
+@app.get("/health")
+async def handle_health():
+    return {"status": "ok"}
+
+@app.get("/ready")
+async def handle_ready(request: Request):
+    startup = request.app.state.startup.snapshot()
+    return JSONResponse(startup, status_code=200 if startup["ready"] else 503)
+
+@app.get("/metrics")
+async def handle_metrics():
+    # Prometheus text format; served during warmup too, so scrapes see startup progress
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/stats")
+async def handle_stats(request: Request):
+    ready_retriever(request)
+    router = request.app.state.router
+    stats = await asyncio.to_thread(router.stats)
+    return {"startup": request.app.state.startup.snapshot(), **stats}
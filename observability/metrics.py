@@ -0,0 +1,187 @@
+import bisect
+import threading
+from typing import Callable, Dict, Iterable, Optional
+
+# Latency buckets in seconds, from sub-millisecond to several seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, named with a `_total` suffix by convention.
+
+    `fn` makes it read its value from existing stats at scrape time.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None, fn: Optional[Callable[[], float]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.fn = fn
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self.fn() if self.fn is not None else self._value
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Gauge(Counter):
+    """Value that can go up and down, e.g. a queue depth"""
+
+    kind = "gauge"
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+    def samples(self):
+        yield self.name, self.labels, self.value
+
+
+class Histogram:
+    """Thread-safe bucketed histogram with Prometheus-style cumulative buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, buckets: Iterable[float], description: str = "", labels: Optional[Dict[str, str]] = None):
+        self.name = name
+        self.description = description
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def snapshot(self) -> dict:
+        """Cumulative counts per upper bound, plus total count and sum"""
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        cumulative = {}
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative["+Inf" if bound == float("inf") else repr(bound)] = running
+        return {"buckets": cumulative, "count": count, "sum": total}
+
+    def samples(self):
+        with self._lock:
+            counts = list(self._counts)
+            total, count = self._sum, self._count
+        running = 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            yield self.name + "_bucket", {**self.labels, "le": _format_value(float(bound))}, running
+        yield self.name + "_sum", self.labels, total
+        yield self.name + "_count", self.labels, count
+
+
+class MetricsRegistry:
+    """Process-wide set of metrics rendered in the Prometheus text exposition format.
+
+    Metrics are keyed by name and labels. Getting a metric that exists
+    returns it, so instrumented code can look metrics up where it uses them;
+    `register` replaces an existing metric, so a component that owns its
+    metrics (e.g. one retriever's batcher) exposes the latest instance, and
+    `unregister`s them when it closes so the registry does not keep it alive.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name: str, labels: Optional[Dict[str, str]]) -> tuple:
+        return name, tuple(sorted((labels or {}).items()))
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[self._key(metric.name, metric.labels)] = metric
+        return metric
+
+    def unregister(self, *metrics):
+        """Remove `metrics`, leaving any newer metric registered under the same name and labels"""
+        with self._lock:
+            for metric in metrics:
+                key = self._key(metric.name, metric.labels)
+                if self._metrics.get(key) is metric:
+                    del self._metrics[key]
+
+    def _get_or_create(self, name: str, labels: Optional[Dict[str, str]], factory):
+        key = self._key(name, labels)
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = factory()
+            return metric
+
+    def counter(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None) -> Counter:
+        return self._get_or_create(name, labels, lambda: Counter(name, description, labels))
+
+    def gauge(self, name: str, description: str = "", labels: Optional[Dict[str, str]] = None) -> Gauge:
+        return self._get_or_create(name, labels, lambda: Gauge(name, description, labels))
+
+    def histogram(self, name: str, buckets: Iterable[float] = LATENCY_BUCKETS, description: str = "", labels: Optional[Dict[str, str]] = None) -> Histogram:
+        return self._get_or_create(name, labels, lambda: Histogram(name, buckets, description, labels))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines, described = [], set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                if metric.description:
+                    lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample_name, labels, value in metric.samples():
+                lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
@@ -0,0 +1,118 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _folded_stack(thread_name: str, frame) -> str:
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join([thread_name] + labels[::-1])
+
+
+class SamplingProfiler:
+    """Samples every thread's stack while profiled requests run and dumps the slow ones.
+
+    A background thread wakes every `interval_ms` while at least one
+    `profile()` block is open and counts the current stack of each thread,
+    except the samplers'. A block that took at least `threshold_ms` writes the
+    stacks sampled during it to `<output_dir>/<timestamp>-<ms>ms-<name>.folded`
+    in the folded format (`frame;frame;frame count`) read by flamegraph.pl
+    and speedscope. Samples cover the whole process, so overlapping requests
+    share stacks. Only the newest `max_files` dumps are kept.
+    """
+
+    def __init__(self, output_dir: str, threshold_ms: float, interval_ms: float = 5.0, max_files: int = 100):
+        if interval_ms <= 0:
+            raise ValueError(f"interval_ms must be positive, got {interval_ms}")
+        self.output_dir = output_dir
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000.0
+        self.max_files = max_files
+        self._sessions = {}
+        self._next_session = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._thread = None
+
+    @classmethod
+    def from_env(cls) -> Optional["SamplingProfiler"]:
+        """A profiler configured by PROFILE_SLOW_MS, PROFILE_DIR and PROFILE_INTERVAL_MS, or None when unset"""
+        threshold = os.getenv('PROFILE_SLOW_MS')
+        if not threshold:
+            return None
+        return cls(
+            os.getenv('PROFILE_DIR', os.path.join('data', 'profiles')),
+            threshold_ms=float(threshold),
+            interval_ms=float(os.getenv('PROFILE_INTERVAL_MS', '5')),
+        )
+
+    def _ensure_sampler(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+
+    def _sample_loop(self):
+        while True:
+            with self._lock:
+                while not self._sessions:
+                    self._wake.wait()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            stacks = [
+                _folded_stack(names.get(ident, str(ident)), frame)
+                for ident, frame in sys._current_frames().items() if names.get(ident) != "sampling-profiler"
+            ]
+            with self._lock:
+                for samples in self._sessions.values():
+                    samples.update(stacks)
+            time.sleep(self.interval)
+
+    @contextmanager
+    def profile(self, name: str):
+        """Sample stacks while the block runs; dump them if it ran past the threshold"""
+        with self._lock:
+            session = self._next_session
+            self._next_session += 1
+            self._sessions[session] = Counter()
+            self._ensure_sampler()
+            self._wake.notify()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                samples = self._sessions.pop(session)
+            if elapsed_ms >= self.threshold_ms and samples:
+                self.dump(name, elapsed_ms, samples)
+
+    def dump(self, name: str, elapsed_ms: float, samples: Counter) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        slug = "".join(c if c.isalnum() or c in "-_" else "_" for c in name.strip("/")) or "root"
+        now = time.time()
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(now)) + f".{int(now * 1000) % 1000:03d}"
+        path = os.path.join(self.output_dir, f"{stamp}-{elapsed_ms:.0f}ms-{slug}.folded")
+        with open(path, "w") as f:
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        logger.warning(f"Slow request {name} took {elapsed_ms:.0f}ms, stacks written to {path}")
+        self._prune()
+        return path
+
+    def _prune(self):
+        dumps = sorted(name for name in os.listdir(self.output_dir) if name.endswith(".folded"))
+        for name in dumps[:-self.max_files] if self.max_files > 0 else []:
+            os.remove(os.path.join(self.output_dir, name))
@@ -0,0 +1,42 @@
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StartupProfile:
+    """Wall time of each named startup stage, in the order they ran"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = time.perf_counter() if started_at is None else started_at
+        self.stages: Dict[str, float] = {}
+        self.ready_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def record(self, name: str, seconds: float):
+        self.stages[name] = round(seconds, 4)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark_ready(self):
+        self.ready_at = time.perf_counter()
+        logger.info(f"Ready after {self.ready_at - self.started_at:.3f}s: {self.stages}")
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def snapshot(self) -> dict:
+        end = self.ready_at if self.ready else time.perf_counter()
+        snapshot = {"ready": self.ready, "stages": dict(self.stages), "total_seconds": round(end - self.started_at, 4)}
+        if self.error is not None:
+            snapshot["error"] = self.error
+        return snapshot
@@ -0,0 +1,91 @@
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator, TypeVar
+
+from observability.metrics import LATENCY_BUCKETS, REGISTRY, Histogram
+
+T = TypeVar("T")
+
+QUERY_STAGES = "rag_query_stage_seconds"
+INGEST_STAGES = "rag_ingest_stage_seconds"
+INGEST_ITEMS = "rag_ingest_items_total"
+
+_DESCRIPTIONS = {
+    QUERY_STAGES: "Time spent in each stage of serving a query",
+    INGEST_STAGES: "Time spent in each ingestion stage, per call or batch",
+}
+
+
+def stage_histogram(family: str, stage: str) -> Histogram:
+    """The histogram of one stage in a family such as QUERY_STAGES"""
+    return REGISTRY.histogram(family, LATENCY_BUCKETS, _DESCRIPTIONS.get(family, ""), {"stage": stage})
+
+
+def register_stage(family: str, stage: str) -> Histogram:
+    """A fresh histogram for `stage`, replacing any registered one; for components that own their timings"""
+    return REGISTRY.register(Histogram(family, LATENCY_BUCKETS, _DESCRIPTIONS.get(family, ""), {"stage": stage}))
+
+
+@contextmanager
+def timed(family: str, stage: str):
+    """Observe the wall time of the enclosed block as `stage` of `family`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_histogram(family, stage).observe(time.perf_counter() - start)
+
+
+class StageClock:
+    """Exclusive time of nested stages in one thread.
+
+    Ingestion stages are chained generators: pulling a chunk pulls rows from
+    the reader. Time spent in an inner stage is subtracted from the stage that
+    called it, so "chunk" does not also count the reads it triggered.
+    """
+
+    def __init__(self, family: str = INGEST_STAGES):
+        self.family = family
+        self._child_seconds = []
+
+    def _exit(self, name: str, start: float, items: int, observe: bool = True):
+        elapsed = time.perf_counter() - start
+        children = self._child_seconds.pop()
+        if self._child_seconds:
+            self._child_seconds[-1] += elapsed
+        if observe:
+            self.observe(name, elapsed - children, items)
+
+    @contextmanager
+    def stage(self, name: str, items: int = 1):
+        start = time.perf_counter()
+        self._child_seconds.append(0.0)
+        try:
+            yield
+        finally:
+            self._exit(name, start, items)
+
+    def observe(self, name: str, seconds: float, items: int = 1):
+        stage_histogram(self.family, name).observe(seconds)
+        if items:
+            REGISTRY.counter(INGEST_ITEMS, "Items processed by each ingestion stage", {"stage": name}).inc(items)
+
+    def iterate(self, iterable: Iterable[T], name: str) -> Iterator[T]:
+        """Yield from `iterable`, timing every step as one item of stage `name`.
+
+        The final step that finds the iterable exhausted is not observed.
+        """
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            self._child_seconds.append(0.0)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self._exit(name, start, 0, observe=False)
+                return
+            except BaseException:
+                self._exit(name, start, 0, observe=False)
+                raise
+            self._exit(name, start, 1)
+            yield item
@@ -0,0 +1,125 @@
+import time
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional
+
+from observability.metrics import LATENCY_BUCKETS, REGISTRY, SIZE_BUCKETS, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Coalesce concurrent async requests into batched calls of a blocking function.
+
+    Items submitted while the collector is waiting are gathered for up to
+    `max_wait_ms` or until `max_batch_size` items arrive, then handed to
+    `process_batch` (which must return one result per item) on `executor`.
+    Results are fanned back out to the awaiting callers. Batches are
+    dispatched without waiting for the previous one to finish, so batching
+    only adds latency when the executor is already busy.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+        name: str = "batch",
+        labels: Optional[Dict[str, str]] = None,
+    ):
+        if max_batch_size < 1:
+            raise ValueError(f"max_batch_size must be positive, got {max_batch_size}")
+        if max_wait_ms < 0:
+            raise ValueError(f"max_wait_ms must be non-negative, got {max_wait_ms}")
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.batch_size_histogram = REGISTRY.register(
+            Histogram(f"rag_{name}_size", SIZE_BUCKETS, "Items per dispatched batch", labels)
+        )
+        self.batch_latency_histogram = REGISTRY.register(
+            Histogram(f"rag_{name}_latency_seconds", LATENCY_BUCKETS, "Time to process one batch", labels)
+        )
+        self._metrics = [self.batch_size_histogram, self.batch_latency_histogram, REGISTRY.register(Gauge(
+            f"rag_{name}_queue_depth", "Items waiting for the collector", labels,
+            fn=lambda: self._queue.qsize() if self._queue is not None else 0,
+        ))]
+        self._loop = None
+        self._queue = None
+        self._collector = None
+        self._dispatches = set()
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._collector = loop.create_task(self._collect())
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        self._ensure_started()
+        future = self._loop.create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = self._loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - self._loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = self._loop.create_task(self._dispatch(batch))
+            self._dispatches.add(task)
+            task.add_done_callback(self._dispatches.discard)
+
+    async def _dispatch(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        self.batch_size_histogram.observe(len(items))
+        start = time.perf_counter()
+        try:
+            results = await self._loop.run_in_executor(self.executor, self.process_batch, items)
+        except Exception as e:
+            logger.error(f"Batch of {len(items)} failed: {str(e)}")
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.batch_latency_histogram.observe(time.perf_counter() - start)
+
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "batch_latency_seconds": self.batch_latency_histogram.snapshot(),
+        }
+
+    def unregister_metrics(self):
+        """Drop this batcher's series from the registry"""
+        REGISTRY.unregister(*self._metrics)
+
+    async def close(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+        self.unregister_metrics()
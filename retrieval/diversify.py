@@ -0,0 +1,93 @@
+import os
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from observability.metrics import REGISTRY
+from observability.tracing import QUERY_STAGES, timed
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def mmr(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int,
+    mmr_lambda: float = 0.5,
+    duplicate_threshold: float = 1.0,
+) -> Tuple[List[int], int]:
+    """Maximal marginal relevance: pick k candidates that are relevant and unlike each other.
+
+    Each step takes the candidate maximizing
+    `mmr_lambda * sim(query, c) - (1 - mmr_lambda) * max sim(c, selected)`,
+    with cosine similarities computed once as matrix products. Candidates at
+    least `duplicate_threshold` similar to a selected one are dropped as
+    near-duplicates. Returns the selected row numbers, in selection order,
+    and how many candidates were dropped.
+    """
+    if not len(candidates) or k < 1:
+        return [], 0
+    candidates = _normalize(np.asarray(candidates, dtype=np.float32))
+    relevance = candidates @ _normalize(np.asarray(query, dtype=np.float32))
+    similarity = candidates @ candidates.T
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+    selected, duplicates = [], 0
+    while len(selected) < k and available.any():
+        scores = np.where(available, mmr_lambda * relevance - (1 - mmr_lambda) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        near = available & (similarity[best] >= duplicate_threshold)
+        duplicates += int(near.sum())
+        available &= ~near
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected, duplicates
+
+
+async def adiversify(
+    router,
+    text: str,
+    hits: List[dict],
+    k: int,
+    mmr_lambda: float = 0.5,
+    duplicate_threshold: Optional[float] = None,
+    collections: Optional[List[str]] = None,
+) -> Tuple[List[dict], Dict[str, int]]:
+    """Reduce retrieved hits to k diverse ones with `mmr` over their stored vectors.
+
+    `router` is a `CollectionRouter` or `ShardedRouter`; its `avectors` gives
+    the query vector and the hits' vectors. Hits are grouped by their
+    `collection` tag; untagged hits, which come from a single-collection
+    search, belong to `collections[0]` (default: the router's default
+    collection). Candidates at
+    least `duplicate_threshold` (default: DIVERSIFY_DUPLICATE, or 0.95)
+    cosine-similar to a chosen hit are removed. Returns the hits and a report
+    of how many candidates were considered and how many removed as duplicates.
+    """
+    if duplicate_threshold is None:
+        duplicate_threshold = float(os.getenv('DIVERSIFY_DUPLICATE', '0.95'))
+    report = {"candidates": len(hits), "duplicates_removed": 0}
+    if not hits:
+        return hits, report
+    searched = collections[0] if collections else router.default_collection
+    ids_by_collection = {}
+    for hit in hits:
+        ids_by_collection.setdefault(hit.get("collection", searched), []).append(hit["id"])
+    query, vectors = await router.avectors(text, ids_by_collection)
+    with timed(QUERY_STAGES, "diversify"):
+        known = [hit for hit in hits if hit["id"] in vectors]
+        chosen, duplicates = mmr(query, np.array([vectors[hit["id"]] for hit in known]), k, mmr_lambda, duplicate_threshold)
+        diversified = [known[i] for i in chosen]
+        # Hits whose vectors are gone (e.g. deleted meanwhile) only fill up a short list
+        diversified += [hit for hit in hits if hit["id"] not in vectors][:k - len(diversified)]
+    report["duplicates_removed"] = duplicates
+    if duplicates:
+        REGISTRY.counter("rag_diversify_duplicates_total", "Near-duplicate hits removed by diversification").inc(duplicates)
+    return diversified, report
@@ -0,0 +1,51 @@
+from typing import Any, Dict, List, Tuple
+
+# Chroma's field operators; conditions on different fields are combined with AND
+OPERATORS = ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte", "$in", "$nin")
+RANGE_OPERATORS = ("$gt", "$gte", "$lt", "$lte")
+
+Condition = Tuple[str, str, Any]
+
+
+def _check_scalar(field: str, value: Any):
+    if not isinstance(value, (str, int, float, bool)):
+        raise ValueError(f"Filter value for '{field}' must be a string, number or boolean, got {type(value).__name__}")
+
+
+def parse_filters(filters: Dict[str, Any]) -> List[Condition]:
+    """Validate a metadata filter and return it as (field, operator, value) conditions.
+
+    `{"title": "Normans"}` is shorthand for `{"title": {"$eq": "Normans"}}`.
+    A field may carry several operators, e.g. `{"row": {"$gte": 10, "$lt": 20}}`.
+    """
+    if not isinstance(filters, dict):
+        raise ValueError("Filters must be an object mapping metadata fields to conditions")
+    conditions = []
+    for field, condition in filters.items():
+        if field.startswith("$"):
+            raise ValueError(f"Unsupported filter key '{field}'; conditions on several fields are combined with AND")
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        if not condition:
+            raise ValueError(f"Empty condition for '{field}'")
+        for operator, value in condition.items():
+            if operator not in OPERATORS:
+                raise ValueError(f"Unknown filter operator '{operator}', expected one of {OPERATORS}")
+            if operator in ("$in", "$nin"):
+                if not isinstance(value, list) or not value:
+                    raise ValueError(f"{operator} for '{field}' needs a non-empty list")
+                for item in value:
+                    _check_scalar(field, item)
+            elif operator in RANGE_OPERATORS:
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"{operator} for '{field}' needs a number")
+            else:
+                _check_scalar(field, value)
+            conditions.append((field, operator, value))
+    return conditions
+
+
+def chroma_where(conditions: List[Condition]) -> Dict[str, Any]:
+    """The equivalent Chroma `where` clause"""
+    clauses = [{field: {operator: value}} for field, operator, value in conditions]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
@@ -0,0 +1,27 @@
+from collections import defaultdict
+from typing import List, Optional, Sequence, Tuple
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]],
+    weights: Optional[Sequence[float]] = None,
+    k: int = 60,
+) -> List[Tuple[str, float]]:
+    """Fuse ranked id lists into one ranking by weighted reciprocal rank.
+
+    An id scores sum(weight / (k + rank)) over the lists it appears in, with
+    ranks starting at 1. Only ranks are used, so BM25 scores and vector
+    distances never need to be put on a common scale. Ties keep the order in
+    which ids were first seen.
+    """
+    if weights is None:
+        weights = [1.0] * len(rankings)
+    if len(weights) != len(rankings):
+        raise ValueError(f"Got {len(weights)} weights for {len(rankings)} rankings")
+    scores = defaultdict(float)
+    for ranking, weight in zip(rankings, weights):
+        if weight <= 0:
+            continue
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
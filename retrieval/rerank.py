@@ -0,0 +1,201 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from embedding.cache import cache_key
+from embedding.lexical_index import tokenize
+from observability.metrics import REGISTRY, Counter
+from observability.tracing import QUERY_STAGES, register_stage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CROSS_ENCODER = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+
+
+class PairScorer:
+    """Scores (query, document) pairs; higher means more relevant"""
+
+    model_name: str = "pair-scorer"
+
+    def score(self, query: str, documents: List[str]) -> np.ndarray:
+        raise NotImplementedError
+
+
+class CrossEncoderScorer(PairScorer):
+    """Local sentence-transformers cross-encoder, loaded on first use and run on CPU"""
+
+    def __init__(self, model_name: str = DEFAULT_CROSS_ENCODER, batch_size: int = 16, num_threads: Optional[int] = None):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                from sentence_transformers import CrossEncoder
+
+                if self.num_threads:
+                    import torch
+                    torch.set_num_threads(self.num_threads)
+                logger.info(f"Loading cross-encoder {self.model_name}")
+                self._model = CrossEncoder(self.model_name, device="cpu")
+            return self._model
+
+    def score(self, query: str, documents: List[str]) -> np.ndarray:
+        pairs = [(query, document) for document in documents]
+        return np.asarray(self.model.predict(pairs, batch_size=self.batch_size), dtype=np.float32)
+
+
+class OverlapScorer(PairScorer):
+    """Offline stand-in for a cross-encoder: the share of query terms found in the document.
+
+    Needs no model download, so tests and the benchmark can exercise the
+    rerank stage anywhere.
+    """
+
+    model_name = "term-overlap"
+
+    def score(self, query: str, documents: List[str]) -> np.ndarray:
+        terms = set(tokenize(query))
+        if not terms:
+            return np.zeros(len(documents), dtype=np.float32)
+        return np.array(
+            [len(terms.intersection(tokenize(document))) / len(terms) for document in documents],
+            dtype=np.float32,
+        )
+
+
+RERANKER_BACKENDS = {
+    "cross_encoder": CrossEncoderScorer,
+    "overlap": OverlapScorer,
+}
+
+
+def create_scorer(backend: Optional[str] = None, **options) -> PairScorer:
+    """Create a pair scorer for `backend` (defaults to RERANK_BACKEND or "cross_encoder")"""
+    backend = backend or os.getenv('RERANK_BACKEND', 'cross_encoder')
+    if backend not in RERANKER_BACKENDS:
+        raise ValueError(f"Unknown rerank backend '{backend}', expected one of {sorted(RERANKER_BACKENDS)}")
+    if backend == "cross_encoder" and os.getenv('RERANK_MODEL'):
+        options.setdefault('model_name', os.getenv('RERANK_MODEL'))
+    return RERANKER_BACKENDS[backend](**options)
+
+
+def build_reranker(**options) -> "Reranker":
+    """A `Reranker` configured from RERANK_BACKEND, RERANK_BATCH_SIZE, RERANK_BUDGET_MS and RERANK_CACHE_SIZE.
+
+    The scorer model is only loaded by the first rerank request.
+    """
+    options.setdefault('batch_size', int(os.getenv('RERANK_BATCH_SIZE', '16')))
+    options.setdefault('budget_ms', float(os.getenv('RERANK_BUDGET_MS', '200')))
+    options.setdefault('cache_size', int(os.getenv('RERANK_CACHE_SIZE', '10000')))
+    return Reranker(create_scorer(), **options)
+
+
+class Reranker:
+    """Reorders retrieved hits by pair scores within a time budget.
+
+    Candidates are scored `batch_size` pairs at a time, skipping pairs whose
+    score is already in the LRU pair cache. The deadline is checked before
+    each batch, so a request overruns its budget by at most one batch; once
+    it has passed, scoring stops and the hits are returned in their original
+    order. Scores computed before the deadline stay cached, so a retry of the
+    same query gets further.
+    """
+
+    def __init__(self, scorer: PairScorer, batch_size: int = 16, budget_ms: float = 200.0, cache_size: int = 10000):
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be positive, got {batch_size}")
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"reranked": 0, "fallbacks": 0, "pairs_scored": 0, "cache_hits": 0}
+        # Exposed as the "rerank" stage of the query stage histograms
+        self.latency_histogram = register_stage(QUERY_STAGES, "rerank")
+        self._metrics = [
+            REGISTRY.register(Counter(
+                "rag_rerank_events_total", "Rerank requests, scored pairs and pair cache hits",
+                {"event": stat}, fn=lambda stat=stat: self.stats[stat],
+            ))
+            for stat in self.stats
+        ]
+
+    def _cached(self, keys: List[bytes]) -> List[Optional[float]]:
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._cache.get(key)
+                if score is not None:
+                    self._cache.move_to_end(key)
+                scores.append(score)
+            self.stats["cache_hits"] += sum(score is not None for score in scores)
+            return scores
+
+    def _store(self, keys: List[bytes], scores: np.ndarray):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._cache[key] = float(score)
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            self.stats["pairs_scored"] += len(keys)
+
+    def rerank(
+        self,
+        query: str,
+        hits: List[dict],
+        budget_ms: Optional[float] = None,
+        deadline: Optional[float] = None,
+    ) -> Tuple[List[dict], bool]:
+        """Return (hits, reranked): hits sorted by `rerank_score`, or unchanged when the budget ran out.
+
+        `deadline` is an absolute `time.perf_counter()` value; callers that
+        queue the call set it so time spent waiting counts against the budget.
+        """
+        start = time.perf_counter()
+        if deadline is None:
+            deadline = start + (self.budget_ms if budget_ms is None else budget_ms) / 1000
+        keys = [cache_key(self.scorer.model_name, f"{query}\x00{hit['document']}") for hit in hits]
+        scores = self._cached(keys)
+        missing = [i for i, score in enumerate(scores) if score is None]
+
+        completed = True
+        for offset in range(0, len(missing), self.batch_size):
+            if time.perf_counter() >= deadline:
+                completed = False
+                break
+            batch = missing[offset:offset + self.batch_size]
+            batch_scores = self.scorer.score(query, [hits[i]['document'] for i in batch])
+            self._store([keys[i] for i in batch], batch_scores)
+            for i, score in zip(batch, batch_scores):
+                scores[i] = float(score)
+
+        self.latency_histogram.observe(time.perf_counter() - start)
+        with self._lock:
+            self.stats["reranked" if completed else "fallbacks"] += 1
+        if not completed:
+            return hits, False
+        order = sorted(range(len(hits)), key=lambda i: scores[i], reverse=True)
+        return [{**hits[i], "rerank_score": scores[i]} for i in order], True
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["cached_pairs"] = len(self._cache)
+        stats["latency_seconds"] = self.latency_histogram.snapshot()
+        return stats
+
+    def close(self):
+        """Drop this reranker's counters from the registry"""
+        REGISTRY.unregister(*self._metrics)
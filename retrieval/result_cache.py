@@ -0,0 +1,188 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from embedding.cache import normalize_text
+from observability.metrics import REGISTRY, Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    results: Any
+    slot: int
+    expires_at: float
+
+
+def _scope(k: int, filters: Optional[dict]) -> tuple:
+    return k, json.dumps(filters, sort_keys=True) if filters else ""
+
+
+class QueryResultCache:
+    """Cache of retrieval results with an exact tier and a semantic tier.
+
+    The exact tier is keyed on the normalized query text plus k and filters.
+    The semantic tier returns the results of a cached query with the same k
+    and filters whose embedding is within `similarity_threshold` cosine
+    similarity of the new query. Entries expire after `ttl_seconds` and the
+    least recently used entry is evicted beyond `max_entries`.
+
+    `generation` is polled at most every `check_interval` seconds; when its
+    value changes (e.g. the collection was re-ingested) the cache is cleared.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 300.0,
+        similarity_threshold: float = 0.95,
+        generation: Optional[Callable[[], Any]] = None,
+        check_interval: float = 1.0,
+        labels: Optional[dict] = None,
+    ):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be positive, got {max_entries}")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        self.generation = generation
+        self.check_interval = check_interval
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._free_slots = list(range(max_entries - 1, -1, -1))
+        # One row per slot: normalized query vector, scope id and liveness
+        self._vectors = None
+        self._scopes = np.zeros(max_entries, dtype=np.int64)
+        self._live = np.zeros(max_entries, dtype=bool)
+        self._slot_keys = [None] * max_entries
+
+        self._generation_value = generation() if generation else None
+        self._next_check = time.monotonic() + check_interval
+
+        self._metrics = [
+            REGISTRY.register(Counter(
+                "rag_result_cache_events_total", "Query result cache lookups and maintenance by outcome",
+                {**(labels or {}), "event": stat}, fn=lambda stat=stat: self.stats[stat],
+            ))
+            for stat in self.stats
+        ]
+        self._metrics.append(REGISTRY.register(
+            Gauge("rag_result_cache_entries", "Cached query results", labels, fn=lambda: len(self._entries))
+        ))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _check_generation(self):
+        if self.generation is None or time.monotonic() < self._next_check:
+            return
+        self._next_check = time.monotonic() + self.check_interval
+        value = self.generation()
+        if value != self._generation_value:
+            self._generation_value = value
+            if self._entries:
+                logger.info(f"Collection changed, dropping {len(self._entries)} cached query results")
+            self._clear()
+            self.stats["invalidations"] += 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._live[:] = False
+        self._slot_keys = [None] * self.max_entries
+
+    def _remove(self, key: tuple):
+        entry = self._entries.pop(key)
+        self._live[entry.slot] = False
+        self._slot_keys[entry.slot] = None
+        self._free_slots.append(entry.slot)
+
+    def _live_entry(self, key: tuple) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def get_exact(self, text: str, k: int, filters: Optional[dict] = None) -> Optional[Any]:
+        """Results cached for the same normalized text, k and filters"""
+        key = (normalize_text(text).lower(),) + _scope(k, filters)
+        with self._lock:
+            self._check_generation()
+            entry = self._live_entry(key)
+            if entry is None:
+                return None
+            self.stats["exact_hits"] += 1
+            return entry.results
+
+    def get_semantic(self, vector: np.ndarray, k: int, filters: Optional[dict] = None) -> Optional[Any]:
+        """Results of the most similar cached query within the threshold, or None (counted as a miss)"""
+        scope = hash(_scope(k, filters))
+        with self._lock:
+            self._check_generation()
+            if self._vectors is not None and self._live.any():
+                query = np.asarray(vector, dtype=np.float32)
+                norm = np.linalg.norm(query)
+                if norm > 0:
+                    similarities = self._vectors @ (query / norm)
+                    similarities[~(self._live & (self._scopes == scope))] = -np.inf
+                    slot = int(np.argmax(similarities))
+                    if similarities[slot] >= self.similarity_threshold:
+                        entry = self._live_entry(self._slot_keys[slot])
+                        if entry is not None:
+                            self.stats["semantic_hits"] += 1
+                            return entry.results
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, text: str, k: int, vector: np.ndarray, results: Any, filters: Optional[dict] = None):
+        scope_key = _scope(k, filters)
+        key = (normalize_text(text).lower(),) + scope_key
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            while not self._free_slots:
+                self._remove(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            slot = self._free_slots.pop()
+            norm = np.linalg.norm(vector)
+            self._vectors[slot] = vector / norm if norm > 0 else vector
+            self._scopes[slot] = hash(scope_key)
+            self._live[slot] = True
+            self._slot_keys[slot] = key
+            self._entries[key] = _Entry(results, slot, time.monotonic() + self.ttl_seconds)
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def close(self):
+        """Empty the cache and drop its series from the registry"""
+        self.clear()
+        REGISTRY.unregister(*self._metrics)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.stats["exact_hits"] + self.stats["semantic_hits"] + self.stats["misses"]
+            hits = self.stats["exact_hits"] + self.stats["semantic_hits"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,511 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import chromadb
+import numpy as np
+
+from embedding.cache import build_embedder
+from embedding.embedders import Embedder
+from embedding.exact_index import ExactIndex, exact_index_path, top_k
+from embedding.filter_index import FilterIndex, filter_index_path
+from embedding.lexical_index import LexicalIndex, lexical_index_path
+from embedding.manifest import IngestionManifest
+from embedding.quantized_index import QuantizedIndex, quantized_index_path, squared_l2
+from observability.startup import StartupProfile
+from observability.tracing import QUERY_STAGES, timed
+from retrieval.batcher import MicroBatcher
+from retrieval.filters import chroma_where, parse_filters
+from retrieval.hybrid import reciprocal_rank_fusion
+from retrieval.rerank import Reranker, build_reranker
+from retrieval.result_cache import QueryResultCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMBEDDING_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'embedding'))
+DEFAULT_COLLECTION = "text_embeddings"
+
+
+def ids_only(hits: List[dict]) -> List[dict]:
+    """Drop document text and metadata from hits, keeping ids and scores"""
+    return [{key: value for key, value in hit.items() if key not in ("document", "metadata")} for hit in hits]
+
+
+def copy_hits(hits: List[dict]) -> List[dict]:
+    """A new list of new hit dicts, so callers can change results without changing the result cache"""
+    return [dict(hit) for hit in hits]
+
+
+class Retriever:
+    """Top-k vector search over a persisted Chroma collection.
+
+    The Chroma client, collection handle and embedding model are created once
+    and shared by all requests. Blocking embed + search work runs on a bounded
+    thread pool so async request handlers never stall the event loop, and
+    concurrent queries are coalesced by a `MicroBatcher` into one forward pass
+    and one multi-query `collection.query` call. Repeated and near-identical
+    queries are answered from a `QueryResultCache` that is dropped whenever
+    the ingestion manifest changes.
+
+    When ingestion built a `QuantizedIndex`, all vector search, filtered
+    included, runs over its compressed codes, so Chroma's HNSW segment is
+    never loaded and Chroma only serves documents and metadata. Otherwise collections of at most `exact_search_max`
+    chunks are searched exactly by brute force over their `ExactIndex`,
+    which is also used for narrow filtered searches. When ingestion built a `LexicalIndex`, `ahybrid_search`
+    runs BM25 and vector search concurrently and fuses them by weighted
+    reciprocal rank. `arerank` reorders candidates with a pair scorer
+    (a cross-encoder by default) within a per-request time budget.
+
+    A `CollectionRouter` serving several collections passes in its shared
+    embedder, Chroma `client`, `executor` and reranker; a standalone
+    retriever creates its own.
+    """
+
+    def __init__(
+        self,
+        embedding_dir: Optional[str] = None,
+        collection_name: Optional[str] = None,
+        embedder: Optional[Embedder] = None,
+        max_workers: Optional[int] = None,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None,
+        result_cache: Optional[QueryResultCache] = None,
+        cache_results: Optional[bool] = None,
+        hybrid_depth: Optional[int] = None,
+        rrf_k: int = 60,
+        reranker: Optional[Reranker] = None,
+        client=None,
+        executor: Optional[Executor] = None,
+        exact_search_max: Optional[int] = None,
+    ):
+        self.embedding_dir = embedding_dir or os.getenv('EMBEDDING_DIR', DEFAULT_EMBEDDING_DIR)
+        self.collection_name = collection_name or os.getenv('COLLECTION_NAME', DEFAULT_COLLECTION)
+        self.embedder = embedder or build_embedder(self.embedding_dir)
+        self.client = client or chromadb.PersistentClient(path=self.embedding_dir)
+        self.collection = self.client.get_collection(
+            name=self.collection_name,
+            embedding_function=self.embedder
+        )
+        self._owns_executor = executor is None
+        if executor is None:
+            max_workers = max_workers or int(os.getenv('RETRIEVAL_WORKERS', '4'))
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+        self._executor = executor
+        labels = {"collection": self.collection_name}
+        self.batcher = MicroBatcher(
+            self._search_batch,
+            max_batch_size=max_batch_size or int(os.getenv('BATCH_MAX_SIZE', '32')),
+            max_wait_ms=max_wait_ms if max_wait_ms is not None else float(os.getenv('BATCH_MAX_WAIT_MS', '5')),
+            executor=self._executor,
+            name="query_batch",
+            labels=labels,
+        )
+        if cache_results is None:
+            cache_results = int(os.getenv('RESULT_CACHE_SIZE', '1024')) > 0
+        self.result_cache = result_cache
+        self._owns_result_cache = result_cache is None
+        if result_cache is None and cache_results:
+            self.result_cache = QueryResultCache(
+                max_entries=int(os.getenv('RESULT_CACHE_SIZE', '1024')),
+                ttl_seconds=float(os.getenv('RESULT_CACHE_TTL', '300')),
+                similarity_threshold=float(os.getenv('RESULT_CACHE_SIMILARITY', '0.95')),
+                generation=self.collection_generation,
+                labels=labels,
+            )
+        # Hits taken from each ranking before fusion in hybrid search
+        self.hybrid_depth = hybrid_depth or int(os.getenv('HYBRID_DEPTH', '20'))
+        self.rrf_k = rrf_k
+        self.lexical_path = lexical_index_path(self.embedding_dir, self.collection_name)
+        self.quantized_path = quantized_index_path(self.embedding_dir, self.collection_name)
+        self.filter_path = filter_index_path(self.embedding_dir, self.collection_name)
+        self.exact_path = exact_index_path(self.embedding_dir, self.collection_name)
+        self._lexical = None
+        self._quantized = None
+        self._filters = None
+        self._exact = None
+        self._filters_aligned = False
+        # Filters matching at most this many chunks are served by exact search over just those chunks
+        self.filter_exact_max = int(os.getenv('FILTER_EXACT_MAX', '4096'))
+        # Collections up to this many chunks skip HNSW for a brute-force scan, which is exact and fast at that size
+        if exact_search_max is None:
+            exact_search_max = int(os.getenv('EXACT_SEARCH_MAX', '20000'))
+        self.exact_search_max = exact_search_max
+        self._index_generation = object()
+        self._index_lock = threading.Lock()
+        self._owns_reranker = reranker is None
+        self.reranker = reranker or build_reranker()
+        # Candidates retrieved for the reranker to choose the top k from
+        self.rerank_depth = int(os.getenv('RERANK_DEPTH', '20'))
+        logger.info(f"Retriever ready on '{self.collection_name}' ({self.collection.count()} chunks)")
+
+    def collection_generation(self):
+        """Cheap change marker for the collection: its manifest file is rewritten by every ingestion run"""
+        try:
+            stat = os.stat(IngestionManifest.path_for(self.embedding_dir, self.collection_name))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _side_indexes(self) -> Tuple[Optional[LexicalIndex], Optional[QuantizedIndex], Optional[FilterIndex], Optional[ExactIndex]]:
+        """Indexes written next to the collection by ingestion, reopened whenever the store changes"""
+        generation = self.collection_generation()
+        with self._index_lock:
+            if generation != self._index_generation:
+                self._lexical = LexicalIndex(self.lexical_path) if LexicalIndex.exists(self.lexical_path) else None
+                self._quantized = None
+                if QuantizedIndex.exists(self.quantized_path):
+                    quantized = QuantizedIndex(self.quantized_path)
+                    if quantized.model_name == self.embedder.model_name:
+                        self._quantized = quantized
+                    else:
+                        logger.warning(f"Ignoring quantized index built with {quantized.model_name}, serving with {self.embedder.model_name}")
+                self._filters = FilterIndex(self.filter_path) if FilterIndex.exists(self.filter_path) else None
+                self._filters_aligned = self._lexical is not None and self._filters is not None and self._aligned(self._lexical, self._filters)
+                self._exact = None
+                if ExactIndex.exists(self.exact_path):
+                    exact = ExactIndex(self.exact_path)
+                    if exact.model_name == self.embedder.model_name:
+                        self._exact = exact
+                    else:
+                        logger.warning(f"Ignoring exact index built with {exact.model_name}, serving with {self.embedder.model_name}")
+                self._index_generation = generation
+            return self._lexical, self._quantized, self._filters, self._exact
+
+    @staticmethod
+    def _aligned(lexical: LexicalIndex, filters: FilterIndex) -> bool:
+        """Whether both indexes number the same documents in the same order, so filter bitmaps apply to BM25"""
+        n = len(filters)
+        return len(lexical) == n and (n == 0 or (lexical.doc_id(0) == filters.ids[0] and lexical.doc_id(n - 1) == filters.ids[n - 1]))
+
+    def lexical_index(self) -> Optional[LexicalIndex]:
+        """The collection's BM25 index; None if it was never built"""
+        return self._side_indexes()[0]
+
+    def quantized_index(self) -> Optional[QuantizedIndex]:
+        """The collection's quantized vector index when ingestion built one for the current model"""
+        return self._side_indexes()[1]
+
+    def filter_index(self) -> Optional[FilterIndex]:
+        """The collection's metadata filter index; None if it was never built"""
+        return self._side_indexes()[2]
+
+    def exact_index(self) -> Optional[ExactIndex]:
+        """The collection's exact-search vector matrix when ingestion built one for the current model"""
+        return self._side_indexes()[3]
+
+    def warmup(self, profile: Optional[StartupProfile] = None) -> StartupProfile:
+        """Pay every first-use cost up front: model load, index files, Chroma's vector segment.
+
+        Each step is timed into `profile`. The dummy queries bypass the result cache.
+        """
+        profile = profile or StartupProfile()
+        with profile.stage("load_model"):
+            self.embedder.warmup()
+        with profile.stage("open_indexes"):
+            lexical = self.lexical_index()
+            if lexical is not None:
+                lexical.search("warmup", 1)
+        if self.collection.count():
+            # The first query reads Chroma's HNSW segment, or the quantized index's codes, into memory
+            with profile.stage("first_query"):
+                self.search(["warmup"], 1)
+            with profile.stage("warm_query"):
+                self.search(["warmup"], 1)
+        return profile
+
+    def search(self, texts: List[str], k: int = 5, filters: Optional[dict] = None) -> List[List[dict]]:
+        """Embed `texts` and return the top-k hits for each, blocking the calling thread"""
+        vectors = self.embedder.embed(texts)
+        if filters:
+            return self._query_filtered(vectors, k, [parse_filters(filters)] * len(vectors))
+        return self._query(vectors, k)
+
+    def _hits(self, all_ids: List[List[str]], all_distances: List[List[float]], include_documents: bool) -> List[List[dict]]:
+        """Hits from per-query ids and distances, reading documents from Chroma by id when wanted"""
+        if not include_documents:
+            return [
+                [{"id": hit_id, "distance": distance} for hit_id, distance in zip(ids, distances)]
+                for ids, distances in zip(all_ids, all_distances)
+            ]
+        found = self.fetch(list(dict.fromkeys(hit_id for ids in all_ids for hit_id in ids)))
+        return [
+            [
+                {"id": hit_id, "document": found[hit_id]["document"], "distance": distance, "metadata": found[hit_id]["metadata"]}
+                for hit_id, distance in zip(ids, distances) if hit_id in found
+            ]
+            for ids, distances in zip(all_ids, all_distances)
+        ]
+
+    def _query(self, vectors, k: int, include_documents: bool = True, where: Optional[dict] = None) -> List[List[dict]]:
+        quantized = self.quantized_index()
+        if quantized is not None and where is None:
+            # Search the compressed codes, re-score exactly, and read documents from Chroma by id
+            return self._hits(*quantized.search(vectors, k), include_documents)
+        exact = self.exact_index()
+        if exact is not None and where is None and len(exact) <= self.exact_search_max:
+            return self._hits(*exact.search(vectors, k), include_documents)
+        include = ["documents", "metadatas", "distances"] if include_documents else ["distances"]
+        results = self.collection.query(query_embeddings=vectors, n_results=k, where=where, include=include)
+        if not include_documents:
+            return self._hits(results['ids'], results['distances'], False)
+        return [
+            [
+                {"id": hit_id, "document": document, "distance": distance, "metadata": metadata}
+                for hit_id, document, distance, metadata in zip(ids, documents, distances, metadatas)
+            ]
+            for ids, documents, distances, metadatas in zip(
+                results['ids'], results['documents'], results['distances'], results['metadatas']
+            )
+        ]
+
+    def _vectors_for(self, ids: List[str]) -> Tuple[List[str], np.ndarray]:
+        """Stored float vectors of `ids`, from the quantized or exact index's file when there is one"""
+        stored = self.quantized_index()
+        if stored is None:
+            stored = self.exact_index()
+        if stored is not None:
+            rows = stored.rows(ids)
+            known = np.flatnonzero(rows >= 0)
+            # Read rows in file order, then put them back in the order of `ids`
+            order = np.argsort(rows[known])
+            vectors = np.empty((len(known), stored.dimension), dtype=np.float32)
+            vectors[order] = stored.vectors[rows[known][order]]
+            return [ids[i] for i in known], vectors
+        results = self.collection.get(ids=ids, include=["embeddings"])
+        return results['ids'], np.asarray(results['embeddings'], dtype=np.float32)
+
+    def _query_filtered(self, vectors, k: int, conditions: list, include_documents: bool = True) -> List[List[dict]]:
+        """Top-k hits per query vector among the chunks matching each query's conditions.
+
+        `conditions` holds one parsed filter per vector. When the filter index
+        narrows a filter to at most `filter_exact_max` chunks, those chunks are
+        searched exactly and nothing else is scanned: in the `ExactIndex` when
+        there is one, otherwise over vectors read for all such queries in one
+        call. Documents are read in one call too. Broader filters, and
+        fields the index cannot answer, go to Chroma as a `where` clause, where
+        HNSW finds enough matching candidates on its own.
+
+        With a `QuantizedIndex`, every filter is searched over the codes of
+        its matching rows instead; fields the filter index cannot answer are
+        matched by a metadata-only Chroma `get`, which leaves HNSW unloaded.
+        """
+        index = self.filter_index()
+        quantized = self.quantized_index()
+        results = [None] * len(vectors)
+        subsets = {}
+        for i, query_conditions in enumerate(conditions):
+            positions = index.select(query_conditions) if index is not None else None
+            if quantized is not None:
+                if positions is not None:
+                    subset = index.ids_at(positions)
+                else:
+                    subset = self.collection.get(where=chroma_where(query_conditions), include=[])['ids']
+                if len(subset):
+                    subsets[i] = subset
+                else:
+                    results[i] = []
+            elif positions is None or len(positions) > self.filter_exact_max:
+                results[i] = self._query(vectors[i:i + 1], k, include_documents, where=chroma_where(query_conditions))[0]
+            elif not len(positions):
+                results[i] = []
+            else:
+                subsets[i] = index.ids_at(positions)
+        if not subsets:
+            return results
+
+        all_ids, all_distances = [], []
+        exact = self.exact_index()
+        if quantized is not None:
+            for i, subset in subsets.items():
+                rows = quantized.rows(subset)
+                found_ids, found_distances = quantized.search(vectors[i:i + 1], k, rows=rows[rows >= 0])
+                all_ids.append(found_ids[0])
+                all_distances.append(found_distances[0])
+        elif exact is not None:
+            for i, subset in subsets.items():
+                rows = exact.rows(subset)
+                found_ids, found_distances = exact.search(vectors[i:i + 1], k, rows=rows[rows >= 0])
+                all_ids.append(found_ids[0])
+                all_distances.append(found_distances[0])
+        else:
+            ids, stored = self._vectors_for(list(dict.fromkeys(doc_id for subset in subsets.values() for doc_id in subset)))
+            rows = {doc_id: row for row, doc_id in enumerate(ids)}
+            for i, subset in subsets.items():
+                subset_rows = np.array([rows[doc_id] for doc_id in subset if doc_id in rows], dtype=np.int64)
+                distances = squared_l2(np.asarray(vectors[i:i + 1], dtype=np.float32), stored[subset_rows])
+                columns, values = top_k(distances, k)
+                all_ids.append([ids[row] for row in subset_rows[columns[0]]])
+                all_distances.append([float(value) for value in values[0]])
+        for i, hits in zip(subsets, self._hits(all_ids, all_distances, include_documents)):
+            results[i] = hits
+        return results
+
+    def _search_batch(self, queries: List[Tuple[str, int, bool, Optional[dict]]]) -> List[List[dict]]:
+        """Run a coalesced batch of (text, k, include_documents, filters) queries.
+
+        All texts share one embedding pass. The unfiltered queries share one
+        search at their largest k, and so do the filtered ones.
+        """
+        with timed(QUERY_STAGES, "embed"):
+            vectors = self.embedder.embed([text for text, _, _, _ in queries])
+        hits = [None] * len(queries)
+        if self.result_cache is not None:
+            for i, (vector, (_, k, include_documents, filters)) in enumerate(zip(vectors, queries)):
+                cached = self.result_cache.get_semantic(vector, k, filters)
+                if cached is not None:
+                    hits[i] = copy_hits(cached) if include_documents else ids_only(cached)
+
+        pending = [i for i, cached in enumerate(hits) if cached is None]
+        found = {}
+        unfiltered = [i for i in pending if not queries[i][3]]
+        if unfiltered:
+            # Documents are only loaded when some query in the batch wants them
+            with_documents = any(queries[i][2] for i in unfiltered)
+            with timed(QUERY_STAGES, "vector_search"):
+                results = self._query(vectors[unfiltered], max(queries[i][1] for i in unfiltered), with_documents)
+            for i, query_hits in zip(unfiltered, results):
+                found[i] = query_hits[:queries[i][1]], with_documents
+        filtered = [i for i in pending if queries[i][3]]
+        if filtered:
+            with_documents = any(queries[i][2] for i in filtered)
+            with timed(QUERY_STAGES, "filtered_search"):
+                results = self._query_filtered(
+                    vectors[filtered],
+                    max(queries[i][1] for i in filtered),
+                    [parse_filters(queries[i][3]) for i in filtered],
+                    with_documents,
+                )
+            for i, query_hits in zip(filtered, results):
+                found[i] = query_hits[:queries[i][1]], with_documents
+
+        for i in pending:
+            text, k, include_documents, filters = queries[i]
+            hits[i], with_documents = found[i]
+            if with_documents:
+                if self.result_cache is not None:
+                    self.result_cache.put(text, k, vectors[i], copy_hits(hits[i]), filters)
+                if not include_documents:
+                    hits[i] = ids_only(hits[i])
+        return hits
+
+    async def asearch(self, text: str, k: int = 5, include_documents: bool = True, filters: Optional[dict] = None) -> List[dict]:
+        """Search for one query without blocking the event loop.
+
+        With `include_documents=False` hits only carry `id` and `distance`;
+        fetch the documents later with `afetch`. `filters` restricts the search
+        to chunks whose metadata matches (see `retrieval.filters.parse_filters`).
+        """
+        if filters:
+            parse_filters(filters)
+        if self.result_cache is not None:
+            cached = self.result_cache.get_exact(text, k, filters)
+            if cached is not None:
+                return copy_hits(cached) if include_documents else ids_only(cached)
+        return await self.batcher.submit((text, k, include_documents, filters or None))
+
+    def _lexical_search(self, text: str, k: int, filters: Optional[dict] = None) -> List[Tuple[str, float]]:
+        lexical, _, filter_index, _ = self._side_indexes()
+        if lexical is None:
+            logger.warning(f"No lexical index at {self.lexical_path}, hybrid search is using vectors only")
+            return []
+        if not filters:
+            with timed(QUERY_STAGES, "lexical_search"):
+                return lexical.search(text, k)
+        conditions = parse_filters(filters)
+        positions = filter_index.select(conditions) if filter_index is not None and self._filters_aligned else None
+        if positions is None:
+            # No filter bitmap for this index: filter a deeper BM25 ranking through Chroma instead
+            with timed(QUERY_STAGES, "lexical_search"):
+                hits = lexical.search(text, k * 10)
+            if not hits:
+                return []
+            allowed = set(self.collection.get(ids=[doc_id for doc_id, _ in hits], where=chroma_where(conditions), include=[])['ids'])
+            return [hit for hit in hits if hit[0] in allowed][:k]
+        with timed(QUERY_STAGES, "lexical_search"):
+            return lexical.search(text, k, filter_index.mask(positions))
+
+    def fetch(self, ids: List[str]) -> Dict[str, dict]:
+        """Documents and metadata of stored chunks by id; unknown ids are left out"""
+        if not ids:
+            return {}
+        with timed(QUERY_STAGES, "fetch"):
+            results = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        return {
+            hit_id: {"document": document, "metadata": metadata}
+            for hit_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas'])
+        }
+
+    async def afetch(self, ids: List[str]) -> Dict[str, dict]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.fetch, ids)
+
+    async def ahybrid_search(
+        self,
+        text: str,
+        k: int = 5,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 1.0,
+        include_documents: bool = True,
+        filters: Optional[dict] = None,
+    ) -> List[dict]:
+        """Fuse BM25 and vector rankings with weighted reciprocal-rank fusion.
+
+        Both retrievals take `max(k, hybrid_depth)` hits and run at the same
+        time, each restricted by `filters`; a zero weight skips that retrieval.
+        Each hit carries its fused `score` and its `bm25` score (None when only
+        the vector side found it); `distance` is None for hits only BM25 found.
+        """
+        if vector_weight <= 0 and lexical_weight <= 0:
+            raise ValueError("At least one of vector_weight and lexical_weight must be positive")
+        depth = max(k, self.hybrid_depth)
+        loop = asyncio.get_running_loop()
+
+        async def no_hits():
+            return []
+
+        vector_hits, lexical_hits = await asyncio.gather(
+            self.asearch(text, depth, include_documents, filters) if vector_weight > 0 else no_hits(),
+            loop.run_in_executor(self._executor, self._lexical_search, text, depth, filters) if lexical_weight > 0 else no_hits(),
+        )
+        fused = reciprocal_rank_fusion(
+            [[hit['id'] for hit in vector_hits], [doc_id for doc_id, _ in lexical_hits]],
+            [vector_weight, lexical_weight],
+            k=self.rrf_k,
+        )[:k]
+
+        by_id = {hit['id']: hit for hit in vector_hits}
+        missing = [doc_id for doc_id, _ in fused if doc_id not in by_id]
+        if missing and include_documents:
+            fetched = await self.afetch(missing)
+            by_id.update({doc_id: {"id": doc_id, "distance": None, **found} for doc_id, found in fetched.items()})
+        elif missing:
+            by_id.update({doc_id: {"id": doc_id, "distance": None} for doc_id in missing})
+        bm25 = dict(lexical_hits)
+        return [
+            {**by_id[doc_id], "score": score, "bm25": bm25.get(doc_id)}
+            for doc_id, score in fused if doc_id in by_id
+        ]
+
+    async def arerank(self, text: str, hits: List[dict], budget_ms: Optional[float] = None) -> Tuple[List[dict], bool]:
+        """Rerank hits (which must include documents) on the thread pool; see `Reranker.rerank`"""
+        budget_ms = self.reranker.budget_ms if budget_ms is None else budget_ms
+        deadline = time.perf_counter() + budget_ms / 1000
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.reranker.rerank, text, hits, budget_ms, deadline)
+
+    async def aclose(self):
+        await self.batcher.close()
+        self.close()
+
+    def close(self):
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+        if self._owns_reranker:
+            self.reranker.close()
+        self.batcher.unregister_metrics()
+        if self._owns_result_cache and self.result_cache is not None:
+            self.result_cache.close()
@@ -0,0 +1,215 @@
+import os
+import json
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import chromadb
+import numpy as np
+from chromadb.errors import ChromaError
+
+from embedding.cache import build_embedder
+from embedding.embedders import Embedder
+from observability.startup import StartupProfile
+from retrieval.rerank import Reranker, build_reranker
+from retrieval.retriever import DEFAULT_COLLECTION, DEFAULT_EMBEDDING_DIR, Retriever
+
+logger = logging.getLogger(__name__)
+
+
+def load_tenants(value: Optional[str] = None) -> Dict[str, List[str]]:
+    """Parse a tenant map such as `{"acme": ["text_embeddings", "squad_contexts"]}` (default: TENANTS)"""
+    value = value if value is not None else os.getenv('TENANTS', '')
+    if not value.strip():
+        return {}
+    tenants = json.loads(value)
+    if not isinstance(tenants, dict) or not all(
+        isinstance(names, list) and names and all(isinstance(name, str) for name in names)
+        for names in tenants.values()
+    ):
+        raise ValueError("TENANTS must map each tenant to a non-empty list of collection names")
+    return tenants
+
+
+def merge_hits(results: Dict[str, List[dict]], k: int) -> List[dict]:
+    """Merge per-collection rankings into one top-k, tagging each hit with its collection.
+
+    Hits carrying a fused `score` (hybrid search) are ordered by it, highest
+    first; plain vector hits by `distance`, smallest first. Distances are
+    comparable because every collection is embedded by the same model.
+    """
+    hits = [{**hit, "collection": name} for name, ranking in results.items() for hit in ranking]
+    if any("score" in hit for hit in hits):
+        hits.sort(key=lambda hit: -hit["score"])
+    else:
+        hits.sort(key=lambda hit: hit["distance"])
+    return hits[:k]
+
+
+class CollectionRouter:
+    """Serves every collection of one store from shared resources.
+
+    One embedding model, one Chroma client, one retrieval thread pool and one
+    reranker are created per process and handed to a `Retriever` per
+    collection, opened on first use. Requests name a collection, a list of
+    collections, or a tenant; a tenant maps (via TENANTS) to the collections
+    it may search and searches all of them by default. Tenants are a routing
+    scope, not authentication. Queries over several collections run
+    concurrently and their hits are merged into one top-k.
+    """
+
+    def __init__(
+        self,
+        embedding_dir: Optional[str] = None,
+        default_collection: Optional[str] = None,
+        tenants: Optional[Dict[str, List[str]]] = None,
+        embedder: Optional[Embedder] = None,
+        max_workers: Optional[int] = None,
+        reranker: Optional[Reranker] = None,
+        **retriever_options
+    ):
+        self.embedding_dir = embedding_dir or os.getenv('EMBEDDING_DIR', DEFAULT_EMBEDDING_DIR)
+        self.default_collection = default_collection or os.getenv('COLLECTION_NAME', DEFAULT_COLLECTION)
+        self.tenants = load_tenants() if tenants is None else tenants
+        self.embedder = embedder or build_embedder(self.embedding_dir)
+        self.client = chromadb.PersistentClient(path=self.embedding_dir)
+        max_workers = max_workers or int(os.getenv('RETRIEVAL_WORKERS', '4'))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retrieval")
+        self.reranker = reranker or build_reranker()
+        # Candidates retrieved for the reranker to choose the top k from
+        self.rerank_depth = int(os.getenv('RERANK_DEPTH', '20'))
+        self.retriever_options = retriever_options
+        self._retrievers: Dict[str, Retriever] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def retrievers(self) -> Dict[str, Retriever]:
+        """The collections opened so far"""
+        with self._lock:
+            return dict(self._retrievers)
+
+    def collections(self) -> List[str]:
+        """Names of every collection in the store"""
+        return sorted(getattr(collection, "name", collection) for collection in self.client.list_collections())
+
+    def get(self, name: Optional[str] = None) -> Retriever:
+        """The retriever of a collection (default: `default_collection`); KeyError if it does not exist"""
+        name = name or self.default_collection
+        with self._lock:
+            retriever = self._retrievers.get(name)
+            if retriever is None:
+                try:
+                    retriever = Retriever(
+                        self.embedding_dir,
+                        name,
+                        embedder=self.embedder,
+                        reranker=self.reranker,
+                        client=self.client,
+                        executor=self._executor,
+                        **self.retriever_options
+                    )
+                except (ValueError, ChromaError) as e:
+                    raise KeyError(f"Collection {name} does not exist") from e
+                self._retrievers[name] = retriever
+        return retriever
+
+    def resolve(
+        self,
+        collection: Optional[str] = None,
+        collections: Optional[List[str]] = None,
+        tenant: Optional[str] = None,
+    ) -> List[str]:
+        """The collections a request targets.
+
+        Raises KeyError for an unknown tenant and PermissionError for a
+        collection outside the tenant's list.
+        """
+        names = list(dict.fromkeys(collections)) if collections else [collection] if collection else None
+        if tenant is None:
+            return names or [self.default_collection]
+        if tenant not in self.tenants:
+            raise KeyError(f"Unknown tenant {tenant}")
+        allowed = self.tenants[tenant]
+        if names is None:
+            return list(allowed)
+        denied = [name for name in names if name not in allowed]
+        if denied:
+            raise PermissionError(f"Tenant {tenant} cannot access {', '.join(denied)}")
+        return names
+
+    async def _fan_out(self, names: List[str], method: str, text: str, k: int, **options) -> List[dict]:
+        retrievers = [self.get(name) for name in names]
+        if len(retrievers) == 1:
+            return await getattr(retrievers[0], method)(text, k=k, **options)
+        rankings = await asyncio.gather(*(getattr(retriever, method)(text, k=k, **options) for retriever in retrievers))
+        return merge_hits(dict(zip(names, rankings)), k)
+
+    async def asearch(self, names: List[str], text: str, k: int = 5, **options) -> List[dict]:
+        """`Retriever.asearch` over `names`; hits from several collections carry a `collection` field"""
+        return await self._fan_out(names, "asearch", text, k, **options)
+
+    async def ahybrid_search(self, names: List[str], text: str, k: int = 5, **options) -> List[dict]:
+        """`Retriever.ahybrid_search` over `names`, merged by fused score"""
+        return await self._fan_out(names, "ahybrid_search", text, k, **options)
+
+    async def afetch(self, ids_by_collection: Dict[str, List[str]]) -> Dict[str, dict]:
+        """Documents by id from several collections at once"""
+        names = list(ids_by_collection)
+        found = await asyncio.gather(*(self.get(name).afetch(ids_by_collection[name]) for name in names))
+        return {doc_id: document for documents in found for doc_id, document in documents.items()}
+
+    def vectors(self, text: str, ids_by_collection: Dict[str, List[str]]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """The query's vector and the stored vectors of ids in several collections, by id"""
+        query = np.asarray(self.embedder.embed([text]), dtype=np.float32)[0]
+        vectors = {}
+        for name, ids in ids_by_collection.items():
+            found_ids, found = self.get(name)._vectors_for(ids)
+            vectors.update(zip(found_ids, found))
+        return query, vectors
+
+    async def avectors(self, text: str, ids_by_collection: Dict[str, List[str]]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """`vectors` on the thread pool"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.vectors, text, ids_by_collection)
+
+    async def arerank(self, text: str, hits: List[dict], budget_ms: Optional[float] = None) -> Tuple[List[dict], bool]:
+        """Rerank hits of any collection; collections share the reranker and thread pool"""
+        return await self.get().arerank(text, hits, budget_ms)
+
+    def stats(self) -> dict:
+        """Batching and cache stats of the default collection, the reranker's, and those of every opened collection"""
+        retriever = self.get()
+        stats = {"query_batching": retriever.batcher.stats()}
+        if retriever.result_cache is not None:
+            stats["query_cache"] = retriever.result_cache.snapshot()
+        stats["rerank"] = self.reranker.snapshot()
+        stats["collections"] = {}
+        for name, opened in self.retrievers.items():
+            collection = {"chunks": opened.collection.count(), "query_batching": opened.batcher.stats()}
+            if opened.result_cache is not None:
+                collection["query_cache"] = opened.result_cache.snapshot()
+            stats["collections"][name] = collection
+        return stats
+
+    def warmup(self, profile: Optional[StartupProfile] = None) -> StartupProfile:
+        """Warm up the default collection into `profile`, then open and warm every other collection"""
+        profile = profile or StartupProfile()
+        self.get().warmup(profile)
+        with profile.stage("open_collections"):
+            for name in self.collections():
+                if name != self.default_collection:
+                    self.get(name).warmup()
+        return profile
+
+    async def aclose(self):
+        for retriever in self.retrievers.values():
+            await retriever.batcher.close()
+        self.close()
+
+    def close(self):
+        for retriever in self.retrievers.values():
+            retriever.close()
+        self._executor.shutdown(wait=True)
+        self.reranker.close()
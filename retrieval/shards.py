@@ -0,0 +1,460 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import argparse
+import ipaddress
+import itertools
+import socket
+import secrets
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from multiprocessing.connection import AuthenticationError, Connection, Listener, answer_challenge, deliver_challenge
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding.sharding import shard_of, shard_path
+from observability.metrics import REGISTRY
+from observability.startup import StartupProfile
+from observability.tracing import QUERY_STAGES, timed
+from retrieval.rerank import Reranker, build_reranker
+from retrieval.retriever import DEFAULT_COLLECTION
+from retrieval.router import CollectionRouter, load_tenants
+
+logger = logging.getLogger(__name__)
+
+# Router methods a shard worker answers
+SHARD_METHODS = ("asearch", "ahybrid_search", "afetch", "avectors", "collections", "stats")
+
+
+def parse_address(value: str) -> Tuple[str, int]:
+    """("host", port) from "host:port" """
+    host, _, port = value.strip().rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError(f"Shard address must look like host:port, got '{value}'")
+    return host, int(port)
+
+
+def format_address(address: Tuple[str, int]) -> str:
+    return f"{address[0]}:{address[1]}"
+
+
+# Only accepted while every shard listens on a loopback address
+LOOPBACK_AUTHKEY = b"rag-shards"
+
+
+def is_loopback(host: str) -> bool:
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _authkey(authkey: Optional[bytes], hosts: List[str]) -> bytes:
+    """`authkey`, else SHARD_AUTHKEY; the public default key only when every host is loopback.
+
+    Shard connections carry pickled messages, so a shard reachable from other
+    machines must not use a key anyone knows: ValueError in that case.
+    """
+    authkey = authkey or os.getenv('SHARD_AUTHKEY', '').encode('utf-8')
+    if authkey:
+        return authkey
+    exposed = [host for host in hosts if not is_loopback(host)]
+    if exposed:
+        raise ValueError(f"Shards on non-loopback hosts {exposed} need an explicit authkey or SHARD_AUTHKEY")
+    return LOOPBACK_AUTHKEY
+
+
+class ShardError(RuntimeError):
+    """A shard worker could not be reached or failed to answer"""
+
+
+class PartialHits(list):
+    """Merged hits that also list the shards that failed or timed out, by address"""
+
+    def __init__(self, hits=(), failed: Optional[List[str]] = None):
+        super().__init__(hits)
+        self.failed = failed or []
+
+
+def merge_shard_hits(rankings: List[List[dict]], k: int) -> List[dict]:
+    """Merge per-shard rankings, each already in order, into one top-k with a k-way heap merge.
+
+    Hits with a fused `score` (hybrid search) come highest first, plain
+    vector hits smallest `distance` first. Only the first k hits are taken.
+    """
+    if any("score" in hit for ranking in rankings for hit in ranking):
+        return list(itertools.islice(heapq.merge(*rankings, key=lambda hit: -hit["score"]), k))
+    return list(itertools.islice(heapq.merge(*rankings, key=lambda hit: hit["distance"]), k))
+
+
+def _serve_connection(router: CollectionRouter, loop: asyncio.AbstractEventLoop, conn: Connection):
+    """Answer (method, args, kwargs) requests on one coordinator connection until it closes"""
+    with conn:
+        while True:
+            try:
+                method, args, kwargs = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                if method not in SHARD_METHODS:
+                    raise ValueError(f"Unknown shard method {method}")
+                if method.startswith("a"):
+                    value = asyncio.run_coroutine_threadsafe(getattr(router, method)(*args, **kwargs), loop).result()
+                else:
+                    value = getattr(router, method)(*args, **kwargs)
+                reply = ("ok", value)
+            except Exception as e:
+                reply = ("error", f"{type(e).__name__}: {e}")
+            try:
+                conn.send(reply)
+            except OSError:
+                # The coordinator gave up on this request (timeout) and closed the connection
+                return
+
+
+def serve_shard(
+    embedding_dir: str,
+    address: Tuple[str, int],
+    authkey: Optional[bytes] = None,
+    default_collection: Optional[str] = None,
+    ready: Optional[Connection] = None,
+):
+    """Run one shard worker until the process is stopped.
+
+    The worker serves every collection in its shard store through a
+    `CollectionRouter` (its own model, Chroma client and thread pool), warmed
+    up before it accepts connections. Requests are answered on a
+    `multiprocessing.connection` listener, one thread per coordinator
+    connection, with the router's async methods run on one event loop so
+    concurrent queries still share micro-batches. With `ready`, the bound
+    address is sent on it once the worker accepts requests. Listening on a
+    non-loopback address requires `authkey` or SHARD_AUTHKEY (see `_authkey`).
+    """
+    authkey = _authkey(authkey, [address[0]])
+    router = CollectionRouter(embedding_dir, default_collection=default_collection)
+    router.warmup()
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="shard-loop", daemon=True).start()
+    with Listener(address, authkey=authkey) as listener:
+        logger.info(f"Shard worker for {embedding_dir} listening on {format_address(listener.address)}")
+        if ready is not None:
+            ready.send(listener.address)
+            ready.close()
+        while True:
+            try:
+                conn = listener.accept()
+            except AuthenticationError:
+                logger.warning("Rejected a shard connection with the wrong SHARD_AUTHKEY")
+                continue
+            threading.Thread(target=_serve_connection, args=(router, loop, conn), name="shard-conn", daemon=True).start()
+
+
+@dataclass
+class ShardProcess:
+    """A local shard worker process, the address it listens on and its auth key"""
+    process: multiprocessing.Process
+    address: Tuple[str, int]
+    authkey: bytes
+
+    def stop(self):
+        self.process.terminate()
+        self.process.join()
+
+
+def start_local_shards(
+    shard_dirs: List[str],
+    host: str = "127.0.0.1",
+    authkey: Optional[bytes] = None,
+    default_collection: Optional[str] = None,
+    timeout: float = 120.0,
+) -> List[ShardProcess]:
+    """Start one worker process per shard store on free local ports, returning once all are ready.
+
+    Join the addresses with commas, in this order, for SHARDS. Without
+    `authkey` or SHARD_AUTHKEY the workers share a fresh random key, given as
+    each `ShardProcess.authkey` for the coordinator to use.
+    """
+    authkey = authkey or os.getenv('SHARD_AUTHKEY', '').encode('utf-8') or secrets.token_hex(32).encode('ascii')
+    context = multiprocessing.get_context("spawn")
+    shards, receivers = [], []
+    try:
+        # All workers load and warm up at the same time
+        for path in shard_dirs:
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=serve_shard,
+                args=(path, (host, 0), authkey, default_collection, sender),
+                name=f"shard-{len(shards)}",
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            shards.append(ShardProcess(process, None, authkey))
+            receivers.append(receiver)
+        deadline = time.monotonic() + timeout
+        for path, shard, receiver in zip(shard_dirs, shards, receivers):
+            if not receiver.poll(max(deadline - time.monotonic(), 0)):
+                raise TimeoutError(f"Shard worker for {path} was not ready after {timeout}s")
+            try:
+                shard.address = tuple(receiver.recv())
+            except EOFError:
+                shard.process.join()
+                raise RuntimeError(f"Shard worker for {path} exited with code {shard.process.exitcode}") from None
+    except BaseException:
+        for shard in shards:
+            shard.stop()
+        raise
+    return shards
+
+
+class ShardedRouter:
+    """Scatter-gather search over shard worker processes, one per id-hash partition.
+
+    Offers the request-facing methods of `CollectionRouter`. Each query goes
+    to every shard at once and each shard answers with its own top-k; the
+    rankings are merged with a heap. A shard that has not answered within
+    `timeout_ms` (default SHARD_TIMEOUT_MS), or fails, is left out: the
+    merged hits are a `PartialHits` listing it, and
+    `rag_shard_failures_total` counts it. Its connection is dropped, so a
+    late answer is never read by another request. Documents are fetched from
+    the one shard each id hashes to, so `addresses` (default: SHARDS, a comma
+    separated list of host:port) must be given in shard order.
+
+    Shards embed queries themselves, so this process loads no model; only
+    the reranker runs here, over the merged candidates. Tenants are resolved
+    here exactly as in `CollectionRouter`.
+    """
+
+    def __init__(
+        self,
+        addresses: Optional[List[str]] = None,
+        authkey: Optional[bytes] = None,
+        timeout_ms: Optional[float] = None,
+        default_collection: Optional[str] = None,
+        tenants: Optional[Dict[str, List[str]]] = None,
+        reranker: Optional[Reranker] = None,
+        max_workers: Optional[int] = None,
+    ):
+        if addresses is None:
+            addresses = [value for value in os.getenv('SHARDS', '').split(',') if value.strip()]
+        if not addresses:
+            raise ValueError("ShardedRouter needs at least one shard address")
+        self.addresses = [parse_address(address) if isinstance(address, str) else tuple(address) for address in addresses]
+        self.authkey = _authkey(authkey, [host for host, _ in self.addresses])
+        self.timeout_ms = timeout_ms or float(os.getenv('SHARD_TIMEOUT_MS', '1000'))
+        self.default_collection = default_collection or os.getenv('COLLECTION_NAME', DEFAULT_COLLECTION)
+        self.tenants = load_tenants() if tenants is None else tenants
+        self.reranker = reranker or build_reranker()
+        self.rerank_depth = int(os.getenv('RERANK_DEPTH', '20'))
+        # A blocked thread per in-flight shard request
+        max_workers = max_workers or len(self.addresses) * int(os.getenv('RETRIEVAL_WORKERS', '4'))
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shard-client")
+        self._idle: List[List[Connection]] = [[] for _ in self.addresses]
+        self._lock = threading.Lock()
+        self._collections: set = set()
+
+    resolve = CollectionRouter.resolve
+
+    def _connect(self, shard: int, deadline: Optional[float]) -> Connection:
+        """An authenticated connection to a shard, or TimeoutError once `deadline` (monotonic) has passed.
+
+        Like `multiprocessing.connection.Client`, but both the TCP connect and
+        the wait for the shard's challenge are bounded by the deadline, so a
+        host that is down or a shard that is not accepting is left out in time.
+        """
+        address = self.addresses[shard]
+
+        def remaining() -> Optional[float]:
+            return None if deadline is None else max(deadline - time.monotonic(), 0.001)
+
+        try:
+            sock = socket.create_connection(address, timeout=remaining())
+        except socket.timeout:
+            raise TimeoutError(f"Shard {format_address(address)} did not accept a connection within {self.timeout_ms:g}ms")
+        sock.setblocking(True)
+        conn = Connection(sock.detach())
+        try:
+            if not conn.poll(remaining()):
+                raise TimeoutError(f"Shard {format_address(address)} did not accept a connection within {self.timeout_ms:g}ms")
+            answer_challenge(conn, self.authkey)
+            deliver_challenge(conn, self.authkey)
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    def _request(self, shard: int, method: str, args: tuple, kwargs: dict, deadline: Optional[float]) -> Any:
+        """One blocking request to a shard on a pooled connection, answered before `deadline` (monotonic) or TimeoutError"""
+        with self._lock:
+            conn = self._idle[shard].pop() if self._idle[shard] else None
+        try:
+            if conn is None:
+                conn = self._connect(shard, deadline)
+            conn.send((method, args, kwargs))
+            if not conn.poll(None if deadline is None else max(deadline - time.monotonic(), 0)):
+                raise TimeoutError(f"Shard {format_address(self.addresses[shard])} did not answer within {self.timeout_ms:g}ms")
+            status, value = conn.recv()
+        except BaseException:
+            if conn is not None:
+                conn.close()
+            raise
+        with self._lock:
+            self._idle[shard].append(conn)
+        if status != "ok":
+            raise ShardError(f"Shard {format_address(self.addresses[shard])} failed: {value}")
+        return value
+
+    async def _scatter(self, method: str, requests: Dict[int, Tuple[tuple, dict]]) -> Tuple[List[Any], List[str]]:
+        """Send each shard its (args, kwargs) for `method` concurrently.
+
+        Returns the answers of the shards that answered in time and the
+        addresses of those that did not; ShardError if none answered.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.timeout_ms / 1000
+        outcomes = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._request, shard, method, args, kwargs, deadline)
+            for shard, (args, kwargs) in requests.items()
+        ), return_exceptions=True)
+        answers, failed = [], []
+        for shard, outcome in zip(requests, outcomes):
+            if isinstance(outcome, BaseException):
+                reason = "timeout" if isinstance(outcome, TimeoutError) else "error"
+                REGISTRY.counter(
+                    "rag_shard_failures_total", "Shard requests left out of a query", {"shard": str(shard), "reason": reason}
+                ).inc()
+                logger.warning(f"Leaving shard {shard} out of {method}: {outcome}")
+                failed.append(format_address(self.addresses[shard]))
+            else:
+                answers.append(outcome)
+        if not answers:
+            raise ShardError(f"No shard answered {method}")
+        return answers, failed
+
+    async def _search(self, method: str, names: List[str], text: str, k: int, **options) -> PartialHits:
+        with timed(QUERY_STAGES, "scatter"):
+            request = ((names, text), {"k": k, **options})
+            rankings, failed = await self._scatter(method, {shard: request for shard in range(len(self.addresses))})
+        with timed(QUERY_STAGES, "merge"):
+            return PartialHits(merge_shard_hits(rankings, k), failed)
+
+    async def asearch(self, names: List[str], text: str, k: int = 5, **options) -> PartialHits:
+        """`CollectionRouter.asearch` on every shard, merged by distance"""
+        return await self._search("asearch", names, text, k, **options)
+
+    async def ahybrid_search(self, names: List[str], text: str, k: int = 5, **options) -> PartialHits:
+        """`CollectionRouter.ahybrid_search` on every shard, merged by fused score.
+
+        BM25 statistics and fusion ranks are per shard, so the merge is an
+        approximation of hybrid search over the unsharded collection.
+        """
+        return await self._search("ahybrid_search", names, text, k, **options)
+
+    def _by_shard(self, ids_by_collection: Dict[str, List[str]]) -> Dict[int, Dict[str, List[str]]]:
+        """Split ids by the shard they hash to"""
+        by_shard: Dict[int, Dict[str, List[str]]] = {}
+        for name, ids in ids_by_collection.items():
+            for doc_id in ids:
+                by_shard.setdefault(shard_of(doc_id, len(self.addresses)), {}).setdefault(name, []).append(doc_id)
+        return by_shard
+
+    async def afetch(self, ids_by_collection: Dict[str, List[str]]) -> Dict[str, dict]:
+        """Documents by id, each asked of the shard its id hashes to; ids on shards that fail are left out"""
+        by_shard = self._by_shard(ids_by_collection)
+        if not by_shard:
+            return {}
+        found, _ = await self._scatter("afetch", {shard: ((ids,), {}) for shard, ids in by_shard.items()})
+        return {doc_id: document for documents in found for doc_id, document in documents.items()}
+
+    async def avectors(self, text: str, ids_by_collection: Dict[str, List[str]]) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """The query's vector (embedded by a shard) and stored vectors of ids, each read from its own shard"""
+        # Shard 0 is always asked, so some shard embeds the query even without ids
+        by_shard = {0: {}, **self._by_shard(ids_by_collection)}
+        answers, _ = await self._scatter("avectors", {shard: ((text, ids), {}) for shard, ids in by_shard.items()})
+        return answers[0][0], {doc_id: vector for _, vectors in answers for doc_id, vector in vectors.items()}
+
+    async def arerank(self, text: str, hits: List[dict], budget_ms: Optional[float] = None) -> Tuple[List[dict], bool]:
+        """Rerank merged hits here; see `Reranker.rerank`"""
+        budget_ms = self.reranker.budget_ms if budget_ms is None else budget_ms
+        deadline = time.perf_counter() + budget_ms / 1000
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.reranker.rerank, text, hits, budget_ms, deadline)
+
+    def _ask_all(self, method: str) -> List[Any]:
+        """Blocking call to every shard, waiting without a deadline"""
+        return [self._request(shard, method, (), {}, None) for shard in range(len(self.addresses))]
+
+    def collections(self) -> List[str]:
+        """Collections served by any shard"""
+        self._collections = {name for names in self._ask_all("collections") for name in names}
+        return sorted(self._collections)
+
+    def get(self, name: Optional[str] = None) -> str:
+        """The collection name (default: `default_collection`) if a shard serves it; KeyError otherwise"""
+        name = name or self.default_collection
+        if name not in self._collections and name not in self.collections():
+            raise KeyError(f"Collection {name} does not exist")
+        return name
+
+    def warmup(self, profile: Optional[StartupProfile] = None) -> StartupProfile:
+        """Connect to every shard (each warms itself up before listening) and check the default collection"""
+        profile = profile or StartupProfile()
+        with profile.stage("connect_shards"):
+            self.get()
+        return profile
+
+    def stats(self) -> dict:
+        """Each shard's own stats by address, and the reranker's"""
+        return {
+            "rerank": self.reranker.snapshot(),
+            "shards": {format_address(address): stats for address, stats in zip(self.addresses, self._ask_all("stats"))},
+        }
+
+    async def aclose(self):
+        self.close()
+
+    def close(self):
+        with self._lock:
+            for conn in itertools.chain.from_iterable(self._idle):
+                conn.close()
+            self._idle = [[] for _ in self.addresses]
+        self._executor.shutdown(wait=True)
+        self.reranker.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Run shard worker processes for scatter-gather retrieval")
+    parser.add_argument("embedding_dir", help="A shard store to serve, or with --shards the store that was partitioned")
+    parser.add_argument("--shards", type=int, default=None, help="Start workers for all N shard stores of embedding_dir")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=0, help="Port of a single worker (default: any free port)")
+    parser.add_argument("--collection", default=None, help="Collection to warm up (default: COLLECTION_NAME)")
+    args = parser.parse_args()
+
+    if args.shards is None:
+        serve_shard(args.embedding_dir, (args.host, args.port), default_collection=args.collection)
+        return
+    shards = start_local_shards(
+        [shard_path(args.embedding_dir, shard, args.shards) for shard in range(args.shards)], args.host, default_collection=args.collection
+    )
+    print("SHARDS=" + ",".join(format_address(shard.address) for shard in shards), flush=True)
+    if not os.getenv('SHARD_AUTHKEY'):
+        print("SHARD_AUTHKEY=" + shards[0].authkey.decode('ascii'), flush=True)
+    try:
+        for shard in shards:
+            shard.process.join()
+    except KeyboardInterrupt:
+        for shard in shards:
+            shard.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import json
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the stdlib encoder is slower but equivalent
+    orjson = None
+
+from observability.tracing import QUERY_STAGES, stage_histogram
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+
+def dumps(value) -> bytes:
+    """Serialize to compact JSON bytes, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def encode_event(event: str, data, stream_format: str) -> bytes:
+    """One streamed record: a JSON line for NDJSON, an `event:`/`data:` block for SSE"""
+    if stream_format == "sse":
+        return b"event: " + event.encode('utf-8') + b"\ndata: " + dumps(data) + b"\n\n"
+    if stream_format == "ndjson":
+        return dumps(data) + b"\n"
+    raise ValueError(f"Unknown stream format '{stream_format}', expected one of {sorted(MEDIA_TYPES)}")
+
+
+async def stream_hits(
+    header: dict,
+    hits: List[dict],
+    stream_format: str,
+    fetch: Optional[Callable[[List[str]], Awaitable[Dict[str, dict]]]] = None,
+    page_size: int = 16,
+) -> AsyncIterator[bytes]:
+    """Yield the header record, one record per hit, then the hits' documents, then an end record.
+
+    What is incremental: every hit (id, rank and scores, plus its document if
+    it already has one) is sent before any document is loaded. With `fetch`,
+    the documents of the other hits follow as "document" records (rank, id
+    and the fetched fields), loaded `page_size` hits at a time, so only one
+    page of text is held per request. What is not: the hit list itself must
+    be final, so search (and any diversification or reranking) has finished
+    before the first byte is sent. Encoding time is observed as the
+    "serialize" query stage once the stream ends.
+    """
+    encode_seconds = 0.0
+
+    def encode(event, data):
+        nonlocal encode_seconds
+        start = time.perf_counter()
+        record = encode_event(event, data, stream_format)
+        encode_seconds += time.perf_counter() - start
+        return record
+
+    yield encode("query", header)
+    for rank, hit in enumerate(hits, start=1):
+        yield encode("hit", {"rank": rank, **hit})
+    if fetch is not None:
+        missing = [(rank, hit['id']) for rank, hit in enumerate(hits, start=1) if "document" not in hit]
+        for start in range(0, len(missing), page_size):
+            page = missing[start:start + page_size]
+            found = await fetch([doc_id for _, doc_id in page])
+            for rank, doc_id in page:
+                if doc_id in found:
+                    yield encode("document", {"rank": rank, "id": doc_id, **found[doc_id]})
+    yield encode("end", {"count": len(hits)})
+    stage_histogram(QUERY_STAGES, "serialize").observe(encode_seconds)
@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Callable, Dict, Optional
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embedding.arrow_dataset import first_occurrences, read_table
+from embedding.chunking import iter_dataset_texts
+from tests.extract_qa import QAExtractor
+
+
+def best_seconds(fn: Callable[[], object], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class ReadBenchmark:
+    """Times the dataset read paths of ingestion and QA extraction.
+
+    Each path is timed row by row through `datasets` (`dataset[i]` and
+    batch slices turned into Python dicts) and column-wise over the
+    memory-mapped Arrow files. Times are the best of `repeats` runs.
+    """
+
+    def __init__(self, data_dir: Optional[str] = None, repeats: int = 5, batch_size: int = 100):
+        self.data_dir = data_dir or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
+        self.repeats = repeats
+        self.batch_size = batch_size
+
+    def qa_rows(self):
+        from datasets import load_from_disk
+
+        dataset = load_from_disk(os.path.join(self.data_dir, 'question_answer'))
+        return [
+            {'question': example['question'], 'answer': example['answers']['text'][0], 'context': example['context'], 'title': example['title']}
+            for example in (dataset[i] for i in range(len(dataset)))
+        ]
+
+    def qa_columns(self):
+        return QAExtractor(self.data_dir).extract_qa_table()
+
+    def contexts_rows(self):
+        from datasets import load_from_disk
+
+        dataset = load_from_disk(os.path.join(self.data_dir, 'question_answer'))
+        contexts = {}
+        for i in range(0, len(dataset), self.batch_size):
+            batch = dataset[i:i + self.batch_size]
+            for title, context in zip(batch['title'], batch['context']):
+                contexts.setdefault(str(context), str(title))
+        return contexts
+
+    def contexts_columns(self):
+        table = first_occurrences(read_table(os.path.join(self.data_dir, 'question_answer'), ["title", "context"]), "context")
+        return table.column("title").to_pylist(), table.column("context").to_pylist()
+
+    def text_rows(self):
+        from datasets import load_from_disk
+
+        dataset = load_from_disk(os.path.join(self.data_dir, 'text_corpus'))
+        return [str(text) for i in range(0, len(dataset), self.batch_size) for text in dataset[i:i + self.batch_size]['text']]
+
+    def text_columns(self):
+        return [text for _, text in iter_dataset_texts(os.path.join(self.data_dir, 'text_corpus'))]
+
+    def run(self) -> Dict:
+        import datasets  # noqa: F401 - keep the import itself out of the row-wise timings
+
+        report = {"config": {"data_dir": self.data_dir, "repeats": self.repeats, "batch_size": self.batch_size}}
+        for name in ("qa", "contexts", "text"):
+            rows = best_seconds(getattr(self, f"{name}_rows"), self.repeats)
+            columns = best_seconds(getattr(self, f"{name}_columns"), self.repeats)
+            report[name] = {
+                "rows_seconds": round(rows, 6),
+                "columns_seconds": round(columns, 6),
+                "speedup": round(rows / columns, 1) if columns else None,
+            }
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark row-wise against column-wise dataset reads")
+    parser.add_argument("--data-dir", default=None)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=100)
+    args = parser.parse_args()
+    print(json.dumps(ReadBenchmark(args.data_dir, args.repeats, args.batch_size).run(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import resource
+import tempfile
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embedding.chunking import TextChunker
+from embedding.data_embedding import DataEmbedding, qa_context_records
+from embedding.exact_index import ExactIndex, exact_index_path
+from embedding.manifest import content_hash
+from retrieval.filters import parse_filters
+from retrieval.rerank import Reranker, create_scorer
+from retrieval.retriever import Retriever
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    return float(np.percentile(values, q)) if values else None
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class RetrievalBenchmark:
+    """Replay the SQuAD evaluation questions against their own contexts.
+
+    Every unique context is ingested (optionally chunked) into a scratch
+    collection; a question counts as recalled at k when any of the top-k hits
+    comes from the context it was asked about. Reports recall@k, MRR,
+    latency percentiles, QPS, ingestion throughput and peak RSS.
+
+    Vector-only runs are also scored against exact brute-force search over
+    the same vectors (`ExactIndex`), which measures what the approximate
+    index loses. Queries are served with the exact fast path off unless
+    `exact_search_max` is set.
+    """
+
+    COLLECTION = "squad_contexts"
+
+    def __init__(
+        self,
+        backend: Optional[str] = None,
+        embedding_dir: Optional[str] = None,
+        qa_path: Optional[str] = None,
+        ks=(1, 5, 10),
+        concurrency: int = 8,
+        limit: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        overlap: int = 32,
+        workers: int = 0,
+        use_embedding_cache: bool = False,
+        vector_weight: float = 1.0,
+        lexical_weight: float = 0.0,
+        rerank: bool = False,
+        rerank_backend: Optional[str] = None,
+        rerank_budget_ms: float = 200.0,
+        rerank_depth: int = 20,
+        vector_index: str = "chroma",
+        filter_by_title: bool = False,
+        exact_search_max: int = 0,
+    ):
+        base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
+        self.qa_path = qa_path or os.path.join(base_dir, 'evaluation', 'qa_pairs.json')
+        self.embedding_dir = embedding_dir or tempfile.mkdtemp(prefix="rag_benchmark_")
+        self.backend = backend
+        self.ks = tuple(sorted(ks))
+        self.concurrency = concurrency
+        self.limit = limit
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+        self.workers = workers
+        self.use_embedding_cache = use_embedding_cache
+        self.vector_weight = vector_weight
+        self.lexical_weight = lexical_weight
+        self.rerank = rerank
+        self.rerank_backend = rerank_backend
+        self.rerank_budget_ms = rerank_budget_ms
+        self.rerank_depth = rerank_depth
+        self.vector_index = vector_index
+        self.filter_by_title = filter_by_title
+        self.exact_search_max = exact_search_max
+
+    def load_qa_pairs(self) -> List[Dict]:
+        with open(self.qa_path, 'r', encoding='utf-8') as f:
+            qa_pairs = json.load(f)
+        return qa_pairs[:self.limit] if self.limit else qa_pairs
+
+    def ingest(self, qa_pairs: List[Dict]) -> Dict:
+        """Embed each distinct context once, chunked when max_tokens is set"""
+        data_embedder = DataEmbedding(
+            backend=self.backend,
+            embedding_dir=self.embedding_dir,
+            use_cache=self.use_embedding_cache,
+            vector_index=self.vector_index,
+        )
+        self.embedder = data_embedder.embedding_function
+
+        contexts = {content_hash(pair['context'])[:16] for pair in qa_pairs}
+        chunker = None
+        if self.max_tokens:
+            chunker = TextChunker(self.embedder, strategy="sentences", max_tokens=self.max_tokens, overlap=self.overlap)
+
+        start = time.perf_counter()
+        summary = data_embedder.ingest_records(self.COLLECTION, "squad", qa_context_records([pair['title'] for pair in qa_pairs], [pair['context'] for pair in qa_pairs], chunker), workers=self.workers)
+        seconds = time.perf_counter() - start
+        if not ExactIndex.exists(exact_index_path(self.embedding_dir, self.COLLECTION)):
+            # Ingestion skips the matrix for large collections; the recall reference needs it regardless
+            data_embedder.build_exact_index(self.COLLECTION)
+        return {
+            "contexts": len(contexts),
+            "chunks": summary.added + summary.skipped + summary.updated,
+            "embedded": summary.added,
+            "seconds": round(seconds, 4),
+            "docs_per_second": round(summary.added / seconds, 2) if seconds else None,
+            "stages": summary.stages,
+            "vector_index": summary.vector_index,
+        }
+
+    async def replay(self, retriever: Retriever, questions: List[str], k: int, filters: Optional[List[Optional[dict]]] = None):
+        """Send questions with at most `concurrency` in flight, timing each request.
+
+        `filters` holds an optional metadata filter per question. With reranking, the hits before the rerank stage and the time spent in
+        it are recorded as well, so one run shows what the stage costs and buys.
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        latencies = [0.0] * len(questions)
+        hits = [None] * len(questions)
+        retrieved = [None] * len(questions)
+        rerank_latencies = [0.0] * len(questions)
+        depth = max(k, self.rerank_depth) if self.rerank else k
+        filters = filters or [None] * len(questions)
+
+        async def one(i, question):
+            async with semaphore:
+                start = time.perf_counter()
+                if self.lexical_weight > 0:
+                    found = await retriever.ahybrid_search(
+                        question, depth, self.vector_weight, self.lexical_weight, filters=filters[i]
+                    )
+                else:
+                    found = await retriever.asearch(question, depth, filters=filters[i])
+                retrieved[i] = found[:k]
+                if self.rerank:
+                    rerank_start = time.perf_counter()
+                    found, _ = await retriever.arerank(question, found, self.rerank_budget_ms)
+                    rerank_latencies[i] = time.perf_counter() - rerank_start
+                hits[i] = found[:k]
+                latencies[i] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i, question) for i, question in enumerate(questions)))
+        wall = time.perf_counter() - start
+        await retriever.batcher.close()
+        return hits, latencies, wall, retrieved, rerank_latencies
+
+    def exact_reference(self, retriever: Retriever, questions: List[str], retrieved: List[List[dict]], k: int, filters=None) -> Dict:
+        """Overlap of the served top-k with exact search at each cut-off, and the cost of exact search"""
+        exact = ExactIndex(exact_index_path(self.embedding_dir, self.COLLECTION))
+        vectors = self.embedder.embed(questions)
+        start = time.perf_counter()
+        if filters is None:
+            expected, _ = exact.search(vectors, k)
+        else:
+            index = retriever.filter_index()
+            expected = []
+            for vector, query_filters in zip(vectors, filters):
+                rows = exact.rows(index.ids_at(index.select(parse_filters(query_filters))))
+                expected.append(exact.search(vector, k, rows=rows[rows >= 0])[0][0])
+        seconds = time.perf_counter() - start
+
+        overlap = {}
+        for cutoff in (cutoff for cutoff in self.ks if cutoff <= k):
+            found = [
+                len({hit['id'] for hit in hits[:cutoff]} & set(truth[:cutoff])) / max(1, len(truth[:cutoff]))
+                for hits, truth in zip(retrieved, expected)
+            ]
+            overlap[f"@{cutoff}"] = round(float(np.mean(found)), 4) if found else None
+        return {
+            "recall": overlap,
+            "dtype": exact.meta["dtype"],
+            "vectors": len(exact),
+            "seconds": round(seconds, 4),
+            "ms_per_query": round(seconds * 1000 / max(1, len(questions)), 3),
+        }
+
+    @staticmethod
+    def score(hits: List[List[dict]], expected: List[str], ks) -> Dict:
+        """recall@k and MRR at the largest k, ranking contexts by their best chunk"""
+        recall = {k: 0 for k in ks}
+        reciprocal_ranks = 0.0
+        for query_hits, context_id in zip(hits, expected):
+            ranked = list(dict.fromkeys(hit['metadata']['context_id'] for hit in query_hits))
+            if context_id in ranked:
+                rank = ranked.index(context_id) + 1
+                reciprocal_ranks += 1.0 / rank
+                for k in ks:
+                    recall[k] += rank <= k
+        total = len(expected) or 1
+        return {
+            "recall": {f"@{k}": round(recall[k] / total, 4) for k in ks},
+            f"mrr@{max(ks)}": round(reciprocal_ranks / total, 4),
+        }
+
+    def run(self) -> Dict:
+        qa_pairs = self.load_qa_pairs()
+        ingestion = self.ingest(qa_pairs)
+
+        retriever = Retriever(
+            embedding_dir=self.embedding_dir,
+            collection_name=self.COLLECTION,
+            embedder=self.embedder,
+            max_workers=self.concurrency,
+            cache_results=False,
+            exact_search_max=self.exact_search_max,
+            reranker=Reranker(create_scorer(self.rerank_backend), budget_ms=self.rerank_budget_ms, cache_size=0),
+        )
+        # Warm up first so the first replayed queries do not pay for model and segment loading
+        startup = retriever.warmup().snapshot()
+        # With chunking, fetch extra hits so k distinct contexts can be ranked
+        fetch_k = max(self.ks) * (4 if self.max_tokens else 1)
+        questions = [pair['question'] for pair in qa_pairs]
+        expected = [content_hash(pair['context'])[:16] for pair in qa_pairs]
+        # Scoping each question to its article's chunks exercises the filter index
+        filters = [{"title": pair['title']} for pair in qa_pairs] if self.filter_by_title else None
+        try:
+            hits, latencies, wall, retrieved, rerank_latencies = asyncio.run(
+                self.replay(retriever, questions, fetch_k, filters)
+            )
+        finally:
+            retriever.close()
+
+        report = {
+            "config": {
+                "backend": self.backend or os.getenv('EMBEDDING_BACKEND', 'local'),
+                "model": self.embedder.model_name,
+                "max_tokens": self.max_tokens,
+                "overlap": self.overlap if self.max_tokens else None,
+                "concurrency": self.concurrency,
+                "ingest_workers": self.workers,
+                "vector_weight": self.vector_weight,
+                "lexical_weight": self.lexical_weight,
+                "rerank": self.rerank,
+                "vector_index": self.vector_index,
+                "filter_by_title": self.filter_by_title,
+                "exact_search_max": self.exact_search_max,
+                "questions": len(questions),
+            },
+            "ingestion": ingestion,
+            "quality": self.score(hits, expected, self.ks),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50) * 1000, 3),
+                "p95": round(percentile(latencies, 95) * 1000, 3),
+                "p99": round(percentile(latencies, 99) * 1000, 3),
+                "mean": round(float(np.mean(latencies)) * 1000, 3),
+            },
+            "qps": round(len(questions) / wall, 2) if wall else None,
+            "warmup_seconds": startup["stages"],
+            "peak_rss_mb": round(peak_rss_mb(), 1),
+        }
+        if self.lexical_weight == 0:
+            report["exact_reference"] = self.exact_reference(retriever, questions, retrieved, fetch_k, filters)
+        if self.rerank:
+            stats = retriever.reranker.snapshot()
+            report["rerank"] = {
+                "backend": self.rerank_backend or os.getenv('RERANK_BACKEND', 'cross_encoder'),
+                "model": retriever.reranker.scorer.model_name,
+                "depth": max(fetch_k, self.rerank_depth),
+                "budget_ms": self.rerank_budget_ms,
+                "fallbacks": stats["fallbacks"],
+                "quality_before": self.score(retrieved, expected, self.ks),
+                "latency_ms": {
+                    "p50": round(percentile(rerank_latencies, 50) * 1000, 3),
+                    "p95": round(percentile(rerank_latencies, 95) * 1000, 3),
+                },
+            }
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and performance benchmark on the SQuAD evaluation set")
+    parser.add_argument("--backend", help="Embedding backend (default: EMBEDDING_BACKEND)")
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 5, 10], help="Cut-offs for recall@k")
+    parser.add_argument("--concurrency", type=int, default=8, help="Queries in flight at once")
+    parser.add_argument("--limit", type=int, help="Only use the first N questions")
+    parser.add_argument("--max-tokens", type=int, help="Chunk contexts into windows of this many tokens")
+    parser.add_argument("--overlap", type=int, default=32, help="Token overlap between chunks")
+    parser.add_argument("--workers", type=int, default=0, help="Ingestion worker processes")
+    parser.add_argument("--vector-weight", type=float, default=1.0, help="Fusion weight of vector search")
+    parser.add_argument("--lexical-weight", type=float, default=0.0, help="Fusion weight of BM25; above 0 runs hybrid search")
+    parser.add_argument("--vector-index", choices=["chroma", "int8", "pq"], default="chroma",
+                        help="Search Chroma's float32 HNSW index or a quantized index")
+    parser.add_argument("--filter-by-title", action="store_true",
+                        help="Restrict each question to chunks of its SQuAD article with a metadata filter")
+    parser.add_argument("--exact-search-max", type=int, default=0,
+                        help="Serve collections up to this size by exact search (default 0 measures the approximate index)")
+    parser.add_argument("--rerank", action="store_true", help="Rerank candidates with a cross-encoder")
+    parser.add_argument("--rerank-backend", help="Pair scorer for reranking (default: RERANK_BACKEND)")
+    parser.add_argument("--rerank-budget-ms", type=float, default=200.0, help="Per-query rerank time budget")
+    parser.add_argument("--rerank-depth", type=int, default=20, help="Candidates retrieved for the reranker")
+    parser.add_argument("--embedding-dir", help="Store to ingest into (default: a temporary directory)")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = RetrievalBenchmark(
+        backend=args.backend,
+        embedding_dir=args.embedding_dir,
+        ks=args.k,
+        concurrency=args.concurrency,
+        limit=args.limit,
+        max_tokens=args.max_tokens,
+        overlap=args.overlap,
+        workers=args.workers,
+        vector_weight=args.vector_weight,
+        lexical_weight=args.lexical_weight,
+        rerank=args.rerank,
+        rerank_backend=args.rerank_backend,
+        rerank_budget_ms=args.rerank_budget_ms,
+        rerank_depth=args.rerank_depth,
+        vector_index=args.vector_index,
+        filter_by_title=args.filter_by_title,
+        exact_search_max=args.exact_search_max,
+    ).run()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+        print(f"Saved benchmark report to {args.output}")
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,38 @@
-from datasets import load_from_disk
 import os
+import sys
 import json
-from typing import List, Dict
-import pandas as pd
+from typing import List, Dict, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from embedding.arrow_dataset import read_table
 
 class QAExtractor:
-    def __init__(self):
-        self.base_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
+    def __init__(self, base_dir: Optional[str] = None):
+        self.base_dir = base_dir or os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
         self.qa_path = os.path.join(self.base_dir, 'question_answer')
+
+    def extract_qa_table(self) -> pa.Table:
+        """Question, first answer, context and title columns, computed over the memory-mapped Arrow data"""
+        table = read_table(self.qa_path, ['question', 'answers', 'context', 'title'])
+        return pa.table({
+            'question': table.column('question'),
+            'answer': pc.list_element(pc.struct_field(table.column('answers'), 'text'), 0),  # Taking first answer
+            'context': table.column('context'),  # Keep context for verification
+            'title': table.column('title'),
+        })
         
     def extract_qa_pairs(self) -> List[Dict]:
         """Extract question-answer pairs from the dataset"""
-        dataset = load_from_disk(self.qa_path)
-        
-        qa_pairs = []
-        # Directly iterate over the dataset (no 'train' split needed)
-        for i in range(len(dataset)):
-            example = dataset[i]
-            qa_pairs.append({
-                'question': example['question'],
-                'answer': example['answers']['text'][0],  # Taking first answer
-                'context': example['context'],  # Keep context for verification
-                'title': example['title']  # Adding title field
-            })
-        return qa_pairs
+        return self.extract_qa_table().to_pylist()
     
     def save_qa_pairs(self, format: str = 'json'):
         """Save QA pairs in specified format"""
-        qa_pairs = self.extract_qa_pairs()
+        table = self.extract_qa_table()
+        qa_pairs = table.to_pylist()
         
         # Create evaluation directory if it doesn't exist
         eval_dir = os.path.join(self.base_dir, 'evaluation')
@@ -43,8 +48,7 @@ class QAExtractor:
         elif format == 'csv':
             # Save as CSV
             output_path = os.path.join(eval_dir, 'qa_pairs.csv')
-            df = pd.DataFrame(qa_pairs)
-            df.to_csv(output_path, index=False)
+            table.to_pandas().to_csv(output_path, index=False)
             print(f"Saved {len(qa_pairs)} QA pairs to {output_path}")
             
         # Save questions only (for testing)
@@ -71,12 +75,12 @@ def main():
     extractor = QAExtractor()
     
     # Print dataset structure first
-    dataset = load_from_disk(extractor.qa_path)
+    dataset = read_table(extractor.qa_path)
     print("Dataset structure:")
-    print(f"Number of examples: {len(dataset)}")
+    print(f"Number of examples: {dataset.num_rows}")
     print(f"Available fields: {dataset.column_names}")
     print("\nFirst example structure:")
-    print(dataset[0])
+    print(dataset.slice(0, 1).to_pylist()[0])
     
     # Save in both formats
     extractor.save_qa_pairs(format='json')
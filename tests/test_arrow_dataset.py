@@ -0,0 +1,68 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+import pyarrow as pa
+from datasets import Dataset, load_from_disk
+
+from embedding.arrow_dataset import dataset_files, first_occurrences, iter_record_batches, read_table
+from tests.benchmark_read import ReadBenchmark
+from tests.extract_qa import QAExtractor
+
+DATA_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
+
+
+class TestArrowDataset(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_reads_saved_dataset_without_copying(self):
+        """Test that the memory-mapped table matches load_from_disk and allocates no buffers"""
+        path = os.path.join(DATA_DIR, 'question_answer')
+        self.assertEqual([os.path.basename(name) for name in dataset_files(path)], ["data-00000-of-00001.arrow"])
+        allocated = pa.total_allocated_bytes()
+        table = read_table(path, ["id", "context"])
+        self.assertEqual(pa.total_allocated_bytes(), allocated)
+        self.assertEqual(table.column_names, ["id", "context"])
+        self.assertEqual(table.column("id").to_pylist(), load_from_disk(path)["id"])
+
+    def test_multiple_files_and_empty_datasets(self):
+        path = os.path.join(self.temp_dir, "shards")
+        Dataset.from_dict({"text": [f"row {i}" for i in range(10)]}).save_to_disk(path, num_shards=3)
+        self.assertEqual(len(dataset_files(path)), 3)
+        self.assertEqual(sum(batch.num_rows for batch in iter_record_batches(path)), 10)
+        self.assertEqual(read_table(path).column("text").to_pylist()[-1], "row 9")
+
+        empty = os.path.join(self.temp_dir, "empty")
+        Dataset.from_dict({"text": [], "title": []}).save_to_disk(empty)
+        self.assertEqual(read_table(empty, ["title"]).column_names, ["title"])
+
+    def test_first_occurrences(self):
+        table = pa.table({"title": ["a", "b", "c", "d"], "context": ["x", "y", "x", None]})
+        self.assertEqual(first_occurrences(table, "context").to_pylist(), [{"title": "a", "context": "x"}, {"title": "b", "context": "y"}])
+
+    def test_qa_extraction_matches_row_wise_reads(self):
+        """Test that column-wise extraction returns what the row-by-row loop did"""
+        extractor = QAExtractor(DATA_DIR)
+        pairs = extractor.extract_qa_pairs()
+        benchmark = ReadBenchmark(DATA_DIR, repeats=1)
+        self.assertEqual(pairs, benchmark.qa_rows())
+        titles, contexts = benchmark.contexts_columns()
+        self.assertEqual(dict(zip(contexts, titles)), benchmark.contexts_rows())
+        self.assertEqual(benchmark.text_columns(), benchmark.text_rows())
+
+    def test_benchmark_report(self):
+        report = ReadBenchmark(DATA_DIR, repeats=1).run()
+        json.dumps(report)
+        for name in ("qa", "contexts", "text"):
+            self.assertGreater(report[name]["rows_seconds"], 0)
+            self.assertGreater(report[name]["columns_seconds"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from observability.metrics import Histogram
+from retrieval.batcher import MicroBatcher
+
+
+class TestMicroBatcher(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def double(self, items):
+        with self.lock:
+            self.calls.append(list(items))
+        return [item * 2 for item in items]
+
+    def run_concurrently(self, batcher, items):
+        async def scenario():
+            try:
+                return await asyncio.gather(*(batcher.submit(item) for item in items))
+            finally:
+                await batcher.close()
+        return asyncio.run(scenario())
+
+    def test_coalesces_concurrent_requests(self):
+        """Test that concurrent submissions share one batch and get their own results"""
+        batcher = MicroBatcher(self.double, max_batch_size=64, max_wait_ms=50, executor=self.executor)
+        results = self.run_concurrently(batcher, list(range(10)))
+        self.assertEqual(results, [item * 2 for item in range(10)])
+        self.assertEqual(self.calls, [list(range(10))])
+
+    def test_max_batch_size(self):
+        """Test that batches never exceed max_batch_size"""
+        batcher = MicroBatcher(self.double, max_batch_size=4, max_wait_ms=50, executor=self.executor)
+        results = self.run_concurrently(batcher, list(range(10)))
+        self.assertEqual(results, [item * 2 for item in range(10)])
+        self.assertEqual(sorted(len(call) for call in self.calls), [2, 4, 4])
+
+    def test_errors_reach_every_caller(self):
+        """Test that a failing batch raises in each awaiting request"""
+        def fail(items):
+            raise RuntimeError("model crashed")
+
+        batcher = MicroBatcher(fail, max_wait_ms=10, executor=self.executor)
+
+        async def scenario():
+            try:
+                return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+            finally:
+                await batcher.close()
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+
+    def test_histograms(self):
+        """Test that batch size and latency histograms record each batch"""
+        batcher = MicroBatcher(self.double, max_batch_size=8, max_wait_ms=50, executor=self.executor)
+        self.run_concurrently(batcher, list(range(8)))
+        stats = batcher.stats()
+        self.assertEqual(stats["batch_size"]["count"], 1)
+        self.assertEqual(stats["batch_size"]["sum"], 8)
+        self.assertEqual(stats["batch_size"]["buckets"]["8"], 1)
+        self.assertEqual(stats["batch_size"]["buckets"]["4"], 0)
+        self.assertEqual(stats["batch_latency_seconds"]["count"], 1)
+
+    def test_survives_new_event_loop(self):
+        """Test that the batcher restarts its collector on a new event loop"""
+        batcher = MicroBatcher(self.double, max_wait_ms=1, executor=self.executor)
+        self.assertEqual(self.run_concurrently(batcher, [1]), [2])
+        self.assertEqual(self.run_concurrently(batcher, [3]), [6])
+
+    def test_invalid_configuration(self):
+        with self.assertRaises(ValueError):
+            MicroBatcher(self.double, max_batch_size=0)
+        with self.assertRaises(ValueError):
+            MicroBatcher(self.double, max_wait_ms=-1)
+
+
+class TestHistogram(unittest.TestCase):
+    def test_cumulative_buckets(self):
+        """Test that buckets are cumulative with an +Inf bucket"""
+        histogram = Histogram("test", [1, 5, 10])
+        for value in (0.5, 1, 3, 7, 20):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(snapshot["buckets"], {"1": 2, "5": 3, "10": 4, "+Inf": 5})
+        self.assertEqual(snapshot["count"], 5)
+        self.assertAlmostEqual(snapshot["sum"], 31.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+
+from tests.benchmark_retrieval import RetrievalBenchmark
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+
+class TestRetrievalBenchmark(unittest.TestCase):
+    def setUp(self):
+        self.embedding_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def test_report(self):
+        """Test that a small offline run produces a complete JSON report"""
+        report = RetrievalBenchmark(backend="hash", embedding_dir=self.embedding_dir, limit=40, concurrency=4).run()
+        json.dumps(report)
+
+        self.assertEqual(report["config"]["questions"], 40)
+        self.assertGreater(report["ingestion"]["contexts"], 0)
+        self.assertGreater(report["ingestion"]["docs_per_second"], 0)
+        recall = report["quality"]["recall"]
+        self.assertLessEqual(recall["@1"], recall["@5"])
+        self.assertLessEqual(recall["@5"], recall["@10"])
+        self.assertGreater(recall["@10"], 0)
+        self.assertLessEqual(report["latency_ms"]["p50"], report["latency_ms"]["p99"])
+        self.assertGreater(report["qps"], 0)
+        self.assertGreater(report["peak_rss_mb"], 0)
+        exact = report["exact_reference"]
+        self.assertLessEqual(exact["recall"]["@10"], 1.0)
+        self.assertGreater(exact["recall"]["@10"], 0.5)
+        self.assertEqual(exact["dtype"], "float32")
+
+    def test_rerank_report(self):
+        """Test that a rerank run reports quality before and after the stage"""
+        report = RetrievalBenchmark(
+            backend="hash", embedding_dir=self.embedding_dir, limit=20, rerank=True, rerank_backend="overlap"
+        ).run()
+        rerank = report["rerank"]
+        self.assertEqual(rerank["depth"], 20)
+        self.assertIn("@10", rerank["quality_before"]["recall"])
+        self.assertGreaterEqual(rerank["latency_ms"]["p95"], rerank["latency_ms"]["p50"])
+        self.assertEqual(rerank["fallbacks"], 0)
+
+    def test_quantized_index_report(self):
+        """Test a run served from the int8 index, with its recall loss against exact search"""
+        baseline = RetrievalBenchmark(backend="hash", embedding_dir=tempfile.mkdtemp(dir=self.embedding_dir), limit=20).run()
+        report = RetrievalBenchmark(
+            backend="hash", embedding_dir=self.embedding_dir, limit=20, vector_index="int8"
+        ).run()
+        index = report["ingestion"]["vector_index"]
+        self.assertEqual(index["method"], "int8")
+        self.assertEqual(index["compression"], 4.0)
+        self.assertGreaterEqual(index["recall"]["rescored"], index["recall"]["codes"])
+        self.assertEqual(report["quality"], baseline["quality"])
+
+    def test_exact_search_report(self):
+        """Test that serving from the exact index reproduces its own reference"""
+        report = RetrievalBenchmark(backend="hash", embedding_dir=self.embedding_dir, limit=20, exact_search_max=100000).run()
+        self.assertEqual(report["config"]["exact_search_max"], 100000)
+        self.assertEqual(report["exact_reference"]["recall"]["@10"], 1.0)
+
+    def test_title_filtered_report(self):
+        """Test that scoping questions to their article keeps or improves recall"""
+        baseline = RetrievalBenchmark(backend="hash", embedding_dir=tempfile.mkdtemp(dir=self.embedding_dir), limit=40).run()
+        report = RetrievalBenchmark(backend="hash", embedding_dir=self.embedding_dir, limit=40, filter_by_title=True).run()
+        self.assertTrue(report["config"]["filter_by_title"])
+        for k in ("@1", "@5", "@10"):
+            self.assertGreaterEqual(report["quality"]["recall"][k], baseline["quality"]["recall"][k])
+
+    def test_score(self):
+        """Test recall@k and MRR on hand-made rankings"""
+        def hits(*context_ids):
+            return [{"metadata": {"context_id": context_id}} for context_id in context_ids]
+
+        scores = RetrievalBenchmark.score(
+            [hits("a", "b"), hits("c", "c", "b"), hits("x", "y")],
+            ["a", "b", "z"],
+            ks=(1, 2),
+        )
+        self.assertEqual(scores["recall"], {"@1": round(1 / 3, 4), "@2": round(2 / 3, 4)})
+        self.assertEqual(scores["mrr@2"], round((1 + 0.5) / 3, 4))
+
+
+if __name__ == '__main__':
+    unittest.main()
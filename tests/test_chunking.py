@@ -0,0 +1,94 @@
+import os
+import unittest
+
+from embedding.chunking import TextChunker, iter_dataset_texts
+from embedding.embedders import HashEmbedder
+
+SAMPLE = (
+    "First Citizen:\nBefore we proceed any further, hear me speak.\n\n"
+    "All:\nSpeak, speak.\n\n"
+    "First Citizen:\nYou are all resolved rather to die than to famish? We know it. "
+    "Caius Marcius is chief enemy to the people.\n\n"
+    "Second Citizen:\nOne word, good citizens.\n"
+)
+
+
+class TestTextChunker(unittest.TestCase):
+    def setUp(self):
+        self.embedder = HashEmbedder(dimension=16)
+
+    def assertChunksValid(self, chunker, text):
+        chunks = list(chunker.chunk_text(text, row=3))
+        self.assertGreater(len(chunks), 0)
+        for index, chunk in enumerate(chunks):
+            self.assertEqual(chunk.index, index)
+            self.assertEqual(chunk.row, 3)
+            # Offsets map back to the source span
+            self.assertEqual(text[chunk.start:chunk.end], chunk.text)
+            # Nothing exceeds the token budget, so nothing gets truncated by the model
+            self.assertLessEqual(len(self.embedder.token_spans(chunk.text)), chunker.max_tokens)
+            self.assertEqual(len(self.embedder.token_spans(chunk.text)), chunk.n_tokens)
+        # Every token of the source is covered by some chunk
+        covered = set()
+        for chunk in chunks:
+            covered.update(range(chunk.start, chunk.end))
+        for start, _ in self.embedder.token_spans(text):
+            self.assertIn(start, covered)
+        return chunks
+
+    def test_token_windows_overlap(self):
+        """Test fixed token windows and their overlap"""
+        chunker = TextChunker(self.embedder, strategy="tokens", max_tokens=10, overlap=3)
+        chunks = self.assertChunksValid(chunker, SAMPLE)
+        for previous, current in zip(chunks, chunks[1:]):
+            self.assertEqual(previous.n_tokens, 10)
+            self.assertLess(current.start, previous.end)
+
+    def test_speaker_boundaries(self):
+        """Test that speaker turns are kept whole when they fit"""
+        chunker = TextChunker(self.embedder, strategy="speakers", max_tokens=20, overlap=0)
+        chunks = self.assertChunksValid(chunker, SAMPLE)
+        self.assertTrue(chunks[0].text.startswith("First Citizen:"))
+        self.assertTrue(chunks[-1].text.startswith("Second Citizen:"))
+
+    def test_sentence_boundaries(self):
+        """Test that sentence windows end on sentence punctuation"""
+        chunker = TextChunker(self.embedder, strategy="sentences", max_tokens=12, overlap=4)
+        chunks = self.assertChunksValid(chunker, SAMPLE)
+        for chunk in chunks[:-1]:
+            self.assertIn(chunk.text[-1], ".!?:")
+
+    def test_oversized_unit_falls_back_to_token_windows(self):
+        """Test that a turn longer than the budget is split instead of truncated"""
+        text = "Speaker:\n" + " ".join(f"word{i}" for i in range(50))
+        chunker = TextChunker(self.embedder, strategy="speakers", max_tokens=8, overlap=2)
+        chunks = self.assertChunksValid(chunker, text)
+        self.assertGreater(len(chunks), 6)
+
+    def test_invalid_configuration(self):
+        """Test rejection of unknown strategies and impossible budgets"""
+        with self.assertRaises(ValueError):
+            TextChunker(self.embedder, strategy="paragraphs")
+        with self.assertRaises(ValueError):
+            TextChunker(self.embedder, max_tokens=self.embedder.max_content_tokens + 1)
+        with self.assertRaises(ValueError):
+            TextChunker(self.embedder, max_tokens=10, overlap=10)
+
+    def test_empty_text(self):
+        """Test that empty or blank text yields no chunks"""
+        for strategy in TextChunker.STRATEGIES:
+            chunker = TextChunker(self.embedder, strategy=strategy)
+            self.assertEqual(list(chunker.chunk_text("  \n\n ")), [])
+
+    def test_dataset_stream(self):
+        """Test streaming rows from the saved text corpus"""
+        data_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'data', 'ragData'))
+        rows = iter_dataset_texts(os.path.join(data_dir, 'text_corpus'))
+        chunker = TextChunker(self.embedder, strategy="speakers", max_tokens=128)
+        first = next(chunker.chunk_rows(rows))
+        self.assertEqual(first.row, 0)
+        self.assertTrue(first.text.startswith("First Citizen"))
+
+
+if __name__ == '__main__':
+    unittest.main()
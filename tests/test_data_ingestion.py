@@ -1,6 +1,14 @@
 import os
+import json
+import shutil
+import tempfile
 import unittest
-from datasets import load_from_disk
+from unittest import mock
+
+from datasets import Dataset, load_from_disk
+
+from data_ingestion.data_ingestion import DatasetSource, load_sources, prepare_datasets, verify_dataset
+from embedding.chunking import iter_dataset_texts
 
 class TestDataIngestion(unittest.TestCase):
     def setUp(self):
@@ -24,6 +32,81 @@ class TestDataIngestion(unittest.TestCase):
         except Exception:
             self.fail("Failed to load text-corpus dataset from disk.")
 
+class TestPrepareDatasets(unittest.TestCase):
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.data_dir = tempfile.mkdtemp()
+        self.text_path = os.path.join(self.source_dir, 'input.txt')
+        with open(self.text_path, 'w') as f:
+            f.write("First Citizen:\nBefore we proceed any further, hear me speak.\n\nAll:\nSpeak, speak.\n")
+        self.qa_dir = os.path.join(self.source_dir, 'squad')
+        os.makedirs(self.qa_dir)
+        for part in range(2):
+            with open(os.path.join(self.qa_dir, f'part-{part}.jsonl'), 'w') as f:
+                for row in range(3):
+                    f.write(json.dumps({"title": f"T{part}", "context": f"Context {part}-{row}"}) + "\n")
+        self.sources = {
+            "text_corpus": DatasetSource(self.text_path),
+            "question_answer": DatasetSource(self.qa_dir, split="train[:5]"),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.source_dir, ignore_errors=True)
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_prepare_from_local_sources(self):
+        """Test that local files are prepared, in worker processes, into datasets ingestion can read"""
+        reports = prepare_datasets(self.data_dir, self.sources, workers=2)
+        self.assertEqual(reports["text_corpus"]["rows"], 1)
+        self.assertEqual(reports["question_answer"]["rows"], 5)
+        self.assertEqual(reports["question_answer"]["columns"], ["title", "context"])
+        self.assertTrue(all(report["prepared"] for report in reports.values()))
+        texts = [text for _, text in iter_dataset_texts(os.path.join(self.data_dir, 'text_corpus'))]
+        self.assertEqual(texts, [open(self.text_path).read()])
+        self.assertEqual(len(load_from_disk(os.path.join(self.data_dir, 'question_answer'))), 5)
+        self.assertEqual(sorted(os.listdir(self.data_dir)), ["question_answer", "text_corpus"])
+
+    def test_unchanged_datasets_are_skipped(self):
+        """Test that a rerun only prepares datasets whose source or saved files changed"""
+        prepare_datasets(self.data_dir, self.sources)
+        with mock.patch("data_ingestion.data_ingestion.ProcessPoolExecutor") as pool:
+            reports = prepare_datasets(self.data_dir, self.sources)
+        pool.assert_not_called()
+        self.assertFalse(any(report["prepared"] for report in reports.values()))
+        self.assertEqual(reports["question_answer"]["rows"], 5)
+
+        with open(self.text_path, 'a') as f:
+            f.write("\nMENENIUS:\nWhat work's, my countrymen, in hand?\n")
+        reports = prepare_datasets(self.data_dir, self.sources)
+        self.assertEqual((reports["text_corpus"]["prepared"], reports["question_answer"]["prepared"]), (True, False))
+
+        # A changed split is a different source, and damaged files are prepared again
+        self.sources["question_answer"] = DatasetSource(self.qa_dir)
+        self.assertEqual(prepare_datasets(self.data_dir, self.sources)["question_answer"]["rows"], 6)
+        prepared_path = os.path.join(self.data_dir, 'text_corpus', 'prepared.json')
+        with open(prepared_path) as f:
+            prepared = json.load(f)
+        with open(prepared_path, 'w') as f:
+            json.dump({**prepared, "rows": 2}, f)
+        with self.assertRaises(ValueError):
+            verify_dataset(os.path.join(self.data_dir, 'text_corpus'))
+        self.assertTrue(prepare_datasets(self.data_dir, self.sources)["text_corpus"]["prepared"])
+        self.assertTrue(all(report["prepared"] for report in prepare_datasets(self.data_dir, self.sources, force=True).values()))
+
+    def test_saved_dataset_source_and_overrides(self):
+        """Test that a saved dataset directory is copied as a source and that DATASET_SOURCES overrides keep their split"""
+        saved_path = os.path.join(self.source_dir, 'saved')
+        Dataset.from_dict({"text": ["To be, or not to be"]}).save_to_disk(saved_path)
+        reports = prepare_datasets(self.data_dir, {"text_corpus": DatasetSource(saved_path)})
+        self.assertEqual((reports["text_corpus"]["rows"], reports["text_corpus"]["columns"]), (1, ["text"]))
+
+        sources = load_sources(json.dumps({"question_answer": self.qa_dir}))
+        self.assertEqual((sources["question_answer"].path, sources["question_answer"].split), (self.qa_dir, "train[:1000]"))
+        self.assertFalse(sources["text_corpus"].is_local)
+        with self.assertRaises(ValueError):
+            load_sources(json.dumps(["text_corpus"]))
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,80 @@
+import shutil
+import logging
+import tempfile
+import unittest
+
+from embedding.data_embedding import DataEmbedding
+from embedding.dedup import DuplicateFilter, MinHasher, normalize_text, shingles
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+NORMANS = ("The Normans were the people who in the 10th and 11th centuries gave their name to Normandy, "
+           "a region in France. They were descended from Norse raiders and pirates from Denmark, Iceland and Norway.")
+NORMANS_EDITED = NORMANS.replace("a region in France", "a region of France")
+ROMEO = "Romeo and Juliet is a tragedy written by William Shakespeare early in his career about two young lovers."
+
+
+class TestDuplicateFilter(unittest.TestCase):
+    def test_normalized_shingles(self):
+        self.assertEqual(normalize_text("  Speak,\nSPEAK!  "), "speak speak")
+        self.assertEqual(shingles("one two three four"), ["one two three", "two three four"])
+        self.assertEqual(shingles("All: speak"), ["all speak"])
+
+    def test_minhash_estimates_jaccard(self):
+        hasher = MinHasher(num_perm=256)
+        first, second = set(shingles(NORMANS)), set(shingles(NORMANS_EDITED))
+        jaccard = len(first & second) / len(first | second)
+        estimate = MinHasher.similarity(hasher.signature(NORMANS), hasher.signature(NORMANS_EDITED))
+        self.assertAlmostEqual(estimate, jaccard, delta=0.1)
+        self.assertEqual(MinHasher().signature(ROMEO).tolist(), MinHasher().signature(ROMEO).tolist())
+        self.assertLess(MinHasher.similarity(hasher.signature(NORMANS), hasher.signature(ROMEO)), 0.2)
+
+    def test_exact_and_near_duplicates(self):
+        """Test that repeats are reported with the key of the first occurrence and counted by kind"""
+        minhash = DuplicateFilter("minhash", threshold=0.7)
+        self.assertIsNone(minhash.duplicate_of("a", NORMANS))
+        self.assertIsNone(minhash.duplicate_of("b", ROMEO))
+        self.assertEqual(minhash.duplicate_of("c", NORMANS.upper()), "a")
+        self.assertEqual(minhash.duplicate_of("d", NORMANS_EDITED), "a")
+        self.assertEqual((minhash.exact, minhash.near, minhash.removed), (1, 1, 2))
+
+        exact = DuplicateFilter("exact")
+        exact.duplicate_of("a", NORMANS)
+        self.assertIsNone(exact.duplicate_of("d", NORMANS_EDITED))
+        self.assertEqual(exact.duplicate_of("c", " " + NORMANS), "a")
+
+        with self.assertRaises(ValueError):
+            DuplicateFilter("simhash")
+
+
+class TestIngestionDedup(unittest.TestCase):
+    def setUp(self):
+        self.embedding_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def test_duplicates_are_not_embedded(self):
+        """Test that ingestion drops (near-)duplicate records before embedding and reports them"""
+        records = [(NORMANS, {"row": 0}), (ROMEO, {"row": 1}), (NORMANS, {"row": 2}), (NORMANS_EDITED, {"row": 3})]
+        data_embedder = DataEmbedding(backend="hash", embedding_dir=self.embedding_dir, dedup="minhash")
+        data_embedder.dedup_threshold = 0.7
+        summary = data_embedder.ingest_records("contexts", "ctx", records)
+        self.assertEqual((summary.added, summary.duplicates), (2, 2))
+        self.assertIn("2 duplicates dropped", str(summary))
+        stored = data_embedder.client.get_collection("contexts").get(include=["metadatas"])
+        self.assertEqual(sorted(metadata["row"] for metadata in stored["metadatas"]), [0, 1])
+
+        # Reruns make the same decisions, so nothing changes
+        summary = data_embedder.ingest_records("contexts", "ctx", records)
+        self.assertEqual((summary.added, summary.skipped, summary.deleted, summary.duplicates), (0, 2, 0, 2))
+
+        # Without deduplication the identical text is stored again under an occurrence suffix
+        summary = DataEmbedding(backend="hash", embedding_dir=self.embedding_dir).ingest_records("contexts", "ctx", records)
+        self.assertEqual((summary.added, summary.duplicates), (2, 0))
+        with self.assertRaises(ValueError):
+            DataEmbedding(backend="hash", embedding_dir=self.embedding_dir, dedup="simhash")
+
+
+if __name__ == '__main__':
+    unittest.main()
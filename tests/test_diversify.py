@@ -0,0 +1,82 @@
+import shutil
+import asyncio
+import logging
+import tempfile
+import unittest
+
+import numpy as np
+
+from embedding.data_embedding import DataEmbedding
+from retrieval.diversify import adiversify, mmr
+from retrieval.router import CollectionRouter
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+RECORDS = [
+    ("Now is the winter of our discontent made glorious summer by this sun of York", {"play": "Richard III"}),
+    ("Now is the winter of our discontent made glorious summer by this son of York", {"play": "Richard III"}),
+    ("Now is the winter of our discontent, made glorious summer by this sun of York!", {"play": "Richard III"}),
+    ("Shall I compare thee to a summer's day? Thou art more lovely and more temperate", {"play": "Sonnet 18"}),
+    ("Rough winds do shake the darling buds of May, and summer's lease hath all too short a date", {"play": "Sonnet 18"}),
+]
+
+
+class TestMMR(unittest.TestCase):
+    def test_selection(self):
+        """Test that MMR trades relevance for novelty and that lambda 1 keeps the relevance order"""
+        query = np.array([1.0, 0.0, 0.0])
+        candidates = np.array([[1.0, 0.1, 0.0], [1.0, 0.12, 0.0], [0.7, 0.0, 0.7], [0.0, 1.0, 0.0]])
+        self.assertEqual(mmr(query, candidates, 3, mmr_lambda=1.0), ([0, 1, 2], 0))
+        self.assertEqual(mmr(query, candidates, 2, mmr_lambda=0.5), ([0, 2], 0))
+        self.assertEqual(mmr(query, candidates, 3, mmr_lambda=1.0, duplicate_threshold=0.99), ([0, 2, 3], 1))
+        self.assertEqual(mmr(query, candidates[:0], 3), ([], 0))
+        self.assertEqual(mmr(query, candidates, 0), ([], 0))
+
+
+class TestDiversify(unittest.TestCase):
+    def setUp(self):
+        self.embedding_dir = tempfile.mkdtemp()
+        data_embedder = DataEmbedding(backend="hash", embedding_dir=self.embedding_dir)
+        data_embedder.ingest_records("lines", "line", RECORDS)
+        data_embedder.ingest_records("verses", "verse", RECORDS)
+        self.router = CollectionRouter(self.embedding_dir, default_collection="lines", embedder=data_embedder.embedding_function)
+
+    def tearDown(self):
+        self.router.close()
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def test_near_duplicate_hits_are_removed(self):
+        """Test that retrieved restatements of one passage collapse into a single hit"""
+        text = "winter of our discontent and summer"
+
+        async def run():
+            hits = await self.router.asearch(["lines"], text, k=5)
+            return hits, await adiversify(self.router, text, hits, 3, duplicate_threshold=0.8)
+
+        hits, (diversified, report) = asyncio.run(run())
+        self.assertEqual(report, {"candidates": 5, "duplicates_removed": 2})
+        self.assertEqual(diversified[0]["id"], hits[0]["id"])
+        self.assertEqual(sum(hit["metadata"]["play"] == "Richard III" for hit in diversified), 1)
+        self.assertEqual(len(diversified), 3)
+
+        # Hits whose vectors are missing still fill the list
+        missing = [{"id": "gone", "distance": 0.0}]
+        diversified, report = asyncio.run(adiversify(self.router, text, missing + hits[:1], 2))
+        self.assertEqual([hit["id"] for hit in diversified], [hits[0]["id"], "gone"])
+        self.assertEqual(asyncio.run(adiversify(self.router, text, [], 2)), ([], {"candidates": 0, "duplicates_removed": 0}))
+
+    def test_non_default_collection(self):
+        """Test that untagged hits of a single-collection search are looked up in the searched collection"""
+        text = "winter of our discontent and summer"
+
+        async def run():
+            hits = await self.router.asearch(["verses"], text, k=5)
+            return await adiversify(self.router, text, hits, 3, duplicate_threshold=0.8, collections=["verses"])
+
+        diversified, report = asyncio.run(run())
+        self.assertEqual(report, {"candidates": 5, "duplicates_removed": 2})
+        self.assertTrue(all(hit["id"].startswith("verse") for hit in diversified))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+import chromadb
+import numpy as np
+
+from embedding.embedders import (
+    Embedder,
+    HashEmbedder,
+    SentenceTransformerEmbedder,
+    create_embedder,
+)
+
+
+class TestHashEmbedder(unittest.TestCase):
+    def setUp(self):
+        self.embedder = HashEmbedder(dimension=64, batch_size=2)
+
+    def test_deterministic(self):
+        """Test that the same text always maps to the same vector"""
+        first = self.embedder.embed(["To be, or not to be"])
+        second = HashEmbedder(dimension=64).embed(["To be, or not to be"])
+        np.testing.assert_array_equal(first, second)
+
+    def test_shape_and_normalization(self):
+        """Test output shape and unit-length rows"""
+        vectors = self.embedder.embed(["love", "hate and love", "joy"])
+        self.assertEqual(vectors.shape, (3, 64))
+        self.assertEqual(vectors.dtype, np.float32)
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-5)
+
+    def test_bucketing_preserves_order(self):
+        """Test that length-sorted batching returns vectors in input order"""
+        texts = ["a much longer piece of text here", "short", "medium length text", "x"]
+        batched = self.embedder.embed(texts)
+        single = np.vstack([self.embedder.embed([text]) for text in texts])
+        np.testing.assert_allclose(batched, single)
+
+    def test_lexical_similarity(self):
+        """Test that texts sharing words are closer than unrelated texts"""
+        query, related, unrelated = self.embedder.embed(
+            ["king richard", "richard the king speaks", "a ship at sea"]
+        )
+        self.assertGreater(query @ related, query @ unrelated)
+
+    def test_empty_input(self):
+        """Test embedding an empty list"""
+        self.assertEqual(self.embedder.embed([]).shape, (0, 64))
+
+    def test_chroma_embedding_function(self):
+        """Test that embedders plug into Chroma as embedding functions"""
+        temp_dir = tempfile.mkdtemp()
+        try:
+            client = chromadb.PersistentClient(path=temp_dir)
+            collection = client.get_or_create_collection("test", embedding_function=self.embedder)
+            collection.add(documents=["love", "war"], ids=["a", "b"])
+            results = collection.query(query_texts=["love"], n_results=1)
+            self.assertEqual(results['ids'][0][0], "a")
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class TestCreateEmbedder(unittest.TestCase):
+    def test_hash_backend(self):
+        """Test creating the hash backend with options"""
+        embedder = create_embedder("hash", dimension=32)
+        self.assertIsInstance(embedder, Embedder)
+        self.assertEqual(embedder.dimension, 32)
+
+    def test_unknown_backend(self):
+        """Test that an unknown backend name is rejected"""
+        with self.assertRaises(ValueError):
+            create_embedder("does-not-exist")
+
+    def test_env_options(self):
+        """Test that EMBEDDING_* variables configure the backend"""
+        os.environ['EMBEDDING_BATCH_SIZE'] = '7'
+        try:
+            self.assertEqual(create_embedder("hash").batch_size, 7)
+            self.assertEqual(create_embedder("hash", batch_size=3).batch_size, 3)
+        finally:
+            del os.environ['EMBEDDING_BATCH_SIZE']
+
+    def test_local_backend_is_lazy(self):
+        """Test that the local backend does not load the model on construction"""
+        embedder = create_embedder("local", num_threads=2, quantize=True)
+        self.assertIsInstance(embedder, SentenceTransformerEmbedder)
+        self.assertTrue(embedder.use_onnx)
+        self.assertIsNone(embedder._model)
+
+    def test_invalid_batch_size(self):
+        """Test that a non-positive batch size is rejected"""
+        with self.assertRaises(ValueError):
+            HashEmbedder(batch_size=0)
+
+
+@unittest.skipUnless(importlib.util.find_spec("sentence_transformers"), "sentence-transformers not installed")
+class TestSentenceTransformerEmbedder(unittest.TestCase):
+    def test_embed(self):
+        """Test the local model produces normalized 768-dim vectors"""
+        embedder = SentenceTransformerEmbedder(batch_size=4)
+        vectors = embedder.embed(["To be, or not to be", "that is the question"])
+        self.assertEqual(vectors.shape, (2, 768))
+        np.testing.assert_allclose(np.linalg.norm(vectors, axis=1), 1.0, rtol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main()
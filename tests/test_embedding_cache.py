@@ -0,0 +1,169 @@
+import shutil
+import tempfile
+import unittest
+import multiprocessing
+
+import numpy as np
+
+from embedding.cache import CachedEmbedder, EmbeddingCache, cache_key, normalize_text
+from embedding.embedders import HashEmbedder
+
+
+class CountingEmbedder(HashEmbedder):
+    """Hash embedder that records how many texts actually reach the model"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.embedded = 0
+
+    def _embed_batch(self, texts):
+        self.embedded += len(texts)
+        return super()._embed_batch(texts)
+
+
+def fill_cache(cache_dir: str, writer: int, count: int = 200):
+    """Store `count` keys whose vectors all equal `writer`'s number, a few at a time"""
+    cache = EmbeddingCache(cache_dir, "model", dimension=4, max_disk_items=1000)
+    for start in range(0, count, 5):
+        keys = [f"{writer}-{i}".encode() for i in range(start, start + 5)]
+        cache.put_many(keys, np.full((5, 4), writer, dtype=np.float32))
+    cache.close()
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return EmbeddingCache(self.cache_dir, "model", dimension=4, **options)
+
+    def test_key_normalization(self):
+        """Test that keys ignore whitespace differences but not model or content"""
+        self.assertEqual(normalize_text("  To be,\n or   not "), "To be, or not")
+        self.assertEqual(cache_key("m", "a  b"), cache_key("m", "a b"))
+        self.assertNotEqual(cache_key("m", "a b"), cache_key("other", "a b"))
+        self.assertNotEqual(cache_key("m", "a b"), cache_key("m", "a c"))
+
+    def test_memory_and_disk_tiers(self):
+        """Test hits from memory, then from disk after reopening"""
+        cache = self.make_cache(max_memory_items=1)
+        vectors = np.arange(8, dtype=np.float32).reshape(2, 4)
+        cache.put_many([b"a", b"b"], vectors)
+
+        found = cache.get_many([b"a", b"b", b"c"])
+        np.testing.assert_array_equal(found[b"a"], vectors[0])
+        np.testing.assert_array_equal(found[b"b"], vectors[1])
+        self.assertNotIn(b"c", found)
+        self.assertEqual(cache.stats["memory_hits"], 1)
+        self.assertEqual(cache.stats["disk_hits"], 1)
+        self.assertEqual(cache.misses, 1)
+        cache.close()
+
+        reopened = self.make_cache()
+        found = reopened.get_many([b"a"])
+        np.testing.assert_array_equal(found[b"a"], vectors[0])
+        self.assertEqual(reopened.stats["disk_hits"], 1)
+
+    def test_lru_eviction(self):
+        """Test that the disk tier evicts the least recently used entries"""
+        cache = self.make_cache(max_memory_items=0, max_disk_items=2, dtype="float32")
+        cache.put_many([b"a"], np.ones((1, 4)))
+        cache.put_many([b"b"], np.full((1, 4), 2.0))
+        cache.get_many([b"a"])  # a is now more recent than b
+        cache.put_many([b"c"], np.full((1, 4), 3.0))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.stats["evictions"], 1)
+        found = cache.get_many([b"a", b"b", b"c"])
+        self.assertEqual(set(found), {b"a", b"c"})
+        np.testing.assert_array_equal(found[b"c"], np.full(4, 3.0))
+
+    def test_float16_storage(self):
+        """Test that float16 storage round-trips within half precision"""
+        cache = self.make_cache(max_memory_items=0)
+        vector = np.array([[0.1234567, -0.5, 0.25, 1.0]], dtype=np.float32)
+        cache.put_many([b"x"], vector)
+        np.testing.assert_allclose(cache.get_many([b"x"])[b"x"], vector[0], rtol=1e-3)
+
+    def test_tiers_agree(self):
+        """Test that a memory hit, a disk hit and the first embedding of a text are the same vector"""
+        vector = np.array([[0.1234567, -0.3333333, 0.7071068, 1e-4]], dtype=np.float32)
+        cache = self.make_cache(max_memory_items=1)
+        stored = cache.put_many([b"x"], vector)
+        from_memory = cache.get_many([b"x"])[b"x"]
+        cache.put_many([b"y"], vector)  # pushes x out of memory
+        from_disk = cache.get_many([b"x"])[b"x"]
+        self.assertEqual((cache.stats["memory_hits"], cache.stats["disk_hits"]), (1, 1))
+        np.testing.assert_array_equal(from_memory, from_disk)
+        np.testing.assert_array_equal(stored[0], from_disk)
+
+        embedder = CachedEmbedder(HashEmbedder(dimension=16), self.cache_dir)
+        first = embedder.embed(["Speak, speak."])
+        embedder.cache._memory.clear()
+        np.testing.assert_array_equal(first, embedder.embed(["Speak, speak."]))
+
+    def test_concurrent_writer_processes(self):
+        """Test that processes sharing a cache directory never claim the same row"""
+        EmbeddingCache(self.cache_dir, "model", dimension=4, max_disk_items=1000).close()
+        context = multiprocessing.get_context("spawn")
+        writers = [context.Process(target=fill_cache, args=(self.cache_dir, writer)) for writer in range(1, 5)]
+        for process in writers:
+            process.start()
+        for process in writers:
+            process.join()
+        self.assertTrue(all(process.exitcode == 0 for process in writers))
+
+        cache = EmbeddingCache(self.cache_dir, "model", dimension=4, max_disk_items=1000)
+        self.addCleanup(cache.close)
+        keys = [f"{writer}-{i}".encode() for writer in range(1, 5) for i in range(200)]
+        found = cache.get_many(keys)
+        self.assertEqual(len(found), len(keys))
+        self.assertTrue(all((found[key] == float(key.split(b"-")[0])).all() for key in keys))
+
+    def test_capacity_change_resets(self):
+        """Test that reopening with a different capacity starts empty"""
+        self.make_cache().put_many([b"a"], np.ones((1, 4)))
+        self.assertEqual(len(self.make_cache(max_disk_items=10)), 0)
+
+
+class TestCachedEmbedder(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.inner = CountingEmbedder(dimension=16)
+        self.embedder = CachedEmbedder(self.inner, self.cache_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+
+    def test_repeated_texts_embedded_once(self):
+        """Test that duplicates within and across calls reach the model once"""
+        texts = ["same context", "other", "same context", "same   context"]
+        vectors = self.embedder.embed(texts)
+        self.assertEqual(self.inner.embedded, 2)
+        np.testing.assert_allclose(vectors, self.inner.embed(texts), rtol=1e-3)
+
+        self.inner.embedded = 0
+        self.embedder.embed(["other", "same context"])
+        self.assertEqual(self.inner.embedded, 0)
+        self.assertGreater(self.embedder.cache.hit_rate, 0)
+
+    def test_persists_across_instances(self):
+        """Test that a new process can reuse vectors from disk"""
+        self.embedder.embed(["to be or not to be"])
+        inner = CountingEmbedder(dimension=16)
+        CachedEmbedder(inner, self.cache_dir).embed(["to be or not to be"])
+        self.assertEqual(inner.embedded, 0)
+
+    def test_delegates_model_properties(self):
+        """Test that the wrapper looks like the wrapped embedder"""
+        self.assertEqual(self.embedder.model_name, self.inner.model_name)
+        self.assertEqual(self.embedder.dimension, 16)
+        self.assertEqual(self.embedder.max_content_tokens, self.inner.max_content_tokens)
+        self.assertEqual(self.embedder.token_spans("a b"), self.inner.token_spans("a b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
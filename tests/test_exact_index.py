@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from embedding.data_embedding import DataEmbedding
+from embedding.exact_index import ExactIndex, exact_index_path, top_k
+from embedding.quantized_index import squared_l2
+from retrieval.retriever import Retriever
+from tests.test_quantized_index import clustered_vectors
+
+
+class TestExactIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.vectors = clustered_vectors()
+        cls.ids = [f"doc_{i}" for i in range(len(cls.vectors))]
+        batches = [(cls.ids[i:i + 100], cls.vectors[i:i + 100]) for i in range(0, len(cls.ids), 100)]
+        cls.index = ExactIndex.build(os.path.join(cls.temp_dir, "float32"), batches, model_name="m")
+        cls.half = ExactIndex.build(os.path.join(cls.temp_dir, "float16"), batches, dtype="float16")
+        cls.queries = clustered_vectors(n=20, seed=1)
+        cls.expected = np.argsort(squared_l2(cls.queries, cls.vectors), axis=1, kind='stable')[:, :10]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def test_matches_brute_force(self):
+        """Test that blocked, threaded search returns the full-sort top-k with exact distances"""
+        for block_size, parallel in ((16384, True), (64, True), (64, False)):
+            index = ExactIndex(self.index.path, block_size=block_size, parallel=parallel)
+            ids, distances = index.search(self.queries, k=10)
+            self.assertEqual(ids, [[self.ids[row] for row in rows] for rows in self.expected], block_size)
+            expected = squared_l2(self.queries[:1], self.vectors[self.expected[0]])[0]
+            np.testing.assert_allclose(distances[0], expected, rtol=1e-4, atol=1e-3)
+        self.assertIsInstance(self.index.vectors, np.memmap)
+        self.assertEqual(self.index.model_name, "m")
+
+    def test_float16_matrix(self):
+        """Test that the half-size matrix finds nearly the same neighbours"""
+        self.assertEqual(self.half.vectors.dtype, np.float16)
+        self.assertEqual(self.half.vectors.nbytes * 2, self.index.vectors.nbytes)
+        ids, _ = self.half.search(self.queries, k=10)
+        recall = np.mean([len(set(found) & {self.ids[row] for row in rows}) / 10 for found, rows in zip(ids, self.expected)])
+        self.assertGreater(recall, 0.95)
+
+    def test_restricted_rows(self):
+        """Test searching only a subset of rows, as filtered queries do"""
+        rows = self.index.rows(["doc_5", "doc_400", "doc_17", "missing"])
+        self.assertEqual(rows.tolist(), [5, 400, 17, -1])
+        ids, distances = self.index.search(self.vectors[400], k=2, rows=rows[rows >= 0])
+        self.assertEqual(ids[0][0], "doc_400")
+        self.assertEqual(len(ids[0]), 2)
+        self.assertEqual(self.index.search(self.vectors[0], k=3, rows=np.array([], dtype=np.int64)), ([[]], [[]]))
+
+    def test_top_k(self):
+        columns, values = top_k(np.array([[3.0, 1.0, 2.0, 0.5]]), 2)
+        self.assertEqual(columns.tolist(), [[3, 1]])
+        self.assertEqual(values.tolist(), [[0.5, 1.0]])
+        self.assertEqual(top_k(np.array([[2.0, 1.0]]), 5)[0].tolist(), [[1, 0]])
+
+
+class TestExactSearchPath(unittest.TestCase):
+    def setUp(self):
+        self.embedding_dir = tempfile.mkdtemp()
+        self.data_embedder = DataEmbedding(backend="hash", embedding_dir=self.embedding_dir)
+        words = ["kings", "queens", "castles", "rivers", "ships", "storms", "forests", "bridges", "lanterns", "harbours"]
+        self.records = [(f"{first} and {second}", {"row": i}) for i, (first, second) in enumerate(zip(words * 2, words[3:] + words[:3] + words[7:] + words[:7]))]
+
+    def tearDown(self):
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def test_small_collections_are_searched_exactly(self):
+        """Test that ingestion writes the matrix and the retriever serves it below EXACT_SEARCH_MAX"""
+        self.data_embedder.ingest_records("lines", "line", self.records)
+        path = exact_index_path(self.embedding_dir, "lines")
+        self.assertEqual(len(ExactIndex(path)), 20)
+
+        exact = Retriever(self.embedding_dir, "lines", embedder=self.data_embedder.embedding_function, cache_results=False)
+        hnsw = Retriever(
+            self.embedding_dir, "lines", embedder=self.data_embedder.embedding_function, cache_results=False, exact_search_max=0
+        )
+        try:
+            with mock.patch.object(exact.collection, "query", side_effect=AssertionError("HNSW was queried")):
+                found = exact.search([self.records[7][0]], k=3)[0]
+            self.assertEqual(found[0]["document"], self.records[7][0])
+            expected = hnsw.search([self.records[7][0]], k=3)[0]
+            np.testing.assert_allclose([hit["distance"] for hit in found], [hit["distance"] for hit in expected], atol=1e-5)
+            self.assertEqual(found[0]["metadata"]["row"], 7)
+        finally:
+            exact.close()
+            hnsw.close()
+
+    def test_large_or_disabled_collections_drop_the_matrix(self):
+        self.data_embedder.ingest_records("lines", "line", self.records)
+        self.data_embedder.exact_search_max = 10
+        self.data_embedder.ingest_records("lines", "line", self.records[:15])
+        self.assertFalse(os.path.exists(exact_index_path(self.embedding_dir, "lines")))
+        with self.assertRaises(ValueError):
+            DataEmbedding(backend="hash", embedding_dir=self.embedding_dir, exact_index="int4")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from embedding.filter_index import FilterIndex, FilterIndexBuilder
+from embedding.lexical_index import LexicalIndex, LexicalIndexBuilder
+from retrieval.filters import chroma_where, parse_filters
+
+CHUNKS = [
+    ("a", "The Normans conquered England", {"title": "Normans", "chunk": 0, "score": 0.5, "mixed": 1}),
+    ("b", "Norman knights and castles", {"title": "Normans", "chunk": 1, "score": 1.5, "mixed": "one"}),
+    ("c", "Notre Dame in Paris", {"title": "Notre_Dame", "chunk": 0, "score": 2.5}),
+    ("d", "The Normans spoke French", {"title": "France", "chunk": 0}),
+    ("e", "Castles of France", {"title": "France", "chunk": 1, "score": 0.5}),
+]
+
+
+class TestFilterIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "filters")
+        builder = FilterIndexBuilder()
+        for doc_id, _, metadata in CHUNKS:
+            builder.add(doc_id, metadata)
+        builder.write(self.path)
+        self.index = FilterIndex(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def select(self, filters):
+        positions = self.index.select(parse_filters(filters))
+        return None if positions is None else self.index.ids_at(positions)
+
+    def test_equality_and_sets(self):
+        """Test equality, $in, $ne and $nin on string and numeric fields"""
+        self.assertEqual(len(self.index), 5)
+        self.assertEqual(self.select({"title": "Normans"}), ["a", "b"])
+        self.assertEqual(self.select({"title": {"$in": ["France", "Notre_Dame", "Paris"]}}), ["c", "d", "e"])
+        self.assertEqual(self.select({"title": {"$ne": "France"}}), ["a", "b", "c"])
+        self.assertEqual(self.select({"chunk": {"$nin": [0]}}), ["b", "e"])
+        self.assertEqual(self.select({"title": "Rome"}), [])
+        # A value of another type than the field's never matches
+        self.assertEqual(self.select({"chunk": "0"}), [])
+
+    def test_ranges_and_conjunctions(self):
+        """Test range operators, chunks missing a field, and AND across fields"""
+        self.assertEqual(self.select({"score": {"$gt": 0.5}}), ["b", "c"])
+        self.assertEqual(self.select({"score": {"$gte": 0.5, "$lt": 2.5}}), ["a", "b", "e"])
+        self.assertEqual(self.select({"score": {"$lte": 10}}), ["a", "b", "c", "e"])
+        self.assertEqual(self.select({"title": {"$gt": 1}}), [])
+        self.assertEqual(self.select({"title": "France", "chunk": 1}), ["e"])
+        self.assertEqual(self.select({"missing_field": 1}), [])
+
+    def test_mixed_field_is_not_indexed(self):
+        """Test that a field holding both strings and numbers is left to Chroma"""
+        self.assertIsNone(self.select({"mixed": 1}))
+        self.assertIsNone(self.select({"title": "Normans", "mixed": 1}))
+
+    def test_mask_filters_bm25(self):
+        """Test that a filter bitmap restricts lexical search when both indexes share numbering"""
+        builder = LexicalIndexBuilder()
+        for doc_id, text, _ in CHUNKS:
+            builder.add(doc_id, text)
+        builder.write(os.path.join(self.temp_dir, "lexical"))
+        lexical = LexicalIndex(os.path.join(self.temp_dir, "lexical"))
+
+        positions = self.index.select(parse_filters({"title": "France"}))
+        mask = self.index.mask(positions)
+        self.assertEqual(mask.tolist(), [False, False, False, True, True])
+        self.assertEqual(sorted(doc_id for doc_id, _ in lexical.search("normans castles", mask=mask)), ["d", "e"])
+        self.assertEqual(len(lexical.search("normans castles")), 4)
+
+    def test_files_are_memory_mapped(self):
+        self.index.select(parse_filters({"title": "Normans"}))
+        keys, positions, _ = self.index._column("title")
+        self.assertIsInstance(positions, np.memmap)
+        self.assertIsInstance(self.index.ids, np.memmap)
+
+
+class TestParseFilters(unittest.TestCase):
+    def test_conditions(self):
+        conditions = parse_filters({"title": "Normans", "row": {"$gte": 1, "$lt": 5}})
+        self.assertEqual(conditions, [("title", "$eq", "Normans"), ("row", "$gte", 1), ("row", "$lt", 5)])
+        self.assertEqual(chroma_where(conditions[:1]), {"title": {"$eq": "Normans"}})
+        self.assertEqual(chroma_where(conditions)["$and"][2], {"row": {"$lt": 5}})
+
+    def test_invalid_filters(self):
+        for filters in (
+            {"title": {"$regex": "Nor"}},
+            {"$or": [{"title": "Normans"}]},
+            {"row": {"$gt": "5"}},
+            {"title": {"$in": []}},
+            {"title": {}},
+            {"title": ["Normans"]},
+        ):
+            with self.assertRaises(ValueError, msg=filters):
+                parse_filters(filters)
+
+
+if __name__ == '__main__':
+    unittest.main()
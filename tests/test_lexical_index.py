@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from embedding.lexical_index import LexicalIndex, LexicalIndexBuilder, decode_varints, encode_varints
+from retrieval.hybrid import reciprocal_rank_fusion
+
+DOCUMENTS = {
+    "romeo": "O Romeo, Romeo! wherefore art thou Romeo?",
+    "window": "But, soft! what light through yonder window breaks?",
+    "kings": "Let us sit upon the ground and tell sad stories of the death of kings.",
+    "speak": "Speak, speak.",
+}
+
+
+class TestLexicalIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, "index")
+        builder = LexicalIndexBuilder()
+        for doc_id, text in DOCUMENTS.items():
+            builder.add(doc_id, text)
+        builder.write(self.path)
+        self.index = LexicalIndex(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_varint_round_trip(self):
+        values = np.array([0, 1, 127, 128, 300, 16384, 2**32 - 1, 2**40], dtype=np.uint64)
+        encoded = encode_varints(values)
+        self.assertEqual(len(encode_varints(np.array([127]))), 1)
+        self.assertEqual(len(encode_varints(np.array([128]))), 2)
+        np.testing.assert_array_equal(decode_varints(np.frombuffer(encoded, dtype=np.uint8)), values)
+
+    def test_search_ranks_by_bm25(self):
+        """Test that rare terms and repeated terms rank their document first"""
+        self.assertEqual(len(self.index), 4)
+        self.assertEqual(self.index.search("romeo")[0][0], "romeo")
+        self.assertEqual(self.index.search("Yonder WINDOW")[0][0], "window")
+        hits = self.index.search("the death of kings speak", k=2)
+        self.assertEqual([doc_id for doc_id, _ in hits], ["kings", "speak"])
+        self.assertGreater(hits[0][1], hits[1][1])
+        self.assertEqual(self.index.search("juliet"), [])
+
+    def test_files_are_memory_mapped(self):
+        self.assertIsInstance(self.index.postings, np.memmap)
+        self.assertIsInstance(self.index.term_hashes, np.memmap)
+
+    def test_rewrite_replaces_index(self):
+        builder = LexicalIndexBuilder()
+        builder.add("juliet", "Juliet on the balcony")
+        builder.write(self.path)
+        index = LexicalIndex(self.path)
+        self.assertEqual(len(index), 1)
+        self.assertEqual([doc_id for doc_id, _ in index.search("juliet")], ["juliet"])
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+
+class TestReciprocalRankFusion(unittest.TestCase):
+    def test_fusion(self):
+        fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]])
+        self.assertEqual([doc_id for doc_id, _ in fused], ["b", "a", "c"])
+
+    def test_weights(self):
+        """Test that weights decide between lists and a zero weight ignores a list"""
+        fused = reciprocal_rank_fusion([["a", "b"], ["b", "a"]], weights=[2.0, 1.0])
+        self.assertEqual(fused[0][0], "a")
+        fused = reciprocal_rank_fusion([["a"], ["b"]], weights=[0.0, 1.0])
+        self.assertEqual(fused, [("b", 1.0 / 61)])
+        with self.assertRaises(ValueError):
+            reciprocal_rank_fusion([["a"]], weights=[1.0, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,416 @@
+import os
+import sys
+import asyncio
+import json
+import time
+import shutil
+import logging
+import tempfile
+import threading
+import unittest
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from datasets import Dataset
+from fastapi.testclient import TestClient
+
+from embedding.data_embedding import DataEmbedding
+from retrieval.retriever import Retriever
+import main
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+def wait_until_ready(client, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = client.get("/ready")
+        if response.status_code == 200 or "error" in response.json():
+            return response
+        time.sleep(0.01)
+    raise TimeoutError("App did not become ready")
+
+
+TURNS = [
+    "First Citizen:\nBefore we proceed any further, hear me speak.",
+    "All:\nSpeak, speak.",
+    "MENENIUS:\nWhat work's, my countrymen, in hand? where go you with bats and clubs?",
+    "ROMEO:\nBut, soft! what light through yonder window breaks?",
+    "JULIET:\nO Romeo, Romeo! wherefore art thou Romeo?",
+    "KING RICHARD II:\nFor God's sake, let us sit upon the ground and tell sad stories of the death of kings.",
+]
+
+CONTEXTS = [
+    ("Normans", "The Normans were the people who gave their name to Normandy, a region in France."),
+    ("Romeo_and_Juliet", "Romeo and Juliet is a tragedy written by William Shakespeare about two young lovers."),
+]
+
+
+class TestQueryEndpoint(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Ingest a small corpus and start the app against it"""
+        cls.data_dir = tempfile.mkdtemp()
+        cls.embedding_dir = tempfile.mkdtemp()
+        Dataset.from_dict({"text": ["\n\n".join(TURNS)]}).save_to_disk(os.path.join(cls.data_dir, 'text_corpus'))
+        Dataset.from_dict({"title": [title for title, _ in CONTEXTS], "context": [context for _, context in CONTEXTS]}).save_to_disk(
+            os.path.join(cls.data_dir, 'question_answer')
+        )
+        data_embedder = DataEmbedding(backend="hash", data_dir=cls.data_dir, embedding_dir=cls.embedding_dir)
+        data_embedder.embed_text_corpus(max_tokens=12, overlap=0)
+        data_embedder.embed_qa_contexts()
+
+        cls.env = mock.patch.dict(os.environ, {
+            "EMBEDDING_DIR": cls.embedding_dir,
+            "EMBEDDING_BACKEND": "hash",
+            "RERANK_BACKEND": "overlap",
+            "TENANTS": json.dumps({"theatre": ["text_embeddings"], "library": ["text_embeddings", "squad_contexts"]}),
+        })
+        cls.env.start()
+        cls.client = TestClient(main.app)
+        cls.client.__enter__()
+        wait_until_ready(cls.client)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+        cls.env.stop()
+        shutil.rmtree(cls.data_dir, ignore_errors=True)
+        shutil.rmtree(cls.embedding_dir, ignore_errors=True)
+
+    def test_query_returns_hits(self):
+        """Test that /query searches the collection and returns full hits"""
+        response = self.client.post("/query", json={"text": "Romeo Romeo", "k": 3})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["preprocessed_query"], "romeo romeo")
+        self.assertEqual(len(body["results"]), 3)
+        top = body["results"][0]
+        self.assertIn("Romeo", top["document"])
+        self.assertEqual(set(top), {"id", "document", "distance", "metadata"})
+        self.assertEqual(top["metadata"]["source"], "shakespeare")
+        distances = [hit["distance"] for hit in body["results"]]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_default_k(self):
+        """Test that k defaults to 5"""
+        response = self.client.post("/query", json={"text": "speak"})
+        self.assertEqual(len(response.json()["results"]), 5)
+
+    def test_invalid_requests(self):
+        """Test validation of empty text and out-of-range k"""
+        self.assertEqual(self.client.post("/query", json={"text": ""}).status_code, 422)
+        self.assertEqual(self.client.post("/query", json={"text": "x", "k": 0}).status_code, 422)
+
+    def test_hybrid_query(self):
+        """Test that a lexical weight fuses BM25 and vector hits"""
+        response = self.client.post("/query", json={"text": "Menenius", "k": 3, "lexical_weight": 1.0})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3)
+        self.assertIn("MENENIUS", results[0]["document"])
+        self.assertGreater(results[0]["bm25"], 0)
+        scores = [hit["score"] for hit in results]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_lexical_only_query(self):
+        """Test pure BM25 ranking with a zero vector weight"""
+        response = self.client.post("/query", json={"text": "yonder window", "vector_weight": 0, "lexical_weight": 1})
+        results = response.json()["results"]
+        self.assertIn("yonder window", results[0]["document"])
+        self.assertTrue(all(hit["bm25"] for hit in results))
+        self.assertEqual(self.client.post("/query", json={"text": "x", "vector_weight": 0}).status_code, 422)
+
+    def test_ids_only(self):
+        """Test ids-and-scores results and fetching their documents afterwards"""
+        results = self.client.post("/query", json={"text": "Romeo", "k": 2, "include_documents": False}).json()["results"]
+        self.assertEqual(set(results[0]), {"id", "distance"})
+        full = self.client.post("/query", json={"text": "Romeo", "k": 2}).json()["results"]
+        self.assertEqual([hit["id"] for hit in results], [hit["id"] for hit in full])
+
+        ids = [hit["id"] for hit in results] + ["text_missing"]
+        documents = self.client.post("/documents", json={"ids": ids}).json()["documents"]
+        self.assertEqual([doc["id"] for doc in documents], ids[:2])
+        self.assertEqual(documents[0]["document"], full[0]["document"])
+
+    def test_ndjson_stream(self):
+        """Test that a stream sends the query, every hit, then their documents and an end marker"""
+        with mock.patch.dict(os.environ, {"STREAM_PAGE_SIZE": "2"}):
+            response = self.client.post("/query", json={"text": "speak", "k": 5, "stream": "ndjson"})
+        self.assertEqual(response.headers["content-type"], "application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual(lines[0], {"preprocessed_query": "speak"})
+        self.assertEqual(lines[-1], {"count": 5})
+        hits, documents = lines[1:6], lines[6:-1]
+        self.assertEqual([hit["rank"] for hit in hits], [1, 2, 3, 4, 5])
+        self.assertEqual(set(hits[0]), {"rank", "id", "distance"})
+        self.assertEqual([document["rank"] for document in documents], [1, 2, 3, 4, 5])
+        full = self.client.post("/query", json={"text": "speak", "k": 5}).json()["results"]
+        merged = [{**hit, **document} for hit, document in zip(hits, documents)]
+        self.assertEqual([{key: hit[key] for key in full[0]} for hit in merged], full)
+
+    def test_sse_stream(self):
+        response = self.client.post(
+            "/query", json={"text": "Menenius", "k": 2, "stream": "sse", "lexical_weight": 1, "include_documents": False}
+        )
+        self.assertTrue(response.headers["content-type"].startswith("text/event-stream"))
+        events = [block.split("\n") for block in response.text.strip().split("\n\n")]
+        self.assertEqual([lines[0] for lines in events], ["event: query", "event: hit", "event: hit", "event: end"])
+        hit = json.loads(events[1][1][len("data: "):])
+        self.assertNotIn("document", hit)
+        self.assertGreater(hit["bm25"], 0)
+
+    def test_rerank(self):
+        """Test that reranking reorders a deeper candidate list and trims it to k"""
+        body = self.client.post("/query", json={"text": "hear me speak", "k": 2, "rerank": True}).json()
+        self.assertTrue(body["reranked"])
+        self.assertEqual(len(body["results"]), 2)
+        self.assertIn("hear me speak", body["results"][0]["document"])
+        self.assertEqual(body["results"][0]["rerank_score"], 1.0)
+        self.assertGreater(self.client.get("/stats").json()["rerank"]["reranked"], 0)
+
+        body = self.client.post(
+            "/query", json={"text": "hear me speak", "k": 2, "rerank": True, "include_documents": False}
+        ).json()
+        self.assertEqual(set(body["results"][0]), {"id", "distance", "rerank_score"})
+        self.assertEqual(self.client.post("/query", json={"text": "x", "rerank_budget_ms": 0}).status_code, 422)
+
+    def test_diversify(self):
+        """Test that diversification picks k hits from a deeper candidate list and reports it"""
+        body = self.client.post("/query", json={"text": "hear me speak", "k": 3, "diversify": True}).json()
+        self.assertEqual(len(body["results"]), 3)
+        self.assertGreater(body["diversified"]["candidates"], 3)
+        self.assertIn("duplicates_removed", body["diversified"])
+        relevant = self.client.post("/query", json={"text": "hear me speak", "k": 1}).json()["results"]
+        self.assertEqual(body["results"][0]["id"], relevant[0]["id"])
+
+        both = self.client.post("/query", json={"text": "hear me speak", "k": 2, "diversify": True, "rerank": True}).json()
+        self.assertEqual(len(both["results"]), 2)
+        self.assertTrue(both["reranked"])
+        self.assertEqual(self.client.post("/query", json={"text": "x", "mmr_lambda": 1.5}).status_code, 422)
+
+    def test_filtered_query(self):
+        """Test that filters scope vector and hybrid search to matching chunks"""
+        response = self.client.post("/query", json={"text": "Romeo", "k": 3, "filters": {"chunk": {"$gte": 4}}})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 3)
+        self.assertTrue(all(hit["metadata"]["chunk"] >= 4 for hit in results))
+        self.assertIn("Romeo", results[0]["document"])
+        self.assertEqual(results[0]["metadata"]["dataset"], "tiny_shakespeare")
+
+        response = self.client.post("/query", json={
+            "text": "speak", "k": 5, "lexical_weight": 1.0, "filters": {"chunk": {"$in": [0, 1]}, "source": "shakespeare"},
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(hit["metadata"]["chunk"] for hit in response.json()["results"]), [0, 1])
+        self.assertIsNotNone(response.json()["results"][0]["bm25"])
+
+        response = self.client.post("/query", json={"text": "Romeo", "filters": {"chunk": {"$regex": "1"}}})
+        self.assertEqual(response.status_code, 422)
+
+    def test_filter_index_matches_chroma_filtering(self):
+        """Test that exact search over the filter index's id-set agrees with Chroma's where clause"""
+        retriever = main.app.state.retriever
+        filters = {"chunk": {"$lt": 3}}
+        exact = retriever.search(["what light breaks"], k=2, filters=filters)[0]
+        with mock.patch.object(retriever, "filter_exact_max", 0):
+            chroma = retriever.search(["what light breaks"], k=2, filters=filters)[0]
+        self.assertEqual([hit["id"] for hit in exact], [hit["id"] for hit in chroma])
+        for exact_hit, chroma_hit in zip(exact, chroma):
+            self.assertAlmostEqual(exact_hit["distance"], chroma_hit["distance"], places=4)
+        self.assertEqual(retriever.search(["romeo"], k=2, filters={"chunk": 99}), [[]])
+
+    def test_query_routes_by_collection_and_tenant(self):
+        """Test routing to one collection, fanning out over several, and tenant scoping"""
+        results = self.client.post("/query", json={"text": "Normans Normandy", "k": 1, "collection": "squad_contexts"}).json()["results"]
+        self.assertEqual(results[0]["metadata"]["title"], "Normans")
+        self.assertNotIn("collection", results[0])
+
+        body = {"text": "Romeo and Juliet", "k": 4, "collections": ["text_embeddings", "squad_contexts"]}
+        results = self.client.post("/query", json=body).json()["results"]
+        self.assertEqual(len(results), 4)
+        self.assertEqual({hit["collection"] for hit in results}, {"text_embeddings", "squad_contexts"})
+        distances = [hit["distance"] for hit in results]
+        self.assertEqual(distances, sorted(distances))
+        hybrid = self.client.post("/query", json={**body, "lexical_weight": 1.0}).json()["results"]
+        scores = [hit["score"] for hit in hybrid]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        # A tenant searches all of its collections unless told otherwise
+        library = self.client.post("/query", json={"text": "Romeo and Juliet", "k": 4, "tenant": "library"}).json()["results"]
+        self.assertEqual([hit["id"] for hit in library], [hit["id"] for hit in results])
+        theatre = self.client.post("/query", json={"text": "Normans", "k": 3, "tenant": "theatre"}).json()["results"]
+        self.assertTrue(all(hit["metadata"]["source"] == "shakespeare" for hit in theatre))
+
+        self.assertEqual(self.client.post("/query", json={"text": "x", "collection": "missing"}).status_code, 404)
+        self.assertEqual(self.client.post("/query", json={"text": "x", "tenant": "nobody"}).status_code, 404)
+        response = self.client.post("/query", json={"text": "x", "tenant": "theatre", "collection": "squad_contexts"})
+        self.assertEqual(response.status_code, 403)
+
+    def test_collections_open_off_the_event_loop(self):
+        """Test that routing to a cold collection opens it without blocking the event loop"""
+        router = main.app.state.router
+        router.get("squad_contexts")
+        with router._lock:
+            cold = router._retrievers.pop("squad_contexts")
+        on_loop = []
+
+        def open_retriever(*args, **kwargs):
+            try:
+                asyncio.get_running_loop()
+                on_loop.append(True)
+            except RuntimeError:
+                on_loop.append(False)
+            return Retriever(*args, **kwargs)
+
+        try:
+            with mock.patch("retrieval.router.Retriever", open_retriever):
+                response = self.client.post("/query", json={"text": "Normans", "k": 1, "collection": "squad_contexts"})
+            self.assertEqual(response.json()["results"][0]["metadata"]["title"], "Normans")
+            self.assertEqual(on_loop, [False])
+        finally:
+            cold.close()
+        response = self.client.post("/query", json={"text": "x", "collection": "squad_contexts", "collections": ["text_embeddings"]})
+        self.assertEqual(response.status_code, 422)
+
+    def test_fan_out_stream_and_documents(self):
+        """Test that streamed fan-out hits load documents from their own collections"""
+        body = {"text": "Romeo", "k": 4, "collections": ["text_embeddings", "squad_contexts"], "stream": "ndjson"}
+        lines = [json.loads(line) for line in self.client.post("/query", json=body).text.splitlines()[1:-1]]
+        hits, documents = lines[:4], lines[4:]
+        self.assertEqual([document["id"] for document in documents], [hit["id"] for hit in hits])
+        self.assertTrue(all(document["document"] for document in documents))
+        self.assertIn("squad_contexts", {hit["collection"] for hit in hits})
+
+        squad_ids = [hit["id"] for hit in hits if hit["collection"] == "squad_contexts"]
+        documents = self.client.post("/documents", json={"ids": squad_ids, "collection": "squad_contexts"}).json()["documents"]
+        self.assertEqual([doc["id"] for doc in documents], squad_ids)
+        self.assertEqual(self.client.post("/documents", json={"ids": squad_ids}).json()["documents"], [])
+
+        stats = self.client.get("/stats").json()["collections"]
+        self.assertEqual(stats["squad_contexts"]["chunks"], 2)
+        self.assertIs(main.app.state.router.get("text_embeddings"), main.app.state.retriever)
+        self.assertIs(main.app.state.router.get("squad_contexts").embedder, main.app.state.retriever.embedder)
+
+    def test_concurrent_requests_share_retriever(self):
+        """Test concurrent queries against the single startup retriever"""
+        retriever = main.app.state.retriever
+        queries = ["kings", "window", "citizens", "clubs"] * 5
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            responses = list(pool.map(lambda text: self.client.post("/query", json={"text": text, "k": 1}), queries))
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertIs(main.app.state.retriever, retriever)
+        self.assertIn("kings", responses[0].json()["results"][0]["document"])
+
+    def test_stats_expose_batching_histograms(self):
+        """Test that /stats reports query batch size and latency histograms"""
+        self.client.post("/query", json={"text": "speak", "k": 1})
+        stats = self.client.get("/stats").json()["query_batching"]
+        self.assertGreater(stats["batch_size"]["count"], 0)
+        self.assertIn("+Inf", stats["batch_latency_seconds"]["buckets"])
+
+    def test_repeated_query_served_from_cache(self):
+        """Test that a repeated query is answered by the result cache"""
+        cache = main.app.state.retriever.result_cache
+        first = self.client.post("/query", json={"text": "Sad stories of kings", "k": 2}).json()
+        hits = cache.stats["exact_hits"]
+        second = self.client.post("/query", json={"text": "sad  stories of KINGS", "k": 2}).json()
+        self.assertEqual(first["results"], second["results"])
+        self.assertEqual(cache.stats["exact_hits"], hits + 1)
+
+    def test_cached_results_are_copies(self):
+        """Test that changing returned hits, as rerank and diversify do, leaves the cached response intact"""
+        retriever = main.app.state.retriever
+        expected = self.client.post("/query", json={"text": "my kingdom for a horse", "k": 3}).json()["results"]
+        for _ in range(2):
+            hits = asyncio.run(retriever.asearch("my kingdom for a horse", k=3))
+            self.assertEqual([hit["id"] for hit in hits], [hit["id"] for hit in expected])
+            hits[0].pop("document")
+            hits[0]["distance"] = -1.0
+            hits.reverse()
+        self.assertEqual(self.client.post("/query", json={"text": "my kingdom for a horse", "k": 3}).json()["results"], expected)
+
+    def test_reingestion_invalidates_cache(self):
+        """Test that re-ingesting the collection drops cached results"""
+        retriever = main.app.state.retriever
+        self.client.post("/query", json={"text": "window breaks", "k": 1})
+        self.assertIsNotNone(retriever.result_cache.get_exact("window breaks", 1))
+        with open(os.path.join(self.embedding_dir, 'manifests', 'text_embeddings.json'), 'a') as f:
+            f.write(" ")
+        retriever.result_cache._next_check = 0
+        self.assertIsNone(retriever.result_cache.get_exact("window breaks", 1))
+
+    def test_metrics_endpoint(self):
+        """Test that /metrics exposes per-stage query timings, cache counters and queue depth"""
+        self.client.post("/query", json={"text": "hear me speak", "k": 2, "rerank": True})
+        response = self.client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        text = response.text
+        for stage in ("preprocess", "embed", "vector_search", "rerank", "serialize"):
+            self.assertIn(f'rag_query_stage_seconds_count{{stage="{stage}"}}', text)
+        self.assertIn('rag_query_requests_total{mode="vector"}', text)
+        self.assertIn('rag_result_cache_events_total{collection="text_embeddings",event="misses"}', text)
+        self.assertIn('rag_query_batch_queue_depth{collection="text_embeddings"} 0', text)
+        self.assertIn("rag_ready 1", text)
+
+    def test_readiness_reports_startup_breakdown(self):
+        """Test that /ready lists the timed warmup stages once the app is warm"""
+        response = self.client.get("/ready")
+        self.assertEqual(response.status_code, 200)
+        startup = response.json()
+        self.assertTrue(startup["ready"])
+        for stage in ("imports", "open_store", "load_model", "first_query", "warm_query"):
+            self.assertIn(stage, startup["stages"])
+        self.assertGreaterEqual(startup["total_seconds"], sum(startup["stages"].values()) - startup["stages"]["imports"])
+        self.assertEqual(self.client.get("/health").json(), {"status": "ok"})
+
+
+class TestColdStart(unittest.TestCase):
+    def test_not_ready_while_warming_up(self):
+        """Test that /ready and /query return 503 until warmup finishes, while /health answers"""
+        embedding_dir = tempfile.mkdtemp()
+        DataEmbedding(backend="hash", embedding_dir=embedding_dir).ingest_records("text_embeddings", "text", [("hello", {"source": "test"})])
+        release = threading.Event()
+        original = Retriever.warmup
+
+        def slow_warmup(retriever, profile=None):
+            release.wait(10)
+            return original(retriever, profile)
+
+        env = {"EMBEDDING_DIR": embedding_dir, "EMBEDDING_BACKEND": "hash"}
+        try:
+            with mock.patch.dict(os.environ, env), mock.patch.object(Retriever, "warmup", slow_warmup):
+                with TestClient(main.app) as client:
+                    self.assertEqual(client.get("/health").status_code, 200)
+                    self.assertEqual(client.get("/ready").status_code, 503)
+                    self.assertEqual(client.post("/query", json={"text": "hello"}).status_code, 503)
+                    release.set()
+                    self.assertEqual(wait_until_ready(client).status_code, 200)
+                    self.assertEqual(client.post("/query", json={"text": "hello"}).status_code, 200)
+        finally:
+            release.set()
+            shutil.rmtree(embedding_dir, ignore_errors=True)
+
+    def test_failed_warmup_is_reported(self):
+        with mock.patch.dict(os.environ, {"EMBEDDING_DIR": tempfile.mkdtemp(), "EMBEDDING_BACKEND": "hash"}):
+            with TestClient(main.app) as client:
+                response = wait_until_ready(client)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn("text_embeddings", response.json()["error"])
+
+    def test_imports_have_no_ingestion_dependencies_or_side_effects(self):
+        """Test that the serving path imports no ingestion-only packages and configures nothing"""
+        code = (
+            "import sys, logging, main, embedding.data_embedding; "
+            "print(sorted(m for m in ('datasets', 'transformers', 'torch', 'sentence_transformers', 'dotenv') "
+            "if m in sys.modules), len(logging.getLogger().handlers))"
+        )
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        result = subprocess.run([sys.executable, "-c", code], cwd=root, capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[] 0")
+
+
+if __name__ == '__main__':
+    unittest.main()
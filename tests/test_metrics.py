@@ -0,0 +1,156 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from collections import Counter as Samples
+
+from observability.metrics import REGISTRY, Counter, Gauge, Histogram, MetricsRegistry
+from observability.profiler import SamplingProfiler
+from observability.tracing import INGEST_ITEMS, INGEST_STAGES, StageClock, stage_histogram
+from embedding.data_embedding import DataEmbedding
+from retrieval.rerank import OverlapScorer, Reranker
+from retrieval.retriever import Retriever
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_render_prometheus_text(self):
+        """Test the exposition format of counters, gauges and histograms"""
+        registry = MetricsRegistry()
+        registry.counter("requests_total", "Requests", {"mode": "vector"}).inc()
+        registry.counter("requests_total", "Requests", {"mode": "vector"}).inc(2)
+        registry.counter("requests_total", "Requests", {"mode": "hybrid"}).inc()
+        registry.register(Gauge("queue_depth", "Waiting items", fn=lambda: 7))
+        histogram = registry.register(Histogram("latency_seconds", [0.1, 1], "Latency", {"stage": 'say "hi"'}))
+        histogram.observe(0.05)
+        histogram.observe(2.0)
+
+        lines = registry.render().splitlines()
+        self.assertEqual(lines.count("# TYPE requests_total counter"), 1)
+        self.assertIn('requests_total{mode="vector"} 3', lines)
+        self.assertIn('requests_total{mode="hybrid"} 1', lines)
+        self.assertIn("queue_depth 7", lines)
+        self.assertIn('latency_seconds_bucket{stage="say \\"hi\\"",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{stage="say \\"hi\\"",le="+Inf"} 2', lines)
+        self.assertIn('latency_seconds_count{stage="say \\"hi\\""} 2', lines)
+        self.assertIn('latency_seconds_sum{stage="say \\"hi\\""} 2.05', lines)
+
+    def test_register_replaces_and_getters_reuse(self):
+        """Test that getters return the existing metric and register swaps in a new one"""
+        registry = MetricsRegistry()
+        first = registry.counter("events_total")
+        self.assertIs(registry.counter("events_total"), first)
+        stats = {"hits": 4}
+        registry.register(Counter("events_total", fn=lambda: stats["hits"]))
+        self.assertIn("events_total 4", registry.render().splitlines())
+
+    def test_closed_components_are_unregistered(self):
+        """Test that unregister keeps a newer metric and that a closed reranker leaves no counters behind"""
+        registry = MetricsRegistry()
+        old, new = Gauge("depth", fn=lambda: 1), Gauge("depth", fn=lambda: 2)
+        registry.register(old)
+        registry.register(new)
+        registry.unregister(old)
+        self.assertIn("depth 2", registry.render().splitlines())
+        registry.unregister(new)
+        self.assertEqual(registry.render(), "\n")
+
+        first, second = Reranker(OverlapScorer()), Reranker(OverlapScorer())
+        second.close()
+        first.close()
+        registered = list(REGISTRY._metrics.values())
+        self.assertFalse(any(metric in registered for metric in first._metrics + second._metrics))
+
+    def test_closed_retriever_series_disappear(self):
+        """Test that closing a retriever removes its batcher and result cache series"""
+        embedding_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, embedding_dir, ignore_errors=True)
+        data_embedder = DataEmbedding(backend="hash", embedding_dir=embedding_dir)
+        data_embedder.ingest_records("metrics_probe", "probe", [("To be, or not to be", {})])
+        reranker = Reranker(OverlapScorer())
+        self.addCleanup(reranker.close)
+        retriever = Retriever(
+            embedding_dir, "metrics_probe", embedder=data_embedder.embedding_function, cache_results=True, reranker=reranker,
+        )
+        retriever.search(["to be"], k=1)
+        self.assertIn('rag_query_batch_queue_depth{collection="metrics_probe"}', REGISTRY.render())
+        self.assertIn('rag_result_cache_entries{collection="metrics_probe"}', REGISTRY.render())
+        retriever.close()
+        self.assertNotIn('collection="metrics_probe"', REGISTRY.render())
+
+    def test_gauge_moves_both_ways(self):
+        """Test that gauges can be set, raised and lowered"""
+        gauge = Gauge("depth")
+        gauge.set(5)
+        gauge.inc()
+        gauge.dec(3)
+        self.assertEqual(gauge.value, 3)
+
+
+class TestStageClock(unittest.TestCase):
+    def test_nested_stages_report_exclusive_time(self):
+        """Test that an outer stage does not count the time of the stages it pulled from"""
+        def rows():
+            for row in range(3):
+                time.sleep(0.02)
+                yield row
+
+        def chunks(rows):
+            for row in rows:
+                yield from (row, row)
+
+        clock = StageClock()
+        items = list(clock.iterate(chunks(clock.iterate(rows(), "clock_read")), "clock_chunk"))
+
+        self.assertEqual(len(items), 6)
+        read = stage_histogram(INGEST_STAGES, "clock_read")
+        chunk = stage_histogram(INGEST_STAGES, "clock_chunk")
+        self.assertEqual((read.count, chunk.count), (3, 6))
+        self.assertGreaterEqual(read.sum, 0.06)
+        self.assertLess(chunk.sum, 0.02)
+        self.assertEqual(REGISTRY.counter(INGEST_ITEMS, labels={"stage": "clock_chunk"}).value, 6)
+
+
+class TestSamplingProfiler(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir, ignore_errors=True)
+
+    def test_slow_block_dumps_folded_stacks(self):
+        """Test that a block over the threshold writes stacks that include the slow function"""
+        def slow_function():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                pass
+
+        profiler = SamplingProfiler(self.output_dir, threshold_ms=50, interval_ms=1)
+        with profiler.profile("POST /query"):
+            slow_function()
+
+        dumps = os.listdir(self.output_dir)
+        self.assertEqual(len(dumps), 1)
+        self.assertTrue(dumps[0].endswith("-POST__query.folded"))
+        with open(os.path.join(self.output_dir, dumps[0])) as f:
+            lines = f.read().splitlines()
+        self.assertTrue(any("slow_function (test_metrics.py:" in line for line in lines))
+        stack, count = lines[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertNotIn("sampling-profiler", stack)
+
+    def test_fast_block_is_not_dumped(self):
+        """Test that blocks under the threshold leave no files and old dumps are pruned"""
+        profiler = SamplingProfiler(self.output_dir, threshold_ms=10000, interval_ms=1, max_files=2)
+        with profiler.profile("GET /health"):
+            pass
+        self.assertEqual(os.listdir(self.output_dir), [])
+
+        for i in range(3):
+            profiler.dump(f"request-{i}", 1.0, Samples({"main;f (x.py:1)": 1}))
+            time.sleep(0.002)
+        self.assertEqual(len(os.listdir(self.output_dir)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+import chromadb
+import numpy as np
+from datasets import Dataset
+
+from embedding.cache import CachedEmbedder
+from embedding.data_embedding import DataEmbedding
+from embedding.embedders import HashEmbedder
+from embedding.pipeline import IngestionPipeline
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+
+class TestIngestionPipeline(unittest.TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.client = chromadb.PersistentClient(path=self.store_dir)
+        self.collection = self.client.get_or_create_collection("pipeline")
+        self.embedder = HashEmbedder(dimension=32)
+        self.records = [(f"id_{i}", f"document number {i} about topic {i % 7}", {"i": i}) for i in range(250)]
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def test_writes_all_records(self):
+        """Test that every record is embedded by the workers and written once"""
+        written = []
+        pipeline = IngestionPipeline(
+            self.collection, self.embedder, workers=2, embed_batch_size=16, write_batch_size=100,
+            checkpoint=written.extend,
+        )
+        report = pipeline.run(iter(self.records))
+
+        self.assertEqual(self.collection.count(), 250)
+        self.assertEqual(sorted(chunk_id for chunk_id, _, _ in written), sorted(r[0] for r in self.records))
+        stored = self.collection.get(ids=["id_7"], include=["embeddings", "documents", "metadatas"])
+        np.testing.assert_allclose(stored["embeddings"][0], self.embedder.embed([self.records[7][1]])[0], rtol=1e-6)
+        self.assertEqual(stored["metadatas"][0], {"i": 7})
+
+        for stage in ("read", "embed", "write"):
+            self.assertEqual(report[stage]["items"], 250)
+        self.assertEqual(report["embed"]["workers"], 2)
+        self.assertGreater(report["items_per_second"], 0)
+
+    def test_cache_hits_skip_workers(self):
+        """Test that cached vectors are reused and only misses reach the pool"""
+        cached = CachedEmbedder(self.embedder, os.path.join(self.store_dir, "cache"))
+        cached.embed([document for _, document, _ in self.records[:100]])
+        pipeline = IngestionPipeline(self.collection, cached, workers=2, embed_batch_size=32)
+        report = pipeline.run(iter(self.records))
+        self.assertEqual(report["embed"]["items"], 150)
+        self.assertEqual(report["write"]["items"], 250)
+
+    def test_writer_errors_propagate(self):
+        """Test that a failing write stops the run with the writer's error"""
+        collection = mock.Mock()
+        collection.upsert.side_effect = RuntimeError("disk full")
+        pipeline = IngestionPipeline(collection, self.embedder, workers=1, embed_batch_size=10, write_batch_size=10)
+        with self.assertRaises(RuntimeError):
+            pipeline.run(iter(self.records))
+
+    def test_invalid_workers(self):
+        with self.assertRaises(ValueError):
+            IngestionPipeline(self.collection, self.embedder, workers=0)
+
+
+class TestParallelIngestion(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        self.embedding_dir = tempfile.mkdtemp()
+        turns = [f"Speaker {i}:\nLine {i} of the play, spoken by actor {i}." for i in range(40)]
+        Dataset.from_dict({"text": ["\n\n".join(turns)]}).save_to_disk(os.path.join(self.data_dir, 'text_corpus'))
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def make_embedder(self, embedding_dir=None):
+        return DataEmbedding(
+            backend="hash", use_cache=False, data_dir=self.data_dir, embedding_dir=embedding_dir or self.embedding_dir
+        )
+
+    def test_parallel_matches_sequential(self):
+        """Test that the process pool produces the same collection as in-process embedding"""
+        summary = self.make_embedder().embed_text_corpus(max_tokens=12, overlap=0, workers=2)
+        self.assertEqual(summary.added, 40)
+        self.assertEqual(summary.stages["write"]["items"], 40)
+        collection = self.make_embedder().client.get_collection("text_embeddings")
+        parallel = collection.get(include=["embeddings"])
+
+        sequential_dir = os.path.join(self.embedding_dir, "sequential")
+        sequential_embedder = self.make_embedder(sequential_dir)
+        sequential_embedder.embed_text_corpus(max_tokens=12, overlap=0, workers=0)
+        collection = sequential_embedder.client.get_collection("text_embeddings")
+        sequential = collection.get(ids=parallel["ids"], include=["embeddings"])
+        np.testing.assert_allclose(parallel["embeddings"], sequential["embeddings"], rtol=1e-6)
+
+    def test_resume_after_crash(self):
+        """Test that a rerun after a mid-run failure only embeds what was not written"""
+        data_embedder = self.make_embedder()
+        data_embedder.checkpoint_interval = 0
+        original = DataEmbedding._write_batch
+        calls = []
+
+        def crash_on_third(self, collection, batch):
+            calls.append(len(batch))
+            if len(calls) == 3:
+                raise RuntimeError("killed")
+            original(self, collection, batch)
+
+        with mock.patch.object(DataEmbedding, "_write_batch", crash_on_third):
+            with self.assertRaises(RuntimeError):
+                data_embedder.embed_text_corpus(max_tokens=12, overlap=0, batch_size=10)
+
+        summary = self.make_embedder().embed_text_corpus(max_tokens=12, overlap=0, batch_size=10)
+        self.assertEqual(summary.skipped, 20)
+        self.assertEqual(summary.added, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from embedding.data_embedding import DataEmbedding
+from embedding.quantized_index import QuantizedIndex, squared_l2
+from retrieval.retriever import Retriever
+
+
+def clustered_vectors(n=600, dimension=32, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dimension))
+    vectors = centers[rng.integers(0, 20, n)] + 0.2 * rng.normal(size=(n, dimension))
+    return vectors.astype(np.float32)
+
+
+class TestQuantizedIndex(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.vectors = clustered_vectors()
+        cls.ids = [f"doc_{i}" for i in range(len(cls.vectors))]
+        batches = [(cls.ids[i:i + 100], cls.vectors[i:i + 100]) for i in range(0, len(cls.ids), 100)]
+        cls.indexes = {
+            method: QuantizedIndex.build(os.path.join(cls.temp_dir, method), batches, method=method, model_name="m")
+            for method in ("int8", "pq")
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def test_codes_are_compressed_and_mapped(self):
+        self.assertEqual(self.indexes["int8"].codes.dtype, np.int8)
+        self.assertEqual(self.indexes["int8"].codes.shape, (600, 32))
+        self.assertEqual(self.indexes["pq"].codes.shape, (600, 8))
+        self.assertIsInstance(self.indexes["pq"].codes, np.memmap)
+        self.assertEqual(self.indexes["pq"].model_name, "m")
+
+    def test_rescored_search_returns_exact_distances(self):
+        """Test that re-scored hits carry exact squared L2 distances in ascending order"""
+        for method, index in self.indexes.items():
+            ids, distances = index.search(self.vectors[:3], k=5)
+            self.assertEqual([hits[0] for hits in ids], self.ids[:3], method)
+            row = self.ids.index(ids[1][2])
+            expected = squared_l2(self.vectors[1:2], self.vectors[row:row + 1])[0, 0]
+            self.assertAlmostEqual(distances[1][2], float(expected), places=3)
+            self.assertEqual(distances[0], sorted(distances[0]))
+
+    def test_recall_report(self):
+        """Test that re-scoring recovers the exact neighbours the codes alone miss"""
+        for method, index in self.indexes.items():
+            report = index.recall_report(k=10, sample=50)
+            recall = report["recall"]
+            self.assertGreaterEqual(recall["rescored"], recall["codes"], method)
+            self.assertGreater(recall["rescored"], 0.9, method)
+        self.assertEqual(self.indexes["int8"].recall_report(sample=10)["compression"], 4.0)
+        self.assertEqual(self.indexes["pq"].recall_report(sample=10)["compression"], 16.0)
+
+    def test_small_blocks(self):
+        """Test that block-wise scanning gives the same results as one block"""
+        index = QuantizedIndex(self.indexes["int8"].path, block_size=64)
+        self.assertEqual(index.search(self.vectors[:2], k=7)[0], self.indexes["int8"].search(self.vectors[:2], k=7)[0])
+        self.assertEqual(index.exact_search(self.vectors[:2], k=7), self.indexes["int8"].exact_search(self.vectors[:2], k=7))
+
+    def test_restricted_rows(self):
+        """Test searching only a subset of rows, as filtered queries do"""
+        index = self.indexes["int8"]
+        rows = np.array([400, 5, 17])
+        ids, distances = index.search(self.vectors[400], k=2, rows=rows)
+        self.assertEqual(ids[0][0], "doc_400")
+        self.assertEqual(len(ids[0]), 2)
+        self.assertTrue(set(ids[0]) <= {"doc_5", "doc_17", "doc_400"})
+        self.assertEqual(index.search(self.vectors[0], k=3, rows=np.array([], dtype=np.int64)), ([[]], [[]]))
+
+    def test_invalid_builds(self):
+        with self.assertRaises(ValueError):
+            QuantizedIndex.build(os.path.join(self.temp_dir, "bad"), [(["a"], np.zeros((1, 4)))], method="fp4")
+        with self.assertRaises(ValueError):
+            QuantizedIndex.build(os.path.join(self.temp_dir, "empty"), [], method="int8")
+
+
+class TestQuantizedSearchPath(unittest.TestCase):
+    def setUp(self):
+        self.embedding_dir = tempfile.mkdtemp()
+        self.data_embedder = DataEmbedding(backend="hash", embedding_dir=self.embedding_dir, vector_index="int8")
+        words = ["kings", "queens", "castles", "rivers", "ships", "storms", "forests", "bridges", "lanterns", "harbours"]
+        # "tag" holds strings and numbers, so the filter index leaves it to Chroma's metadata
+        self.records = [
+            (f"{first} and {second}", {"row": i, "tag": "even" if i % 2 == 0 else i})
+            for i, (first, second) in enumerate(zip(words * 2, words[3:] + words[:3] + words[7:] + words[:7]))
+        ]
+        self.data_embedder.ingest_records("lines", "line", self.records)
+        self.retriever = Retriever(self.embedding_dir, "lines", embedder=self.data_embedder.embedding_function, cache_results=False)
+
+    def tearDown(self):
+        self.retriever.close()
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def test_filtered_queries_never_load_hnsw(self):
+        """Test that unfiltered and filtered queries are answered from the codes without querying Chroma's HNSW"""
+        text = self.records[6][0]
+        with mock.patch.object(self.retriever.collection, "query", side_effect=AssertionError("HNSW was queried")):
+            found = self.retriever.search([text], k=3)[0]
+            indexed = self.retriever.search([text], k=3, filters={"row": {"$gte": 5}})[0]
+            unindexed = self.retriever.search([text], k=3, filters={"tag": "even"})[0]
+            excluded = self.retriever.search([text], k=3, filters={"row": {"$lt": 5}})[0]
+            empty = self.retriever.search([text], k=3, filters={"tag": "odd"})[0]
+        self.assertEqual(found[0]["document"], text)
+        self.assertEqual(indexed[0]["document"], text)
+        self.assertEqual(unindexed[0]["document"], text)
+        self.assertEqual(len(unindexed), 3)
+        self.assertTrue(all(hit["metadata"]["tag"] == "even" for hit in unindexed))
+        self.assertTrue(all(hit["metadata"]["row"] < 5 for hit in excluded))
+        self.assertEqual(empty, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
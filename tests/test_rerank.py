@@ -0,0 +1,77 @@
+import time
+import unittest
+
+import numpy as np
+
+from retrieval.rerank import OverlapScorer, PairScorer, Reranker, create_scorer
+
+HITS = [
+    {"id": "a", "document": "Speak, speak."},
+    {"id": "b", "document": "But, soft! what light through yonder window breaks?"},
+    {"id": "c", "document": "O Romeo, Romeo! wherefore art thou Romeo?"},
+]
+
+
+class SlowScorer(PairScorer):
+    model_name = "slow"
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.calls = []
+
+    def score(self, query, documents):
+        self.calls.append(len(documents))
+        time.sleep(self.seconds)
+        return np.arange(len(documents), dtype=np.float32)
+
+
+class TestReranker(unittest.TestCase):
+    def test_reorders_by_score(self):
+        reranker = Reranker(OverlapScorer())
+        hits, reranked = reranker.rerank("yonder window", HITS)
+        self.assertTrue(reranked)
+        self.assertEqual([hit["id"] for hit in hits], ["b", "a", "c"])
+        self.assertEqual(hits[0]["rerank_score"], 1.0)
+        self.assertNotIn("rerank_score", HITS[0])
+
+    def test_pair_scores_are_cached(self):
+        scorer = SlowScorer(0)
+        reranker = Reranker(scorer, batch_size=2)
+        reranker.rerank("q", HITS)
+        reranker.rerank("q", HITS)
+        self.assertEqual(scorer.calls, [2, 1])
+        self.assertEqual(reranker.stats["cache_hits"], 3)
+        self.assertEqual(reranker.stats["pairs_scored"], 3)
+
+    def test_budget_falls_back_to_original_order(self):
+        """Test that running out of budget stops scoring and keeps the retrieval order"""
+        scorer = SlowScorer(0.05)
+        reranker = Reranker(scorer, batch_size=1, budget_ms=20)
+        hits, reranked = reranker.rerank("q", HITS)
+        self.assertFalse(reranked)
+        self.assertIs(hits, HITS)
+        self.assertEqual(scorer.calls, [1])
+        self.assertEqual(reranker.stats["fallbacks"], 1)
+
+        # The scores computed before the deadline are reused by a retry
+        hits, reranked = reranker.rerank("q", HITS, budget_ms=1000)
+        self.assertTrue(reranked)
+        self.assertEqual(scorer.calls, [1, 1, 1])
+
+    def test_expired_deadline(self):
+        hits, reranked = Reranker(OverlapScorer()).rerank("q", HITS, deadline=time.perf_counter() - 1)
+        self.assertFalse(reranked)
+
+    def test_cache_size(self):
+        reranker = Reranker(OverlapScorer(), cache_size=2)
+        reranker.rerank("romeo", HITS)
+        self.assertEqual(reranker.snapshot()["cached_pairs"], 2)
+
+    def test_create_scorer(self):
+        self.assertIsInstance(create_scorer("overlap"), OverlapScorer)
+        with self.assertRaises(ValueError):
+            create_scorer("unknown")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import time
+import unittest
+
+import numpy as np
+
+from retrieval.result_cache import QueryResultCache
+
+
+def unit(*values):
+    vector = np.array(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+class TestQueryResultCache(unittest.TestCase):
+    def test_exact_tier(self):
+        """Test exact hits on normalized text, scoped by k and filters"""
+        cache = QueryResultCache()
+        cache.put("Romeo  Romeo", 3, unit(1, 0), ["hit"])
+        self.assertEqual(cache.get_exact("romeo romeo", 3), ["hit"])
+        self.assertIsNone(cache.get_exact("romeo romeo", 4))
+        self.assertIsNone(cache.get_exact("romeo romeo", 3, filters={"title": "x"}))
+        self.assertEqual(cache.stats["exact_hits"], 1)
+
+    def test_semantic_tier(self):
+        """Test that nearby query vectors reuse results and distant ones miss"""
+        cache = QueryResultCache(similarity_threshold=0.9)
+        cache.put("love", 5, unit(1, 0, 0), ["love hits"])
+        self.assertEqual(cache.get_semantic(unit(1, 0.1, 0), 5), ["love hits"])
+        self.assertIsNone(cache.get_semantic(unit(0, 1, 0), 5))
+        self.assertIsNone(cache.get_semantic(unit(1, 0.1, 0), 2))
+        self.assertEqual(cache.stats["semantic_hits"], 1)
+        self.assertEqual(cache.stats["misses"], 2)
+
+    def test_filters_are_part_of_the_scope(self):
+        cache = QueryResultCache()
+        cache.put("q", 5, unit(1, 0), ["a"], filters={"title": "A", "dataset": "squad"})
+        self.assertEqual(cache.get_exact("q", 5, filters={"dataset": "squad", "title": "A"}), ["a"])
+        self.assertEqual(cache.get_semantic(unit(1, 0), 5, filters={"dataset": "squad", "title": "A"}), ["a"])
+        self.assertIsNone(cache.get_semantic(unit(1, 0), 5))
+
+    def test_lru_eviction(self):
+        """Test that the least recently used entry is evicted"""
+        cache = QueryResultCache(max_entries=2)
+        cache.put("a", 1, unit(1, 0, 0), "A")
+        cache.put("b", 1, unit(0, 1, 0), "B")
+        cache.get_exact("a", 1)
+        cache.put("c", 1, unit(0, 0, 1), "C")
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get_exact("b", 1))
+        self.assertIsNone(cache.get_semantic(unit(0, 1, 0), 1))
+        self.assertEqual(cache.get_exact("a", 1), "A")
+        self.assertEqual(cache.stats["evictions"], 1)
+
+    def test_ttl(self):
+        """Test that expired entries are not served"""
+        cache = QueryResultCache(ttl_seconds=0.01)
+        cache.put("a", 1, unit(1, 0), "A")
+        time.sleep(0.02)
+        self.assertIsNone(cache.get_exact("a", 1))
+        self.assertIsNone(cache.get_semantic(unit(1, 0), 1))
+        self.assertEqual(len(cache), 0)
+
+    def test_invalidation_on_generation_change(self):
+        """Test that a change in the collection generation clears the cache"""
+        generation = [1]
+        cache = QueryResultCache(generation=lambda: generation[0], check_interval=0)
+        cache.put("a", 1, unit(1, 0), "A")
+        self.assertEqual(cache.get_exact("a", 1), "A")
+        generation[0] = 2
+        self.assertIsNone(cache.get_exact("a", 1))
+        self.assertEqual(cache.stats["invalidations"], 1)
+        self.assertEqual(cache.snapshot()["entries"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
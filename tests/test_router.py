@@ -0,0 +1,63 @@
+import shutil
+import logging
+import tempfile
+import unittest
+
+from embedding.data_embedding import DataEmbedding
+from retrieval.router import CollectionRouter, load_tenants, merge_hits
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+
+class TestCollectionRouter(unittest.TestCase):
+    def setUp(self):
+        self.embedding_dir = tempfile.mkdtemp()
+        data_embedder = DataEmbedding(backend="hash", embedding_dir=self.embedding_dir)
+        data_embedder.ingest_records("plays", "text", [("To be or not to be", {"source": "plays"})])
+        data_embedder.ingest_records("poems", "text", [("Shall I compare thee to a summer's day", {"source": "poems"})])
+        self.router = CollectionRouter(
+            self.embedding_dir,
+            default_collection="plays",
+            tenants={"reader": ["poems"]},
+            embedder=data_embedder.embedding_function,
+        )
+
+    def tearDown(self):
+        self.router.close()
+        shutil.rmtree(self.embedding_dir, ignore_errors=True)
+
+    def test_retrievers_share_resources(self):
+        """Test that every collection is served with the router's model, client, pool and reranker"""
+        plays, poems = self.router.get("plays"), self.router.get("poems")
+        self.assertIs(self.router.get(), plays)
+        for attribute in ("embedder", "client", "_executor", "reranker"):
+            self.assertIs(getattr(plays, attribute), getattr(poems, attribute))
+        self.assertEqual(self.router.collections(), ["plays", "poems"])
+        with self.assertRaises(KeyError):
+            self.router.get("sonnets")
+
+    def test_resolve(self):
+        self.assertEqual(self.router.resolve(), ["plays"])
+        self.assertEqual(self.router.resolve(collections=["poems", "plays", "poems"]), ["poems", "plays"])
+        self.assertEqual(self.router.resolve(tenant="reader"), ["poems"])
+        with self.assertRaises(PermissionError):
+            self.router.resolve("plays", tenant="reader")
+        with self.assertRaises(KeyError):
+            self.router.resolve(tenant="writer")
+
+    def test_merge_hits(self):
+        """Test that rankings merge by distance, or by fused score when present"""
+        merged = merge_hits({"a": [{"id": "1", "distance": 0.5}], "b": [{"id": "2", "distance": 0.1}, {"id": "3", "distance": 0.9}]}, 2)
+        self.assertEqual([(hit["collection"], hit["id"]) for hit in merged], [("b", "2"), ("a", "1")])
+        merged = merge_hits({"a": [{"id": "1", "distance": None, "score": 0.02}], "b": [{"id": "2", "distance": 0.1, "score": 0.01}]}, 5)
+        self.assertEqual([hit["id"] for hit in merged], ["1", "2"])
+
+    def test_load_tenants(self):
+        self.assertEqual(load_tenants(""), {})
+        self.assertEqual(load_tenants('{"t": ["plays"]}'), {"t": ["plays"]})
+        with self.assertRaises(ValueError):
+            load_tenants('{"t": []}')
+
+
+if __name__ == '__main__':
+    unittest.main()
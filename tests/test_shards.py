@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import shutil
+import socket
+import asyncio
+import logging
+import tempfile
+import threading
+import unittest
+from multiprocessing.connection import AuthenticationError, Client, Listener
+from unittest import mock
+
+from fastapi.testclient import TestClient
+
+from embedding.data_embedding import DataEmbedding
+from embedding.sharding import shard_of, shard_path
+from retrieval.retriever import Retriever
+from retrieval.shards import PartialHits, ShardError, ShardedRouter, format_address, merge_shard_hits, serve_shard, start_local_shards
+from tests.test_main import wait_until_ready
+import main
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+
+class SilentShard:
+    """A listener that accepts requests and never answers, like a shard stuck on a slow query"""
+
+    def __init__(self):
+        self.listener = Listener(("127.0.0.1", 0), authkey=os.environ["SHARD_AUTHKEY"].encode())
+        self.address = format_address(self.listener.address)
+        self.connections = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                self.connections.append(self.listener.accept())
+            except OSError:
+                return
+
+    def close(self):
+        self.listener.close()
+        for conn in self.connections:
+            conn.close()
+
+
+class TestShardedRetrieval(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Ingest the text corpus, partition it into two shards and start a worker process for each"""
+        cls.embedding_dir = tempfile.mkdtemp()
+        cls.env = mock.patch.dict(os.environ, {"EMBEDDING_BACKEND": "hash", "RERANK_BACKEND": "overlap"})
+        cls.env.start()
+        cls.data_embedder = DataEmbedding(backend="hash", embedding_dir=cls.embedding_dir)
+        cls.data_embedder.embed_text_corpus()
+        cls.shard_dirs = cls.data_embedder.shard_collection("text_embeddings", 2)
+        cls.workers = start_local_shards(cls.shard_dirs)
+        # The workers share a random key; routers built in the tests read it from SHARD_AUTHKEY
+        os.environ["SHARD_AUTHKEY"] = cls.workers[0].authkey.decode()
+        cls.addresses = [format_address(worker.address) for worker in cls.workers]
+        cls.retriever = Retriever(cls.embedding_dir, embedder=cls.data_embedder.embedding_function, cache_results=False)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.retriever.close()
+        for worker in cls.workers:
+            worker.stop()
+        cls.env.stop()
+        shutil.rmtree(cls.embedding_dir, ignore_errors=True)
+
+    def search(self, router, text, k=5, **options):
+        async def run():
+            try:
+                return await router.asearch(["text_embeddings"], text, k=k, **options)
+            finally:
+                await router.aclose()
+        return asyncio.run(run())
+
+    def test_partition_by_id_hash(self):
+        """Test that every chunk lands in exactly the shard its id hashes to"""
+        all_ids = set(self.data_embedder.client.get_collection("text_embeddings").get(include=[])['ids'])
+        seen = set()
+        for shard, path in enumerate(self.shard_dirs):
+            self.assertEqual(path, shard_path(self.embedding_dir, shard, 2))
+            ids = DataEmbedding(backend="hash", embedding_dir=path).client.get_collection("text_embeddings").get(include=[])['ids']
+            self.assertTrue(ids)
+            self.assertTrue(all(shard_of(chunk_id, 2) == shard for chunk_id in ids))
+            seen.update(ids)
+        self.assertEqual(seen, all_ids)
+
+    def test_scatter_gather_matches_unsharded_search(self):
+        """Test that merged per-shard top-k equals exact top-k over the whole collection"""
+        for text in ("sad stories of the death of kings", "what light through yonder window breaks"):
+            hits = self.search(ShardedRouter(self.addresses), text, k=6)
+            self.assertIsInstance(hits, PartialHits)
+            self.assertEqual(hits.failed, [])
+            expected = self.retriever.search([text], k=6)[0]
+            self.assertEqual([hit["id"] for hit in hits], [hit["id"] for hit in expected])
+            for hit, expected_hit in zip(hits, expected):
+                self.assertAlmostEqual(hit["distance"], expected_hit["distance"], places=4)
+
+        filtered = self.search(ShardedRouter(self.addresses), "kings", k=3, filters={"chunk": 0}, include_documents=False)
+        self.assertTrue(filtered)
+        self.assertTrue(all(set(hit) == {"id", "distance"} for hit in filtered))
+
+    def test_slow_and_dead_shards_are_left_out(self):
+        """Test that a shard past its timeout, unreachable or not accepting, only removes its own hits"""
+        silent = SilentShard()
+        dead = SilentShard()
+        dead.close()
+        try:
+            router = ShardedRouter([self.addresses[0], silent.address, dead.address], timeout_ms=300)
+            hits = self.search(router, "kings", k=5)
+            self.assertEqual(sorted(hits.failed), sorted([silent.address, dead.address]))
+            self.assertEqual(len(hits), 5)
+            self.assertTrue(all(shard_of(hit["id"], 2) == 0 for hit in hits))
+
+            with self.assertRaises(ShardError):
+                self.search(ShardedRouter([silent.address], timeout_ms=100), "kings")
+        finally:
+            silent.close()
+
+        # A listening socket that never accepts: the connection is queued but never authenticated
+        with socket.create_server(("127.0.0.1", 0)) as stuck:
+            stuck_address = format_address(stuck.getsockname())
+            started = time.monotonic()
+            hits = self.search(ShardedRouter([self.addresses[0], stuck_address], timeout_ms=300), "kings", k=5)
+            self.assertLess(time.monotonic() - started, 2)
+            self.assertEqual(hits.failed, [stuck_address])
+
+    def test_authentication(self):
+        """Test that workers get a random key, reject other keys and never listen exposed on the public key"""
+        self.assertNotEqual(self.workers[0].authkey, b"rag-shards")
+        self.assertTrue(all(worker.authkey == self.workers[0].authkey for worker in self.workers))
+        with self.assertRaises(AuthenticationError):
+            Client(self.workers[0].address, authkey=b"rag-shards")
+        with self.assertRaises(ShardError):
+            self.search(ShardedRouter(self.addresses, authkey=b"wrong"), "kings")
+        self.assertTrue(self.search(ShardedRouter(self.addresses), "kings"))
+
+        with mock.patch.dict(os.environ, {"SHARD_AUTHKEY": ""}):
+            with self.assertRaises(ValueError):
+                ShardedRouter(["10.0.0.7:7001"])
+            with self.assertRaises(ValueError):
+                serve_shard(self.shard_dirs[0], ("0.0.0.0", 0))
+            ShardedRouter(["10.0.0.7:7001"], authkey=b"secret").close()
+            ShardedRouter(["127.0.0.1:7001", "localhost:7002"]).close()
+
+    def test_merge_shard_hits(self):
+        rankings = [
+            [{"id": "a", "distance": 0.1}, {"id": "c", "distance": 0.5}],
+            [{"id": "b", "distance": 0.2}, {"id": "d", "distance": 0.6}],
+            [],
+        ]
+        self.assertEqual([hit["id"] for hit in merge_shard_hits(rankings, 3)], ["a", "b", "c"])
+        fused = [[{"id": "a", "score": 0.9}], [{"id": "b", "score": 1.2}, {"id": "c", "score": 0.1}]]
+        self.assertEqual([hit["id"] for hit in merge_shard_hits(fused, 5)], ["b", "a", "c"])
+
+    def test_api_over_shards(self):
+        """Test that /query, /documents and /stats run against shard workers when SHARDS is set"""
+        with mock.patch.dict(os.environ, {"SHARDS": ",".join(self.addresses), "EMBEDDING_DIR": tempfile.mkdtemp(dir=self.embedding_dir)}):
+            with TestClient(main.app) as client:
+                self.assertEqual(wait_until_ready(client).status_code, 200)
+                self.assertIsNone(main.app.state.retriever)
+                body = client.post("/query", json={"text": "sad stories of kings", "k": 4}).json()
+                self.assertEqual(body["shards"], {"total": 2, "failed": []})
+                self.assertEqual(len(body["results"]), 4)
+                expected = self.retriever.search(["sad stories of kings"], k=4)[0]
+                self.assertEqual([hit["id"] for hit in body["results"]], [hit["id"] for hit in expected])
+
+                reranked = client.post("/query", json={"text": "sad stories of kings", "k": 2, "rerank": True}).json()
+                self.assertEqual(len(reranked["results"]), 2)
+                hybrid = client.post("/query", json={"text": "kings", "k": 3, "lexical_weight": 1.0}).json()["results"]
+                self.assertEqual(len(hybrid), 3)
+                diversified = client.post("/query", json={"text": "sad stories of kings", "k": 3, "diversify": True}).json()
+                self.assertEqual(len(diversified["results"]), 3)
+                self.assertEqual(diversified["diversified"]["candidates"], 20)
+
+                ids = [hit["id"] for hit in body["results"]]
+                documents = client.post("/documents", json={"ids": ids}).json()["documents"]
+                self.assertEqual([doc["id"] for doc in documents], ids)
+                lines = client.post("/query", json={"text": "kings", "k": 3, "stream": "ndjson"}).text.splitlines()
+                self.assertTrue(all(json.loads(line)["document"] for line in lines[4:-1]))
+                self.assertEqual(len(lines), 8)
+
+                self.assertEqual(client.post("/query", json={"text": "x", "collection": "missing"}).status_code, 404)
+                stats = client.get("/stats").json()
+                self.assertEqual(set(stats["shards"]), set(self.addresses))
+                self.assertIn("text_embeddings", stats["shards"][self.addresses[0]]["collections"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from embedding.data_embedding import DataEmbedding
+from embedding.exact_index import ExactIndex, exact_index_path
+from embedding.filter_index import FilterIndex, filter_index_path
+from embedding.manifest import IngestionManifest, content_hash
+from embedding.snapshot import Snapshot
+from retrieval.retriever import Retriever
+
+logging.getLogger('chromadb').setLevel(logging.ERROR)
+
+
+class TestSnapshot(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.source_dir = os.path.join(cls.temp_dir, "source")
+        cls.source = DataEmbedding(backend="hash", embedding_dir=cls.source_dir)
+        cls.source.embed_qa_contexts()
+        cls.stored = cls.source.client.get_collection("squad_contexts").get(include=["documents", "metadatas", "embeddings"])
+        cls.snapshot_path = os.path.join(cls.temp_dir, "snapshot")
+        cls.snapshot = cls.source.export_snapshot("squad_contexts", cls.snapshot_path, batch_size=50)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.temp_dir, ignore_errors=True)
+
+    def setUp(self):
+        self.target_dir = tempfile.mkdtemp(dir=self.temp_dir)
+        self.target = DataEmbedding(backend="hash", embedding_dir=self.target_dir)
+
+    def test_export(self):
+        """Test that the snapshot holds every stored chunk in columnar files"""
+        self.assertEqual(len(self.snapshot), len(self.stored['ids']))
+        self.assertEqual(self.snapshot.model_name, "hash-embedder")
+        self.assertEqual(self.snapshot.collection_name, "squad_contexts")
+        ids, documents, metadatas, vectors = zip(*self.snapshot.iter_batches(batch_size=40))
+        self.assertEqual(sum(ids, []), self.stored['ids'])
+        self.assertEqual(sum(documents, []), self.stored['documents'])
+        self.assertEqual(sum(metadatas, []), self.stored['metadatas'])
+        np.testing.assert_array_equal(np.concatenate(vectors), np.asarray(self.stored['embeddings'], dtype=np.float32))
+
+    def test_import_without_embedding(self):
+        """Test that a collection is rebuilt from a snapshot with no embedding calls and serves the same results"""
+        with mock.patch.object(self.target.embedding_function, "embed", side_effect=AssertionError("embedded during import")):
+            summary = self.target.import_snapshot(self.snapshot_path, batch_size=32)
+        self.assertEqual(summary.added, len(self.stored['ids']))
+
+        collection = self.target.client.get_collection("squad_contexts")
+        copied = collection.get(ids=self.stored['ids'][:5], include=["documents", "metadatas", "embeddings"])
+        self.assertEqual(copied['documents'], self.stored['documents'][:5])
+        self.assertEqual(copied['metadatas'], self.stored['metadatas'][:5])
+        np.testing.assert_allclose(copied['embeddings'], self.stored['embeddings'][:5])
+        self.assertTrue(FilterIndex.exists(filter_index_path(self.target_dir, "squad_contexts")))
+        self.assertEqual(len(ExactIndex(exact_index_path(self.target_dir, "squad_contexts"))), summary.added)
+        self.assertEqual(IngestionManifest(self.target_dir).generation("squad_contexts"), 1)
+
+        source = Retriever(self.source_dir, "squad_contexts", embedder=self.source.embedding_function, cache_results=False)
+        target = Retriever(self.target_dir, "squad_contexts", embedder=self.target.embedding_function, cache_results=False)
+        try:
+            query = "Who ruled Normandy?"
+            self.assertEqual(target.search([query], k=5), source.search([query], k=5))
+        finally:
+            source.close()
+            target.close()
+
+        # The manifest was rebuilt from the snapshot, so re-ingesting the same data changes nothing
+        summary = self.target.embed_qa_contexts()
+        self.assertEqual((summary.added, summary.updated, summary.deleted), (0, 0, 0))
+
+    def test_float16_snapshot(self):
+        path = os.path.join(self.temp_dir, "half")
+        half = self.source.export_snapshot("squad_contexts", path, dtype="float16")
+        self.assertEqual(os.path.getsize(os.path.join(path, Snapshot.VECTORS)) * 2, os.path.getsize(os.path.join(self.snapshot_path, Snapshot.VECTORS)))
+        self.target.import_snapshot(path, collection_name="contexts_copy")
+        copied = self.target.client.get_collection("contexts_copy").get(ids=self.stored['ids'][:3], include=["embeddings"])
+        np.testing.assert_allclose(copied['embeddings'], self.stored['embeddings'][:3], atol=1e-3)
+        self.assertEqual(half.dtype, "float16")
+
+    def test_import_replaces_collection(self):
+        self.target.ingest_records("squad_contexts", "stale", [("An unrelated chunk", {"row": 0})])
+        self.target.import_snapshot(self.snapshot_path)
+        collection = self.target.client.get_collection("squad_contexts")
+        self.assertEqual(collection.count(), len(self.stored['ids']))
+        self.assertEqual(collection.get(ids=["stale_" + content_hash("An unrelated chunk")[:16]])['ids'], [])
+
+    def test_rejects_mismatched_or_damaged_snapshots(self):
+        other = DataEmbedding(backend="hash", embedding_dir=self.target_dir, model_name="other-hash")
+        with self.assertRaises(ValueError):
+            other.import_snapshot(self.snapshot_path)
+
+        damaged = os.path.join(self.temp_dir, "damaged")
+        shutil.copytree(self.snapshot_path, damaged)
+        with open(os.path.join(damaged, Snapshot.VECTORS), 'r+b') as f:
+            flipped = bytes(byte ^ 0xFF for byte in f.read(8))
+            f.seek(0)
+            f.write(flipped)
+        with self.assertRaises(ValueError):
+            self.target.import_snapshot(damaged)
+        with open(os.path.join(damaged, Snapshot.VECTORS), 'ab') as f:
+            f.write(b"\x00")
+        with self.assertRaises(ValueError):
+            Snapshot(damaged)
+        with self.assertRaises(ValueError):
+            self.source.export_snapshot("squad_contexts", damaged, dtype="int8")
+
+
+if __name__ == '__main__':
+    unittest.main()
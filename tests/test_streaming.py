@@ -0,0 +1,81 @@
+import json
+import asyncio
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from retrieval import streaming
+
+
+class TestStreaming(unittest.TestCase):
+    def test_dumps_with_and_without_orjson(self):
+        value = {"id": "a", "distance": 0.5, "metadata": {"title": "É"}}
+        self.assertEqual(json.loads(streaming.dumps(value)), value)
+        with mock.patch.object(streaming, "orjson", None):
+            self.assertEqual(streaming.dumps(value), '{"id":"a","distance":0.5,"metadata":{"title":"É"}}'.encode('utf-8'))
+
+    @unittest.skipUnless(streaming.orjson is not None, "orjson not installed")
+    def test_numpy_values(self):
+        self.assertEqual(streaming.dumps({"distance": np.float32(0.5)}), b'{"distance":0.5}')
+
+    def test_encode_event(self):
+        self.assertEqual(streaming.encode_event("hit", {"id": "a"}, "ndjson"), b'{"id":"a"}\n')
+        self.assertEqual(streaming.encode_event("hit", {"id": "a"}, "sse"), b'event: hit\ndata: {"id":"a"}\n\n')
+        with self.assertRaises(ValueError):
+            streaming.encode_event("hit", {}, "xml")
+
+    def test_documents_fetched_page_by_page(self):
+        """Test that documents follow the hits, fetched lazily one page per call"""
+        calls = []
+
+        async def fetch(ids):
+            calls.append(ids)
+            return {doc_id: {"document": doc_id.upper()} for doc_id in ids if doc_id != "c"}
+
+        async def collect():
+            hits = [{"id": doc_id, "distance": i} for i, doc_id in enumerate("abcde")]
+            hits[1]["document"] = "already here"
+            return [json.loads(line) async for line in streaming.stream_hits({}, hits, "ndjson", fetch, page_size=2)]
+
+        lines = asyncio.run(collect())
+        self.assertEqual(calls, [["a", "c"], ["d", "e"]])
+        self.assertEqual(lines[1], {"rank": 1, "id": "a", "distance": 0})
+        self.assertEqual(lines[2]["document"], "already here")
+        self.assertEqual(lines[6:-1], [
+            {"rank": 1, "id": "a", "document": "A"},
+            {"rank": 4, "id": "d", "document": "D"},
+            {"rank": 5, "id": "e", "document": "E"},
+        ])
+        self.assertEqual(lines[-1], {"count": 5})
+
+    def test_hits_sent_before_documents_load(self):
+        """Test that the header and every hit are sent while the first document fetch is still pending"""
+        async def run():
+            release = asyncio.Event()
+            fetched = []
+
+            async def fetch(ids):
+                await release.wait()
+                fetched.append(ids)
+                return {doc_id: {"document": doc_id} for doc_id in ids}
+
+            hits = [{"id": doc_id, "distance": 0.1} for doc_id in "ab"]
+            stream = streaming.stream_hits({"preprocessed_query": "q"}, hits, "sse", fetch)
+            early = [await stream.__anext__() for _ in range(3)]
+            pending = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.01)
+            self.assertFalse(pending.done())
+            self.assertEqual(fetched, [])
+            release.set()
+            rest = [await pending] + [record async for record in stream]
+            return early, rest, fetched
+
+        early, rest, fetched = asyncio.run(run())
+        self.assertEqual([record.split(b"\n")[0] for record in early], [b"event: query", b"event: hit", b"event: hit"])
+        self.assertEqual([record.split(b"\n")[0] for record in rest], [b"event: document", b"event: document", b"event: end"])
+        self.assertEqual(fetched, [["a", "b"]])
+
+
+if __name__ == '__main__':
+    unittest.main()